@@ -68,6 +68,7 @@ def only_one_global(store):
             return False
     return True
 
+@data_store.transaction()
 def admin_user_permission_change_v1(token, u_id, permission_id):
     
     '''
@@ -116,15 +117,16 @@ def admin_user_permission_change_v1(token, u_id, permission_id):
 
     for user in store['users']:
         if user['u_id'] == u_id:
+            data_store.mark('users', user)
             user['permission_id'] = permission_id
             
     
-    data_store.set(store)
     return {
 
     }
 
 
+@data_store.transaction()
 def admin_user_remove_v1(token, u_id):
 
     '''
@@ -169,8 +171,9 @@ def admin_user_remove_v1(token, u_id):
 
 
     # Change messages to 'Removed user'
-    for message in store['messages']:
-        if message['message_id'] != 0 and message['u_id'] == u_id:
+    indexes = data_store.get_indexes()
+    for message in indexes.sent(u_id):
+        if message['message_id'] != 0:
             # If message is a dm message
             if 'dm_id' in message:
                 dm = find_dm(message['dm_id'], store['dms'])
@@ -183,45 +186,43 @@ def admin_user_remove_v1(token, u_id):
 
     update_workspace_message(token_user, store)
     
-    # Change necessary info in channels
-    for channel in store['channels']:
+    # Change necessary info in the channels the user is a member of
+    for channel in indexes.joined('channels', u_id):
+        data_store.mark('channels', channel)
         # Remove from owners
-        for user in channel['owner_members']:
-            if user['u_id'] == u_id:
-                channel['owner_members'].remove(user)
+        if u_id in channel['owner_members']:
+            channel['owner_members'].remove(u_id)
         # Forced to leave from members
-        for user in channel['all_members']:
-            if user['u_id'] == u_id:
-                channel['all_members'].remove(user)
+        channel['all_members'].remove(u_id)
 
 
-    # Remove from dms
-    for dm in store['dms']:
+    # Remove from the dms the user is a member of
+    for dm in indexes.joined('dms', u_id):
+        data_store.mark('dms', dm)
         # If owner, leave
-        if dm['creator']['u_id'] == u_id:
-            dm['creator'] == {}
+        if dm['creator'] == u_id:
+            dm['creator'] = None
 
-        # Leave if member
-        for member in dm['members']:
-            if member['u_id'] == u_id:
-                dm['members'].remove(member)
+        # Leave as a member
+        dm['members'].remove(u_id)
 
     
     # Change user info, keeping the u_id and change name    
     for user in store['users']:
         if user['u_id'] == u_id:
+            data_store.mark('users', user)
             user['email'] = ''
             user['password'] = ''
             user['handle_str'] = ''
+            end_sessions(user['session_list'])
             user['session_list'] = []
             user['permission_id'] = 0
             user['name_first'] = 'Removed'
             user['name_last'] = 'user'
-            user['notifications'] = []
+            user['notifications'] = new_notifications()
             user['reset_code'] = -1
             user['profile_img_url'] = ''
 
-    data_store.set(store)
     return {
 
     }
@@ -7,6 +7,8 @@ auth.py implementation
     - auth_login_v1(email, password)
     - handle_in_use(handle, store)
     - auth_register_v1(email, password, name_first, name_last)
+    - auth_password_reset_request(email)
+    - save_reset_code(email)
 '''
 
 import re, random, smtplib, datetime, time
@@ -14,6 +16,7 @@ import re, random, smtplib, datetime, time
 from src.data_store import data_store
 from src.error import InputError, AccessError
 from src import config
+from src.time_series import new_time_series
 from .helpers import *
 
 def check_login(email, password, store):
@@ -43,6 +46,7 @@ def check_login(email, password, store):
     # Otherwise, details did not match, return None
     return None
 
+@data_store.transaction()
 def auth_login_v1(email, password):
 
     '''
@@ -70,13 +74,6 @@ def auth_login_v1(email, password):
     if logged_in_user is None:
         raise InputError(description="Email entered does not belong to a user")        
         
-    # Generate a new session id and append
-    session_id = generate_new_session_id()
-    logged_in_user['session_list'].append(session_id)
-    # Generate a token and store
-    generated_token = generate_jwt(logged_in_user['email'], session_id)
-    logged_in_user['token'] = generated_token
-    
     # Generate a hashed password using hash helper function and convert it to hex
     hashed_password = hash_password(password)
     
@@ -87,7 +84,14 @@ def auth_login_v1(email, password):
     if user is None:
         raise InputError("Please enter a valid email and password")
 
-    data_store.set(store)
+    # Generate a new session id and append, only once the password is checked
+    session_id = generate_new_session_id()
+    data_store.mark('users', logged_in_user)
+    logged_in_user['session_list'].append(session_id)
+    # Generate a token and store
+    generated_token = generate_jwt(logged_in_user['email'], session_id)
+    logged_in_user['token'] = generated_token
+
     # If a user exists with the email and password combination, return their
     # user_id and token
     return {
@@ -114,13 +118,10 @@ def handle_in_use(handle, store):
         Returns False on: user not found in storage
     '''
 
-    for user in store['users']:
-        # If the handle is taken by another user, return true
-        if user['handle_str'] == handle:
-            return True
-    # Otherwise, return false
-    return False
+    # If the handle is taken by another user, return true
+    return data_store.find('handles', handle) is not None
 
+@data_store.transaction()
 def auth_register_v1(email, password, name_first, name_last):
 
     '''
@@ -166,11 +167,10 @@ def auth_register_v1(email, password, name_first, name_last):
     if not re.fullmatch(regular_expression, email):
         raise InputError("Please enter a valid email address")
 
-    for users in store['users']:
-        # If existing users email is identical to the entered email, its a
-        # duplicate, so raise inputerror
-        if users['email'] == email:
-            raise InputError("Duplicate email")
+    # If existing users email is identical to the entered email, its a
+    # duplicate, so raise inputerror
+    if data_store.find('emails', email) is not None:
+        raise InputError("Duplicate email")
 
     # If the password was not entered or it contained less than 6 characters,
     # raise inputerror
@@ -198,34 +198,25 @@ def auth_register_v1(email, password, name_first, name_last):
     # If the handle length is over 20 characters, its truncated to 20
     if len(handle) > 20:
         handle = handle[0:20]
-    # If the handle is in use already
-    if handle_in_use(handle, store) == True:
-        counter = 0
-        # loop until there is a new handle
-        while handle_in_use((handle + str(counter)), store) == True:
-            counter += 1
-        # when false, make the final handle
-        handle = handle + str(counter)
+    # If the handle is in use already, add the next number from the handle's
+    # counter which makes it unique
+    handle = data_store.get_indexes().unique_handle(handle)
         
     # Generate timestamp
     time_stamp = datetime.datetime.now()
     time_stamp = int(time.mktime(time_stamp.timetuple()))
     
     # Create default user stats and workspace stats
-    user_stats = {'channels_joined': [{'num_channels_joined': 0, 
-                                       'time_stamp': time_stamp}],
-                  'dms_joined': [{'num_dms_joined': 0, 
-                                  'time_stamp': time_stamp}],
-                  'messages_sent': [{'num_messages_sent': 0, 
-                                     'time_stamp': time_stamp}],
+    user_stats = {'channels_joined': new_time_series('num_channels_joined', 0, time_stamp),
+                  'dms_joined': new_time_series('num_dms_joined', 0, time_stamp),
+                  'messages_sent': new_time_series('num_messages_sent', 0, time_stamp),
+                  'num_messages_sent': 0,
                   'involvement_rate': 0}
     
-    workspace_stats = {'channels_exist': [{'num_channels_exist': 0, 
-                                           'time_stamp': time_stamp}],
-                       'dms_exist': [{'num_dms_exist': 0, 
-                                      'time_stamp': time_stamp}],
-                       'messages_exist': [{'num_messages_exist': 0, 
-                                           'time_stamp': time_stamp}],
+    workspace_stats = {'channels_exist': new_time_series('num_channels_exist', 0, time_stamp),
+                       'dms_exist': new_time_series('num_dms_exist', 0, time_stamp),
+                       'messages_exist': new_time_series('num_messages_exist', 0, time_stamp),
+                       'num_messages_exist': 0,
                        'utilization_rate': 0}
 
     # Generate a hashed password using hash helper function and convert it to hex
@@ -250,7 +241,7 @@ def auth_register_v1(email, password, name_first, name_last):
                        'session_list': [session_id],
                        'permission_id': 2, 
                        'reset_code': -1, 
-                       'notifications': [], 
+                       'notifications': new_notifications(), 
                        'user_stats': user_stats,
                        'workspace_stats': workspace_stats,
                        'profile_img_url': config.url + "static/default.jpg"}
@@ -261,17 +252,18 @@ def auth_register_v1(email, password, name_first, name_last):
 
     # The valid information is appended
     store['users'].append(user_dictionary)  
+    data_store.mark('users', user_dictionary)
     
     if len(store['stats']) == 0:
         store['stats'] = workspace_stats
+        data_store.mark('stats')
 
-    data_store.set(store)
-    
     return {
         'token': generated_token,
         'auth_user_id': u_id
     }
 
+@data_store.transaction()
 def auth_logout(token):
     
     '''
@@ -297,12 +289,11 @@ def auth_logout(token):
         raise AccessError(description="Token entered is invalid")
         
     decoded_token = decode_jwt(token)
-    # Search through all users
-    for user in store['users']:
-        if decoded_token['session_id'] in user['session_list']:
-            user['session_list'].remove(decoded_token['session_id'])
+    # Remove the session from the user it belongs to
+    data_store.mark('users', registered_user)
+    registered_user['session_list'].remove(decoded_token['session_id'])
+    end_sessions([decoded_token['session_id']])
 
-    data_store.set(store)
     return {}
 
 def auth_password_reset_request(email):
@@ -323,22 +314,14 @@ def auth_password_reset_request(email):
         Returns {} on: valid email
     '''
     
-    store = data_store.get()
-    
-    # Find the user given the email address
-    found_user = search_user_email(email, store['users'])
+    # The reset code is saved before the email is sent, so the store is not
+    # held while waiting for the mail server
+    reset_code = save_reset_code(email)
     
     # If the user was not found, return
-    if found_user is None:
+    if reset_code is None:
         return {}
     
-    # Generate a random 6 digit interger
-    reset_code = random.randint(000000,999999)
-    
-    # Log user out of all current sessions and save the reset code
-    found_user['session_list'] = []
-    found_user['reset_code'] = reset_code
-    
     # Use smtp class and specify gmail and port number
     with smtplib.SMTP('smtp.gmail.com', 587) as smtp:
         
@@ -358,9 +341,33 @@ def auth_password_reset_request(email):
         # Send the message to the receiver
         smtp.sendmail("davidphilips0203@gmail.com", email, msg)
     
-    data_store.set(store)
     return {}
 
+# Logs the user with the given email out of all current sessions and saves a
+# new reset code for them. Returns the reset code, or None if no user has the
+# email
+@data_store.transaction()
+def save_reset_code(email):
+    
+    store = data_store.get()
+    
+    # Find the user given the email address
+    found_user = search_user_email(email, store['users'])
+    if found_user is None:
+        return None
+    
+    # Generate a random 6 digit interger
+    reset_code = random.randint(000000,999999)
+    
+    # Log user out of all current sessions and save the reset code
+    data_store.mark('users', found_user)
+    end_sessions(found_user['session_list'])
+    found_user['session_list'] = []
+    found_user['reset_code'] = reset_code
+    
+    return reset_code
+
+@data_store.transaction()
 def auth_password_reset(reset_code, new_password):
     
     '''
@@ -396,9 +403,9 @@ def auth_password_reset(reset_code, new_password):
     # Otherwise, code is valid
     else: # pragma: no cover
         # Generate a new hashed password using hash function and update it
+        data_store.mark('users', found_user)
         found_user['password'] = hash_password(new_password)
         # Set reset code to default again
         found_user['reset_code'] = -1
 
-        data_store.set(store)
         return {}
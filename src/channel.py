@@ -10,6 +10,7 @@ channel.py implementation
     - channel_invite_v1(auth_user_id, channel_id, u_id)
     - channel_details_v1(auth_user_id, channel_id)
     - channel_messages_v1(auth_user_id, channel_id, start)
+    - channel_messages_cursor(token, channel_id, cursor)
     - cant_access(channel_id, store)
     - global_owner(auth_user_id, store)
     - channel_join_v1(auth_user_id, channel_id)
@@ -23,7 +24,9 @@ from src.helpers import search_user_token, \
                         is_a_valid_uid, \
                         send_notification, \
                         update_user_stat_channel, \
-                        change_is_this_user_reacted
+                        view_messages, \
+                        member_details, \
+                        messages_page
 
 def search_channel_id(channel_id, store):
 
@@ -43,13 +46,8 @@ def search_channel_id(channel_id, store):
         Returns None on: channel id is not found
     '''
 
-    for channel in store['channels']:
-        # If matching channel_id is found, return channel_id
-        if channel['channel_id'] == channel_id:
-            return channel
-
     # If no channel has the given channel_id, return None
-    return None
+    return data_store.find('channels', channel_id)
 
 def is_a_member(channel, temp_id):
 
@@ -69,13 +67,7 @@ def is_a_member(channel, temp_id):
         Returns False on: user in channel is not found
     '''
 
-    for member in channel['all_members']:
-        # If a matching user is found, return True
-        if member['u_id'] == temp_id:
-            return True
-
-    # If no user has the auth_user_id, return False
-    return False
+    return data_store.get_indexes().is_member('channels', channel, temp_id)
 
 def is_channel_owner(channel, u_id):
     '''
@@ -93,10 +85,7 @@ def is_channel_owner(channel, u_id):
         Returns True on: user is found
         Returns False on: user is not found
     '''
-    for member in channel['owner_members']:
-        if member['u_id'] == u_id:
-            return True
-    return False
+    return data_store.get_indexes().is_owner('channels', channel, u_id)
 
 
 def add_user(u_id, channel_id, store):
@@ -118,24 +107,14 @@ def add_user(u_id, channel_id, store):
         N/A
     '''
 
-    for user in store['users']:
-        if user['u_id'] == u_id:
-            person = user
+    channel = data_store.find('channels', channel_id)
 
-    for channel in store['channels']:
-        if channel['channel_id'] == channel_id:
-            channel['all_members'].append(
-            {
-            'u_id': person['u_id'],
-            'email': person['email'],
-            'name_first': person['name_first'],
-            'name_last': person['name_last'],
-            'handle_str': person['handle_str'],
-            'profile_img_url': person['profile_img_url']
-            })
+    data_store.mark('channels', channel)
+    channel['all_members'].append(u_id)
     
     
 
+@data_store.transaction()
 def channel_invite_v1(token, channel_id, u_id):
 
     '''
@@ -203,11 +182,11 @@ def channel_invite_v1(token, channel_id, u_id):
     added_user = is_a_valid_uid(u_id, store)
     update_user_stat_channel(added_user, store)
     
-    data_store.set(store)
     return {
 
     }
 
+@data_store.read()
 def channel_details_v1(token, channel_id):
 
     '''
@@ -253,10 +232,11 @@ def channel_details_v1(token, channel_id):
     return {
         'name': channel['name'],
         'is_public': channel['is_public'],
-        'owner_members': channel['owner_members'],
-        'all_members': channel['all_members']
+        'owner_members': member_details(channel['owner_members']),
+        'all_members': member_details(channel['all_members'])
     }
 
+@data_store.read()
 def channel_messages_v1(token, channel_id, start):
 
     '''
@@ -310,52 +290,89 @@ def channel_messages_v1(token, channel_id, start):
     if is_a_member(channel, found_user['u_id']) is False:
         raise AccessError(description="You are not a member of this channel")
 
-    messages = channel['messages']
-    total_messages = len(messages)
+    # Removed messages are skipped, without reading them
+    messages = data_store.get_indexes().message_positions('channels', channel)
+    total_messages = messages.count()
 
     # If start is greater than the total number of messages
     if start > total_messages:
         raise InputError(description="Start is greater than the total number of messages")
 
-    # Create a list of messages to return
-    messages_list = []
+    # Load up to 50 messages, newest first, with is_this_user_reacted set for
+    # the user
+    messages_list = view_messages(messages.newest(start, 50), found_user)
 
-    # If there are less than 50 messages left to load
+    # If there were less than 50 messages left to load, return end as -1
     if start + 50 >= total_messages:
-        # Find number of messages left
-        messages_left = total_messages - start
-
-        # Append the remaining messages to message_list and update 
-        # is_this_user_reacted accordingly
-        for num in range(0, messages_left):
-            messages_list.append(messages[num])
-            change_is_this_user_reacted(messages_list, num, found_user)
-        # Reverse messages list so its in the right order    
-        messages_list.reverse()
-
-        # Return the list of messages, start, and return end as -1 as there
-        # were less than 50 messages left to load
         return {
             'messages': messages_list,
             'start': start,
             'end': -1
         }
 
-    # If 50 messages can be loaded append the messages onto message_list
-    index = 0
-    for num in range(start, start + 50):
-        messages_list.append(messages[total_messages - num - 1])
-        change_is_this_user_reacted(messages_list, index, found_user)
-        index += 1
     # Return the message_list, start and end
-    
-    data_store.set(store) 
     return {
         'messages': messages_list,
         'start': start,
         'end': start + 50
     }
 
+@data_store.read()
+def channel_messages_cursor(token, channel_id, cursor):
+
+    '''
+    Function Description:
+        Given a channel with channel_id that the authorised user is a member of,
+        return up to 50 messages, newest first, older than the messages of the
+        page cursor was returned with, or the newest messages if cursor is
+        empty. Messages sent while paging do not cause messages to be returned
+        twice or skipped.
+
+    Arguments:
+        token (string)              - User's token
+        channel_id (int)            - channel id number
+        cursor (string)             - "" or the next_cursor of the page before
+
+    Exceptions:
+        InputError      - Occurs when channel_id does not refer to a valid
+                        channel
+                        - Occurs when cursor is not a cursor of the channel
+
+        AccessError     - Occurs when token is invalid
+                        - Occurs when channel_id is valid and the authorised
+                        user is not a member of the channel
+
+    Return Value:
+        Returns {messages, next_cursor} on: valid token, channel_id and cursor,
+        where next_cursor is "" if the oldest message was returned
+    '''
+
+    store = data_store.get()
+
+    # Check if token is valid
+    found_user = search_user_token(token, store['users'])
+    if found_user is None:
+        raise AccessError(description='TOKEN INVALID')
+
+    # Find the channel given the channel id
+    channel = search_channel_id(channel_id, store)
+    if channel is None:
+        raise InputError(description="Please enter a valid channel id")
+
+    # If the user is not a member of the channel, raise accesserror
+    if is_a_member(channel, found_user['u_id']) is False:
+        raise AccessError(description="You are not a member of this channel")
+
+    page = messages_page('channels', channel, cursor, 50)
+    if page is None:
+        raise InputError(description="Please enter a valid cursor")
+    messages_list, next_cursor = page
+
+    return {
+        'messages': view_messages(messages_list, found_user),
+        'next_cursor': next_cursor
+    }
+
 # Helper function for join, checks if channel is public
 def cant_access(channel_id, store):
 
@@ -406,6 +423,7 @@ def global_owner(auth_user_id, store):
                 return True
     return False
 
+@data_store.transaction()
 def channel_join_v1(token, channel_id):
 
     '''
@@ -460,10 +478,10 @@ def channel_join_v1(token, channel_id):
     
     update_user_stat_channel(found_user, store)
 
-    data_store.set(store)
     return {
     }
 
+@data_store.transaction()
 def channel_addowner_v1(token, channel_id, u_id):
     
     '''
@@ -528,24 +546,13 @@ def channel_addowner_v1(token, channel_id, u_id):
     if is_channel_owner(channel, u_id,) is True:
         raise InputError(description="Already a channel owner")
 
-    for person in store['users']:
-        if person['u_id'] == u_id:
-            # Storing data in user
-            user = {'u_id': u_id,
-                    'email': person['email'], 
-                    'name_first': person['name_first'], 
-                    'name_last': person['name_last'], 
-                    'handle_str': person['handle_str'],
-                    'profile_img_url': person['profile_img_url']
-                    }
-                    
-    channel['owner_members'].append(user)
-
-    data_store.set(store)
+    data_store.mark('channels', channel)
+    channel['owner_members'].append(u_id)
 
     return {    
     }
 
+@data_store.transaction()
 def channel_removeowner_v1(token, channel_id, u_id):
     
     '''
@@ -606,20 +613,18 @@ def channel_removeowner_v1(token, channel_id, u_id):
         raise InputError(description="Not a member of channel")
 
     # Check if u_id is the only channel owner
-    for user in channel['owner_members']:
-        if user['u_id'] == u_id and len(channel['owner_members']) == 1:
-            raise InputError(description="Cannot remove user as they are the only owner of the channel")
+    if len(channel['owner_members']) == 1:
+        raise InputError(description="Cannot remove user as they are the only owner of the channel")
 
     # Remove the user as an owner
-    for owner in channel['owner_members']:
-        if owner['u_id'] == u_id:
-            channel['owner_members'].remove(owner)
+    data_store.mark('channels', channel)
+    channel['owner_members'].remove(u_id)
     
-    data_store.set(store)
     return {
     }
 
 # Function for the implementation of channel/leave
+@data_store.transaction()
 def channel_leave_v1(token, channel_id):
     
     '''
@@ -662,17 +667,12 @@ def channel_leave_v1(token, channel_id):
         raise AccessError(description="Not a member of channel")
 
     # Removing user from owner_members and members lists
-    for owner in channel['owner_members']:
-        if owner['u_id'] == token_uid:
-            channel['owner_members'].remove(owner)
-
-    for member in channel['all_members']:
-        if member['u_id'] == token_uid:
-            channel['all_members'].remove(member)
+    data_store.mark('channels', channel)
+    if token_uid in channel['owner_members']:
+        channel['owner_members'].remove(token_uid)
+    channel['all_members'].remove(token_uid)
     
     update_user_stat_channel(token_user, store)
     
-    data_store.set(store)
-
     return {
     }
@@ -14,6 +14,7 @@ from src.helpers import search_user_token, \
                         update_user_stat_channel, \
                         update_workspace_stat_channel
 
+@data_store.read()
 def channels_list_v1(token):
 
     '''
@@ -42,24 +43,19 @@ def channels_list_v1(token):
     # Create an empty list to return
     return_list = []
 
-    # Loop through the channels in data_store
-    for channel in store['channels']:
+    # Loop through the channels the user is a member of
+    for channel in data_store.get_indexes().joined('channels', found_user['u_id']):
 
-        # Loop through the members in each channel
-        for member in channel['all_members']:
-
-            # If the auth_user's id is found in all_members
-            if member['u_id'] == found_user['u_id']:
-
-                # Append the a dictionary that includes channel_id and name
-                # to the list of channels that the user is a member in
-                return_list.append({'channel_id':channel['channel_id'],
-                                    'name': channel['name']})
+        # Append the a dictionary that includes channel_id and name
+        # to the list of channels that the user is a member in
+        return_list.append({'channel_id':channel['channel_id'],
+                            'name': channel['name']})
 
     return {
         'channels': return_list
     }
 
+@data_store.read()
 def channels_listall_v1(token):
 
     '''
@@ -95,6 +91,7 @@ def channels_listall_v1(token):
     # List of all channels and associate info is returned
     return {"channels": return_all}
 
+@data_store.transaction()
 def channels_create_v1(token, name, is_public):
 
     '''
@@ -132,28 +129,17 @@ def channels_create_v1(token, name, is_public):
     # The channel id is created from the length of the elements in storage plus one
     channel_id = len(store['channels']) + 1
 
-    # Creating a dictionary for the user data to be added to the channel
-    for person in store['users']:
-        # If matching user is found set user as that individual and break
-        if person['u_id'] == found_user['u_id']:
-            user = {'u_id': found_user['u_id'],
-                    'email': person['email'],
-                    'name_first': person['name_first'],
-                    'name_last': person['name_last'],
-                    'handle_str': person['handle_str'],
-                    'profile_img_url': person['profile_img_url']}
-
-    # The valid information is appended to the list
-    store['channels'].append({'channel_id': channel_id, 'name': name,
-                              'is_public': is_public, 'owner_members': [user],
-                              'all_members': [user], 'messages': []})
+    # The valid information is appended to the list, members are stored by
+    # their u_id
+    channel = {'channel_id': channel_id, 'name': name,
+               'is_public': is_public, 'owner_members': [found_user['u_id']],
+               'all_members': [found_user['u_id']], 'messages': []}
+    store['channels'].append(channel)
+    data_store.mark('channels', channel)
     
     update_user_stat_channel(found_user, store)
     update_workspace_stat_channel(found_user, store)
 
-    # Set data to datastore
-    data_store.set(store)
-
     # Returning the channel_id of the created channel
     return {
         'channel_id': channel_id
@@ -1,3 +1,42 @@
 port = 6123
 
-url = f"http://localhost:{port}/"
\ No newline at end of file
+url = f"http://localhost:{port}/"
+
+# How the data store is persisted, either 'log' (write-ahead log plus periodic
+# snapshots, with messages read from the snapshot as they are used), 'sqlite'
+# (one database row per entity, with messages read from the database as they
+# are used), 'shards' (one file for the users, each channel, each dm and the
+# global values) or 'pickle' (rewrite the whole store on every change)
+persistence = 'log'
+
+# Number of batches in the log after which it is merged into the snapshot by
+# a background thread
+compact_every = 1000
+
+# Changes are written to the log in one batch at most flush_interval seconds
+# after they are made, or once flush_batch_size changes are waiting
+flush_interval = 0.1
+flush_batch_size = 100
+
+# Number of verified tokens cached, so repeated requests skip the signature check
+token_cache_size = 1024
+
+# Removed messages stay in their channel or dm, where they are skipped, until a
+# background thread takes them out every message_compact_interval seconds
+message_compact_interval = 5
+
+# Number of messages compacted away from each channel or dm which pages of
+# messages can still be read from before, older ones give an invalid cursor
+moved_messages_kept = 1000
+
+# Number of the newest points of each user and workspace statistic kept as they
+# were recorded, older ones are rolled up into per-minute, per-hour and per-day
+# buckets
+stats_raw_points = 100
+
+# Number of the newest notifications kept for each user
+notifications_kept = 20
+
+# Longest time in seconds a request to notifications/wait/v1 waits for a new
+# notification, and how long it waits if no timeout is given
+notifications_wait_timeout = 30
\ No newline at end of file
@@ -1,5 +1,13 @@
+import atexit
 import pickle
-import os
+from contextlib import contextmanager
+from src import config
+from src.indexes import Indexes
+from src.locks import ReadWriteLock
+from src.migrations import migrate
+from src.storage import ENTITY_KEYS, CONTAINERS, DELETED, Flusher, appended_since, \
+                        checkpoint_list, discard_messages, encode_entity, encode_records, \
+                        make_engine, message_container
 '''
 data_store.py
 
@@ -24,6 +32,34 @@ Example usage:
 
     print(store) # Prints { 'names': ['Emily', 'Hayden', 'Jake', 'Nick'] }
     data_store.set(store)
+
+When persisting, only the entities marked as changed are written. An entity
+is marked before it is changed, so the change can be rolled back. Channels
+and dms are written without their messages, which each record the channel or
+dm they were sent in:
+
+    data_store.mark('channels', channel)
+    channel['name'] = name
+    data_store.set(store)
+
+New entities are marked once they have been appended to their collection, and
+removed ones before they are taken out of it.
+
+API functions group their changes into a single commit, which is rolled back
+if they raise. Only one transaction runs at a time, while any number of
+functions which only read the store can run together:
+
+    @data_store.transaction()
+    def channel_rename(token, channel_id, name):
+        ...
+
+    @data_store.read()
+    def channel_name(token, channel_id):
+        ...
+
+Entities can be found by their id without searching the store:
+
+    channel = data_store.find('channels', channel_id)
 '''
 
 ## YOU SHOULD MODIFY THIS OBJECT BELOW
@@ -34,7 +70,8 @@ initial_object = {
     'dms': [], 
     'standups': [],
     'message_ids': 1,
-    'stats': ""
+    'stats': "",
+    'version': 0
 }
 
 ## YOU SHOULD MODIFY THIS OBJECT ABOVE
@@ -45,27 +82,281 @@ class Datastore:
         
         global initial_object
 
-        # If the file exists
-        if os.path.exists('data_store.p') is True:
-        
-            # Open the data and read
-            with open('data_store.p', 'rb') as FILE:
-                initial_object = pickle.load(FILE)
+        # Load the stored data, if there is any
+        self.__engine = make_engine(config.persistence, config.compact_every)
+        initial_object = self.__engine.load(initial_object)
                 
         self.__store = initial_object
+        self.__indexes = Indexes(self.__store)
+
+        # Entities which have changed since the last commit
+        self.__changes = {}
+
+        # What the store held when the transaction began, to roll it back.
+        # Maps (kind, key) to each entity marked, as it was before it was first
+        # marked, and each collection entities were removed from to a function
+        # putting them back. Holds the top level of the store and the length of
+        # each collection, as new entities are appended.
+        self.__before = {}
+        self.__checkpoints = {}
+        self.__removed = {}
+        self.__saved = {}
+        self.__lengths = {}
+
+        # Number of transactions entered, changes are committed when the
+        # outermost one exits
+        self.__depth = 0
+        self.__lock = ReadWriteLock()
+
+        # Changes are written by a background thread, unless the whole store
+        # is written straight away
+        self.__flusher = None
+        if config.persistence != 'pickle':
+            self.__flusher = Flusher(self.__engine, config.flush_interval,
+                                     config.flush_batch_size)
+
+        # Write anything still queued when the server stops
+        atexit.register(self.flush)
+
+        # A store saved by an older version is converted once, and saved whole
+        if migrate(self.__store):
+            for kind in initial_object:
+                self.mark(kind)
+            self.commit()
 
     def get(self):
         return self.__store
 
+    def mark(self, kind, entity=None):
+
+        '''
+        Records that an entity in store[kind] is changing so that the next
+        call to set only writes that entity. If no entity is given, the whole
+        collection (or global value such as 'stats') is written. Must be
+        called before the entity is changed.
+        '''
+
+        key = None if entity is None else entity[ENTITY_KEYS[kind]]
+        if self.__depth and (kind, key) not in self.__before:
+            self.__before[(kind, key)] = self.before_image(kind, entity)
+        self.__changes[(kind, key)] = entity
+
+        if entity is None:
+            self.__indexes.reset(kind)
+        else:
+            self.__indexes.update(kind, entity)
+
+    def mark_deleted(self, kind, entity):
+
+        '''
+        Records that an entity is being removed from store[kind]. Must be
+        called before it is taken out of the collection.
+        '''
+
+        if self.__depth:
+            if kind not in self.__checkpoints:
+                self.__checkpoints[kind] = checkpoint_list(self.__store[kind])
+            self.__removed.setdefault(kind, []).append(entity)
+        self.__changes[(kind, entity[ENTITY_KEYS[kind]])] = DELETED
+        self.__indexes.remove(kind, entity)
+
+    def before_image(self, kind, entity):
+
+        '''
+        Returns an entity, or a global value, as it is before being changed. A
+        channel or dm keeps its own list of messages, which are marked on
+        their own.
+        '''
+
+        if entity is None:
+            if kind in ENTITY_KEYS or self.__store.get(kind) is not self.__saved.get(kind):
+                # Replaced rather than changed, so the saved top level holds it
+                return None
+            return (None, pickle.dumps(self.__store[kind], pickle.HIGHEST_PROTOCOL), None)
+
+        data = pickle.dumps(encode_entity(kind, entity), pickle.HIGHEST_PROTOCOL)
+        return (entity, data, entity['messages'] if kind in CONTAINERS else None)
+
+    def get_indexes(self):
+        return self.__indexes
+
+    def find(self, index, key):
+
+        '''
+        Returns the entity with the given key in an index, such as
+        find('users', u_id), or None if there is no such entity
+        '''
+
+        return self.__indexes.find(index, key)
+
     def set(self, store):
         if not isinstance(store, dict):
             raise TypeError('store must be of type dictionary')
         
-        self.__store = store
-        
-        # Store the data
-        with open('data_store.p', 'wb') as FILE:
-            pickle.dump(store, FILE)
+        with self.__lock.write():
+            # A new store object replaces everything
+            if store is not self.__store:
+                self.__indexes = Indexes(store)
+                for kind in initial_object:
+                    self.mark(kind)
+
+            self.__store = store
+            if self.__depth == 0:
+                self.commit()
+
+    @contextmanager
+    def transaction(self):
+
+        '''
+        Groups every change made inside it into a single commit, made when the
+        outermost transaction exits. If an exception such as an InputError or
+        AccessError is raised, the changes are discarded instead. Holds the
+        lock for writing, and can also be used as a decorator.
+        '''
+
+        with self.__lock.write():
+            if self.__depth == 0:
+                self.begin()
+            self.__depth += 1
+            try:
+                yield self.__store
+            except Exception:
+                self.__depth -= 1
+                if self.__depth == 0:
+                    self.rollback()
+                raise
+
+            self.__depth -= 1
+            if self.__depth == 0:
+                self.commit()
+
+    @contextmanager
+    def read(self):
+
+        '''
+        Holds the lock for reading, so no transaction changes the store until
+        it exits. Can also be used as a decorator.
+        '''
+
+        with self.__lock.read():
+            yield self.__store
+
+    def begin(self):
+
+        '''
+        Saves the top level of the store and the length of each collection as
+        a transaction begins
+        '''
+
+        self.__saved = dict(self.__store)
+        self.__lengths = {kind: len(self.__store[kind]) for kind in ENTITY_KEYS}
+
+    def commit(self):
+
+        '''
+        Writes every entity marked since the last commit
+        '''
+
+        store = self.__store
+        self.__indexes.sync()
+        records = encode_records(store, self.__changes)
+        self.__changes = {}
+        self.forget()
+        if self.__flusher is None:
+            self.__engine.write(store, records)
+            return
+
+        self.__flusher.add(records)
+
+    def rollback(self):
+
+        '''
+        Discards the changes since the last commit, putting back the entities
+        marked as they were before they were first marked. The store and its
+        entities are changed back in place, as the running standups and
+        delayed messages hold references to them.
+        '''
+
+        store = self.__store
+        indexes = self.__indexes
+        reset = {kind for kind, key in self.__changes if key is None}
+
+        # Collections and global values which were replaced
+        replaced = set()
+        for kind, value in self.__saved.items():
+            if store.get(kind) is not value:
+                store[kind] = value
+                replaced.add(kind)
+        reset |= replaced
+
+        # Entities which were removed are put back, with those appended before
+        # they were removed
+        for kind, restore in self.__checkpoints.items():
+            restore(self.__removed.get(kind, []))
+            reset.add(kind)
+
+        # Entities appended since the transaction began, which are still at
+        # the end of their collection
+        appended = {kind: appended_since(store[kind], length)
+                    for kind, length in self.__lengths.items() if kind not in replaced}
+        new = {id(entity) for entities in appended.values() for entity in entities}
+
+        for (kind, key), before in self.__before.items():
+            if before is None:
+                continue
+            entity, data, messages = before
+            if entity is None:
+                store[kind] = pickle.loads(data)
+                continue
+            if id(entity) in new:
+                continue
+
+            indexes.remove(kind, entity)
+            entity.clear()
+            entity.update(pickle.loads(data))
+            if messages is not None:
+                entity['messages'] = messages
+            indexes.update(kind, entity)
+
+        # New entities are taken out of their collection, and new messages out
+        # of their channel or dm too, once the channels and dms hold their
+        # messages from before the transaction again
+        for kind, entities in appended.items():
+            for entity in entities:
+                indexes.remove(kind, entity)
+            if kind != 'messages':
+                del store[kind][self.__lengths[kind]:]
+            elif entities:
+                message_ids = {message['message_id'] for message in entities}
+                discard_messages(store['messages'], message_ids)
+                for message in entities:
+                    location = message_container(message)
+                    container = location and self.find(*location)
+                    if container is not None:
+                        discard_messages(container['messages'], message_ids)
+
+        for kind in reset:
+            indexes.reset(kind)
+        indexes.sync()
+
+        self.__changes = {}
+        self.forget()
+
+    def forget(self):
+        self.__before = {}
+        self.__checkpoints = {}
+        self.__removed = {}
+        self.__saved = {}
+        self.__lengths = {}
+
+    def flush(self):
+
+        '''
+        Writes every change queued for the background thread before returning
+        '''
+
+        if self.__flusher is not None:
+            self.__flusher.flush()
         
 print('Loading Datastore...')
 
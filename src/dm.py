@@ -9,6 +9,7 @@ dm.py implementation
             - dm_create(token, u_ids)
             - dm_list(token)
             - dm_messages(token, dm_id, start)
+            - dm_messages_cursor(token, dm_id, cursor)
             - dm_remove(token, dm_id)
             - dm_details(token, dm_id)
             - dm_leave(token, dm_id)
@@ -17,6 +18,8 @@ dm.py implementation
             - is_a_valid_uid
             - find_dm
             - is_a_member_dm
+            - member_details
+            - messages_page
 '''
 
 from src.data_store import data_store
@@ -28,10 +31,13 @@ from src.helpers import search_user_token, \
                         send_notification, \
                         update_user_stat_dm, \
                         update_workspace_stat_dm, \
-                        change_is_this_user_reacted, \
-                        update_workspace_stat_dm
+                        view_messages, \
+                        update_workspace_stat_dm, \
+                        member_details, \
+                        messages_page
 from .message import delete_dm_message
 
+@data_store.transaction()
 def dm_create(token, u_ids):
     '''
     Function Description:
@@ -68,15 +74,8 @@ def dm_create(token, u_ids):
     list_of_handles = []
     members = []
 
-    # Create a user dictionary for creator containing all necessary information
-    creator = {'u_id': owner_member['u_id'],
-               'email': owner_member['email'],
-               'name_first': owner_member['name_first'],
-               'name_last': owner_member['name_last'],
-               'handle_str': owner_member['handle_str'],
-               'profile_img_url': owner_member['profile_img_url']}
-    
-    # Append the creator to both all members and owner members
+    # Members are stored by their u_id, the creator first
+    creator = owner_member['u_id']
     members.append(creator)
 
     # Append the creators handle to the list
@@ -89,16 +88,8 @@ def dm_create(token, u_ids):
         found_user = is_a_valid_uid(u_id, store)
         list_of_handles.append(found_user['handle_str'])
         
-        # Create a user dictionary containing all necessary information
-        user = {'u_id': found_user['u_id'],
-                'email': found_user['email'],
-                'name_first': found_user['name_first'],
-                'name_last': found_user['name_last'],
-                'handle_str': found_user['handle_str'],
-                'profile_img_url': found_user['profile_img_url']}
-        
-        # Append the user info to all members
-        members.append(user)
+        # Append the user to all members
+        members.append(found_user['u_id'])
     
     # Sort the list of handles alphabetically and join them separated by comma
     # and a space
@@ -121,24 +112,21 @@ def dm_create(token, u_ids):
     
     # Append the dm
     store['dms'].append(dm)
+    data_store.mark('dms', dm)
 
     # Find the members whose info has to be updated for stats
-    members_to_be_updated = []
-    for user in store['users']:
-        for member in members:
-            if user['u_id'] == member['u_id']:
-                members_to_be_updated.append(user)
+    members_to_be_updated = [data_store.find('users', u_id) for u_id in members]
     
     # Update all members for stat            
     for member in members_to_be_updated:
         update_user_stat_dm(member, store)
     update_workspace_stat_dm(member, store)
     
-    data_store.set(store)
     return {
         'dm_id': dm_id
     }
 
+@data_store.read()
 def dm_list(token):
     '''
     Function Description:
@@ -166,20 +154,17 @@ def dm_list(token):
     # Create an empty list to return
     return_dms = []
     
-    # Loop through the dms
-    for dms in store['dms']:
-        # Loop through all members
-        for member in dms['members']:
-            # If the auth_user's id is found in all_members
-            if member['u_id'] == found_user['u_id']:
-                # Append the dm_id and name dict to list
-                return_dms.append({'dm_id': dms['dm_id'],
-                                   'name': dms['name']})
+    # Loop through the dms the user is a member of
+    for dms in data_store.get_indexes().joined('dms', found_user['u_id']):
+        # Append the dm_id and name dict to list
+        return_dms.append({'dm_id': dms['dm_id'],
+                           'name': dms['name']})
 
     return {
         'dms': return_dms
     }
     
+@data_store.read()
 def dm_messages(token, dm_id, start):
     '''
     Function Description:
@@ -220,55 +205,93 @@ def dm_messages(token, dm_id, start):
         raise InputError(description="Invalid dm_id")
     
     # If dm is found, but the member is not in the DM, raise accesserror
-    if is_a_member_dm(found_user['u_id'], found_dm['members']) is False:
+    if is_a_member_dm(found_user['u_id'], found_dm) is False:
         raise AccessError(description="User is not a member of the DM")
 
-    dm_messages = found_dm['messages']
-    # Get list of dms dictionaries and find the total number of dms
-    total_messages_in_dm = len(dm_messages)
+    # Find the dm messages which have not been removed and their total
+    dm_messages = data_store.get_indexes().message_positions('dms', found_dm)
+    total_messages_in_dm = dm_messages.count()
     
     # If start is greater than the total number of dms, raise inputerror
     if start > total_messages_in_dm:
         raise InputError(description="Start is greater than the total number of messages")
     
-    # Create a list of messages to return
-    messages_list = []
+    # Load up to 50 dm messages, newest first, with is_this_user_reacted set
+    # for the user
+    messages_list = view_messages(dm_messages.newest(start, 50), found_user)
     
-    # If there are less than 50 dm messages left to load
+    # If there were less than 50 dm messages left to load, return end as -1
     if start + 50 >= total_messages_in_dm:
-        
-        # Find number of dm messages left
-        messages_left = total_messages_in_dm - start
-
-        # Append the remaining messages to message_list
-        for num in range(0, messages_left):
-            messages_list.append(dm_messages[num])
-            change_is_this_user_reacted(messages_list, num, found_user)
-        # Reverse messages list so its in the right order    
-        messages_list.reverse()
-
-        # Return the list of messages, start, and return end as -1 as there
-        # were less than 50 messages left to load
         return {
             'messages': messages_list,
             'start': start,
             'end': -1
         }
-    
-    # Append the remaining messages to message_list
-    index = 0
-    for num in range(start, start + 50):
-        messages_list.append(dm_messages[total_messages_in_dm - num - 1])
-        change_is_this_user_reacted(messages_list, index, found_user)
-        index += 1
 
-    data_store.set(store)                    
     return {
         'messages': messages_list,
         'start': start,
         'end': start + 50
     }
 
+@data_store.read()
+def dm_messages_cursor(token, dm_id, cursor):
+    '''
+    Function Description:
+        return up to 50 messages of a dm, newest first, older than the messages
+        of the page cursor was returned with, or the newest messages if cursor
+        is empty. Messages sent while paging do not cause messages to be
+        returned twice or skipped.
+
+    Arguments:
+        token (str)             - authorisation hash
+        dm_id (int)             - id of the dm
+        cursor (str)            - "" or the next_cursor of the page before
+
+    Exceptions:
+        InputError              - When dm_id does not refer to any DM
+                                - When cursor is not a cursor of the dm
+
+        AccessError             - Occurs when Token is invalid
+                                - when dm_id is valid and the authorised user is 
+                                not a member of the DM
+
+    Return Value:
+        Returns {messages, next_cursor}, where next_cursor is "" if the oldest
+        message was returned
+    '''
+    
+    store = data_store.get()
+    
+    # Find the user given the token
+    found_user = search_user_token(token, store['users'])
+    
+    # If user is not found, raise accesserror
+    if found_user is None:
+        raise AccessError(description="INVALID TOKEN")
+    
+    # Find the dm given the dm_id
+    found_dm = find_dm(dm_id, store['dms'])
+    
+    # If dm is not found, raise inputerror 
+    if found_dm is None:
+        raise InputError(description="Invalid dm_id")
+    
+    # If dm is found, but the member is not in the DM, raise accesserror
+    if is_a_member_dm(found_user['u_id'], found_dm) is False:
+        raise AccessError(description="User is not a member of the DM")
+
+    page = messages_page('dms', found_dm, cursor, 50)
+    if page is None:
+        raise InputError(description="Invalid cursor")
+    messages_list, next_cursor = page
+
+    return {
+        'messages': view_messages(messages_list, found_user),
+        'next_cursor': next_cursor
+    }
+
+@data_store.transaction()
 def dm_remove(token, dm_id):
     '''
     Function Description:
@@ -306,36 +329,34 @@ def dm_remove(token, dm_id):
         raise InputError(description="Invalid dm_id")
     
     # If found dm creator or memebers is empty, its a removed dm, so raise inputerror
-    if found_dm['creator'] == {} and found_dm['members'] == []:
+    if found_dm['creator'] is None and found_dm['members'] == []:
         raise InputError(description="Invalid dm_id")
     
     # If dm is found, but the member is not a creator, raise accesserror
-    if found_user['u_id'] != found_dm['creator']['u_id'] :
+    if found_user['u_id'] != found_dm['creator']:
         raise AccessError(description="User is not the creator of the DM")
     
     # Find the members whose info has to be updated for stats
-    members_to_be_updated = []
-    for user in store['users']:
-        for member in found_dm['members']:
-            if user['u_id'] == member['u_id']:
-                members_to_be_updated.append(user)
+    members_to_be_updated = [data_store.find('users', u_id) for u_id in found_dm['members']]
     
     # Remove everything but keep dm_id
-    found_dm['creator'] = {}
+    data_store.mark('dms', found_dm)
+    found_dm['creator'] = None
     found_dm['members'] = []
     found_dm['name'] = ""
     
     for message in found_dm['messages']:
-        delete_dm_message(message['message_id'], store, found_dm)
+        if message['time_created'] != 0:
+            delete_dm_message(message['message_id'], store, found_dm)
     
     # Update required members info for stats    
     for member in members_to_be_updated:
         update_user_stat_dm(member, store)
     update_workspace_stat_dm(member, store)
     
-    data_store.set(store)
     return {}
 
+@data_store.read()
 def dm_details(token, dm_id):
     '''
     Function Description:
@@ -373,12 +394,13 @@ def dm_details(token, dm_id):
         raise InputError(description="Invalid dm_id")
     
     # If dm is found, but the member is not in the DM, raise accesserror
-    if is_a_member_dm(found_user['u_id'], found_dm['members']) is False:
+    if is_a_member_dm(found_user['u_id'], found_dm) is False:
         raise AccessError(description="User is not a member of the DM")
 
     return {'name': found_dm['name'],
-            'members': found_dm['members']}
+            'members': member_details(found_dm['members'])}
 
+@data_store.transaction()
 def dm_leave(token, dm_id):
     '''
     Function Description:
@@ -416,23 +438,19 @@ def dm_leave(token, dm_id):
         raise InputError(description='Invalid dm_id')
 
     # If dm is found, but the member is not in the DM, raise Access Error
-    if is_a_member_dm(found_user['u_id'], found_dm['members']) is False:
+    if is_a_member_dm(found_user['u_id'], found_dm) is False:
         raise AccessError(description='User is not a member of the DM')
     
     # Removing user from the dm
-    for member in found_dm['members']:
-        if member['u_id'] == found_user['u_id']:
-            found_dm['members'].remove(member)
+    data_store.mark('dms', found_dm)
+    found_dm['members'].remove(found_user['u_id'])
     
     # Removing an owner from the dm
-    owner = found_dm['creator']
-    if owner['u_id'] == found_user['u_id']:
-        found_dm['creator'] = {}
+    if found_dm['creator'] == found_user['u_id']:
+        found_dm['creator'] = None
     
     # Update the user for stats
     update_user_stat_dm(found_user, store)
     
-    data_store.set(store)
-
     return {}
     
\ No newline at end of file
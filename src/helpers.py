@@ -7,14 +7,33 @@ helpers.py implementation
     - generate_new_session_id()
     - generate_jwt(username, session_id=None)
     - decode_jwt(encoded_jwt)
+    - end_sessions(session_ids)
+    - encode_cursor(message_id)
+    - decode_cursor(cursor)
+    - messages_page(kind, container, cursor, size)
+    - new_notifications()
+    - add_message(message_dict, container, store)
 '''
 
 # Import necessary libraries and files
-import hashlib, uuid, jwt, datetime, time
+import base64, hashlib, uuid, jwt, datetime, time
+from src import config
 from src.data_store import data_store
+from src.token_cache import TokenCache
+from src.ring_buffer import RingBuffer
+from src.listeners import Listeners
 
 SECRET = 'reinforcerainstorm'
 
+# The react_ids a message can be reacted with
+REACT_IDS = (1,)
+
+# Tokens which have been verified, shared by every request
+token_cache = TokenCache(config.token_cache_size)
+
+# Requests waiting for a user to be sent a notification
+notification_listeners = Listeners()
+
 def hash_password(password):
     
     '''
@@ -70,8 +89,31 @@ def decode_jwt(encoded_jwt):
         Object: An object storing the body of the JWT encoded string
     '''
     
+    # Tokens which were verified before skip the signature check
+    try:
+        decoded_jwt = token_cache.get(encoded_jwt)
+    except TypeError:
+        decoded_jwt = None
+    if decoded_jwt is not None:
+        return decoded_jwt
+
     # returns the body of decoded jwt
-    return jwt.decode(encoded_jwt, SECRET, algorithms=['HS256'])
+    decoded_jwt = jwt.decode(encoded_jwt, SECRET, algorithms=['HS256'])
+    token_cache.add(encoded_jwt, decoded_jwt)
+    return decoded_jwt
+
+def end_sessions(session_ids):
+    
+    '''
+    Drops the cached tokens of sessions which have ended
+    Args:
+        session_ids ([list]): The session ids
+    Returns:
+        None
+    '''
+    
+    for session_id in session_ids:
+        token_cache.invalidate(session_id)
 
 def timestamp():
     
@@ -82,11 +124,7 @@ def timestamp():
 
 # Helper function that searches for the user with the given email
 def search_user_email(email, users):
-    for user in users:
-        # If a matching auth user id is found return user
-        if user["email"] == email:
-            return user
-    return None
+    return data_store.find('emails', email)
 
 # Helper function that searchs for the user with the given token
 def search_user_token(token, users):
@@ -94,13 +132,11 @@ def search_user_token(token, users):
     # Decode the token
     decoded_token = decode_jwt(token)
     
-    for user in users:
-        # If a matching auth user id is found return user
-        for session_id in user['session_list']:
-            if session_id == decoded_token['session_id']:
-                return user
-        # if decoded_token['session_id'] in user['session_list']:
-        #     return user
+    # The session must still be in the user's session list, in case it was
+    # changed without being marked
+    user = data_store.find('sessions', decoded_token['session_id'])
+    if user is not None and decoded_token['session_id'] in user['session_list']:
+        return user
     return None
 
 def search_user_reset_code(reset_code, users):
@@ -112,59 +148,39 @@ def search_user_reset_code(reset_code, users):
 
 # Checks if given channel is valid
 def is_channel_valid(channel_id, store):
-    for channel in store['channels']:
-        if channel['channel_id'] == channel_id:
-            return True
-    return False
+    return data_store.find('channels', channel_id) is not None
 
 # Gets channel dictionary from data_store
 def get_channel(channel_id, store):
-    for channel in store['channels']:
-        if channel['channel_id'] == channel_id:
-            return channel
-    return None
+    return data_store.find('channels', channel_id)
 
 # Checks if a given user is a member of a given channel
 def is_a_member(auth_user_id, channel):
-    for user in channel['all_members']:
-        if user['u_id'] == auth_user_id:
-            return True 
-    return False
+    return data_store.get_indexes().is_member('channels', channel, auth_user_id)
 
 # Checks if a given uid is valid, removed users are invalid
 def is_a_valid_uid(u_id, store):
-    for user in store['users']:
-        if user['u_id'] == u_id and user['email'] != "":
-            return user
+    user = data_store.find('users', u_id)
+    if user is not None and user['email'] != "":
+        return user
     return None
 
 # Checks if a given uid exists, this includes removed users
 def search_all_uids(u_id, store):
-    for user in store['users']:
-        if user['u_id'] == u_id:
-            return user
-    return None
+    return data_store.find('users', u_id)
 
 # Checks if dm_id refers to a valid dm, if it is valid, returns dm dictionary
 # if invalid, will return None
 def find_dm(dm_id, dms):
-    for dm in dms:
-        if dm['dm_id'] == dm_id:
-            return dm
-    return None
+    return data_store.find('dms', dm_id)
 
 # Checks if the given dm_id is valid
 def is_dm_valid(dm_id, store):
-    for dm in store['dms']:
-        if dm['dm_id'] == dm_id:
-            return True
-    return False
+    return data_store.find('dms', dm_id) is not None
 
-def is_a_member_dm(u_id, members):
-    for member in members:
-        if member['u_id'] == u_id:
-            return True
-    return False
+# Checks if a given user is a member of a given dm
+def is_a_member_dm(u_id, dm):
+    return data_store.get_indexes().is_member('dms', dm, u_id)
 
 # Helper function to filter users info
 def filter_user_info(user):
@@ -175,11 +191,15 @@ def filter_user_info(user):
             "handle_str": user["handle_str"],
             'profile_img_url': user["profile_img_url"]}
 
-# Adds a notification to a user's notification list  
+# Gives the details of the members of a channel or dm, which are stored by
+# their u_id, from each user's own data
+def member_details(u_ids):
+    return [filter_user_info(data_store.find('users', u_id)) for u_id in u_ids]
+
+# Adds a notification to a user's notifications, which keep the newest
+# config.notifications_kept
 def send_notification(channel_id, dm_id, notif_msg, u_id):
     
-    store = data_store.get()
-    
     # Create individual notification dict
     notif_dict = {  
                     'channel_id': channel_id,
@@ -187,90 +207,46 @@ def send_notification(channel_id, dm_id, notif_msg, u_id):
                     'notification_message': notif_msg
                 }
 
-    # Append the notif dict to user's notif list
-    for user in store['users']:
-        if user['u_id'] == u_id:
-            user['notifications'].append(notif_dict)
-    
-    data_store.set(store)
-    
-def add_to_list(lst, msg):
-    lst.append(msg)
-    data_store.set
+    # Append the notif dict to user's notifications
+    user = data_store.find('users', u_id)
+    if user is not None:
+        data_store.mark('users', user)
+        user['notifications'].append(notif_dict)
+
+        # Waiting requests read the notification once the change is committed
+        notification_listeners.notify(u_id)
+
+# Gives the notifications of a new user
+def new_notifications():
+    return RingBuffer(config.notifications_kept)
     
 def update_user_stat_channel(user, store):
     
     time_stamp = timestamp()
     
-    num_channels_joined = 0
-    
-    # Loop through all channels
-    for channels in store['channels']:
-        # In each channel, loop through the all_members list
-        for member in channels['all_members']:
-            # If the user is in the channel, iterate num_channels
-            if member['u_id'] == user['u_id']:
-                num_channels_joined += 1
-
-    user['user_stats']['channels_joined'].append(
-        {'num_channels_joined': num_channels_joined, 
-         'time_stamp': time_stamp})
+    num_channels_joined = data_store.get_indexes().num_joined('channels', user['u_id'])
 
-    data_store.set(store)
+    data_store.mark('users', user)
+    user['user_stats']['channels_joined'].add(num_channels_joined, time_stamp)
     
 def update_user_stat_dm(user, store):
     
     time_stamp = timestamp()
     
-    num_dms_joined = 0
-    
-    # Loop through all dms
-    for dm in store['dms']:
-        # In each channel, loop through the members list
-        for member in dm['members']:
-            # If the user is in the dm, iterate num_dms
-            if member['u_id'] == user['u_id']:
-                num_dms_joined += 1
+    num_dms_joined = data_store.get_indexes().num_joined('dms', user['u_id'])
 
-    user['user_stats']['dms_joined'].append(
-        {'num_dms_joined': num_dms_joined, 
-         'time_stamp': time_stamp})
-
-    data_store.set(store)
+    data_store.mark('users', user)
+    user['user_stats']['dms_joined'].add(num_dms_joined, time_stamp)
     
 def update_user_stat_message(user, store):
     
     time_stamp = timestamp()
     
-    num_messages_sent = 0
-    
-    # Loop through all messages
-    for message in store['messages']:
-        # If the user sent the message, iterate num_msg
-        if message['u_id'] == user['u_id']:
-            num_messages_sent += 1
-
-    user['user_stats']['messages_sent'].append(
-        {'num_messages_sent': num_messages_sent, 
-         'time_stamp': time_stamp})
+    # Removed messages still count as sent
+    num_messages_sent = user['user_stats']['num_messages_sent']
 
-    data_store.set(store)
-    
-def num_dm_removed(dms):
-        
-    counter = 0
-    for dm in dms:
-        if dm['name'] == "":
-            counter += 1
-    return counter
-    
-def num_msg_removed(msgs):
-    
-    counter = 0
-    for msg in msgs:
-        if msg['time_created'] == 0:
-            counter += 1
-    return counter
+    data_store.mark('users', user)
+    user['user_stats']['messages_sent'].add(num_messages_sent, time_stamp)
     
 def update_workspace_stat_channel(user, store):
     
@@ -278,45 +254,104 @@ def update_workspace_stat_channel(user, store):
     
     num_channels_exist = len(store['channels'])
 
-    store['stats']['channels_exist'].append({'num_channels_exist': num_channels_exist, 
-                                        'time_stamp': time_stamp})
-
-    data_store.set(store)
+    data_store.mark('stats')
+    store['stats']['channels_exist'].add(num_channels_exist, time_stamp)
     
 def update_workspace_stat_dm(user, store):
     
     time_stamp = timestamp()
     
-    # Find the number of removed dms and thus number of existing dm
-    num_removed_dm = num_dm_removed(store['dms'])
-    num_dms_exist = len(store['dms']) - num_removed_dm
-
-    store['stats']['dms_exist'].append({'num_dms_exist': num_dms_exist, 
-                                        'time_stamp': time_stamp})
+    # Removed dms stay in store['dms'] with an empty name
+    num_dms_exist = data_store.get_indexes().count('dms_exist')
 
-    data_store.set(store)
+    data_store.mark('stats')
+    store['stats']['dms_exist'].add(num_dms_exist, time_stamp)
     
 def update_workspace_message(user, store):
     
     time_stamp = timestamp()
     
-    # Find the number of removed msgs and thus number of existing msgs
-    num_removed_msg = num_msg_removed(store['messages'])
-    num_messages_exist = len(store['messages']) - num_removed_msg
-    
-    store['stats']['messages_exist'].append({'num_messages_exist': num_messages_exist, 
-                                        'time_stamp': time_stamp})
+    num_messages_exist = store['stats']['num_messages_exist']
+    
+    data_store.mark('stats')
+    store['stats']['messages_exist'].add(num_messages_exist, time_stamp)
+
+# Appends a new message to store['messages'] and the messages of the channel
+# or dm it was sent in, counting it as sent by its sender and as existing in the
+# workspace. Channels and dms are stored without their messages, so only the
+# message is marked
+def add_message(message_dict, container, store):
+
+    store['messages'].append(message_dict)
+    container['messages'].append(message_dict)
+    data_store.mark('messages', message_dict)
+
+    sender = data_store.find('users', message_dict['u_id'])
+    data_store.mark('users', sender)
+    sender['user_stats']['num_messages_sent'] += 1
+
+    data_store.mark('stats')
+    store['stats']['num_messages_exist'] += 1
+
+# Gives the reacts of a new message, which map each react_id to the u_ids who
+# reacted with it, kept as dict keys so they stay in the order they reacted
+def new_reacts():
+    return {react_id: {} for react_id in REACT_IDS}
+
+# Copies messages for a user to view, listing the users who reacted with each
+# react_id and whether the user is one of them, so reading messages never
+# changes the stored ones
+def view_messages(messages, user):
+    return [dict(message,
+                 reacts=[{'react_id': react_id,
+                          'u_ids': list(u_ids),
+                          'is_this_user_reacted': user['u_id'] in u_ids}
+                         for react_id, u_ids in sorted(message['reacts'].items())])
+            for message in messages]
+
+# Makes the opaque cursor of the page of messages older than message_id
+def encode_cursor(message_id):
+    return base64.urlsafe_b64encode(str(message_id).encode()).decode()
+
+# Gives the message_id a cursor was made from, or None if it is not a cursor
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        return None
+
+def messages_page(kind, container, cursor, size):
 
-    data_store.set(store)
+    '''
+    Finds a page of up to size messages of a channel or dm, newest first. The
+    page is found from the message_id in the cursor rather than a count from
+    the newest message, so messages sent since do not move it
+    Args:
+        kind ([string]): 'channels' or 'dms'
+        container ([dict]): The channel or dm
+        cursor ([string]): "" for the newest messages, otherwise the cursor
+                           returned with the page before
+        size ([number]): The most messages to return
+    Returns:
+        tuple: The messages and the cursor of the next page, which is "" once
+               the oldest message has been returned, or None if the cursor is
+               invalid
+    '''
 
-# Checks if auth_user has reacted to given message and changes 
-# is_this_user_reacted accordingly
-def change_is_this_user_reacted(messages_list, index, user):
+    positions = data_store.get_indexes().message_positions(kind, container)
 
-    # If user has reacted
-    if user['u_id'] in messages_list[index]['reacts'][0]['u_ids']:
-        messages_list[index]['reacts'][0]['is_this_user_reacted'] = True
-    
-    # Else they have not reacted
+    # One more message than the page is found, to tell if there is a next page
+    if cursor == "":
+        messages = positions.newest(0, size + 1)
     else:
-        messages_list[index]['reacts'][0]['is_this_user_reacted'] = False
+        message_id = decode_cursor(cursor)
+        if message_id is None:
+            return None
+        messages = positions.older(message_id, size + 1)
+        if messages is None:
+            return None
+
+    if len(messages) <= size:
+        return messages, ""
+    messages = messages[:size]
+    return messages, encode_cursor(messages[-1]['message_id'])
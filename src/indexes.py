@@ -0,0 +1,658 @@
+'''
+indexes.py implementation
+
+    Description:
+        Lookup tables derived from the data store. They are never persisted,
+        each one is built from the store the first time it is used and then
+        kept up to date as entities are marked as changed.
+
+    Classes:
+        - Index
+        - MessageIndex
+        - SentMessages
+        - Counts
+        - Memberships
+        - Involvement
+        - Positions
+        - MessageOrder
+        - Indexes
+'''
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from itertools import islice
+from src import config
+from src.storage import ENTITY_KEYS
+
+class Index(dict):
+
+    '''
+    Maps keys to the entities of one kind, where keys_of(entity) gives every
+    key an entity is found by. The keys each entity was added with are kept, so
+    they can be removed when it changes.
+    '''
+
+    def __init__(self, kind, keys_of, entities):
+        super().__init__()
+        self.kind = kind
+        self.keys_of = keys_of
+        self.entity_keys = {}
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity):
+        self.remove(entity)
+        entity_id = entity[ENTITY_KEYS[self.kind]]
+        keys = list(self.keys_of(entity))
+        for key in keys:
+            self[key] = entity
+        self.entity_keys[entity_id] = keys
+
+    def remove(self, entity):
+        entity_id = entity[ENTITY_KEYS[self.kind]]
+        for key in self.entity_keys.pop(entity_id, []):
+            # Another entity may have been added with the same key since
+            if dict.get(self, key) is not None and self[key][ENTITY_KEYS[self.kind]] == entity_id:
+                del self[key]
+
+class MessageIndex(Index):
+
+    '''
+    An Index of messages. While store['messages'] is still in the snapshot,
+    it is built from the messages read so far, and any other message is read
+    when it is first looked up, so building it does not read every message.
+    '''
+
+    def __init__(self, kind, keys_of, messages):
+        self.messages = messages if hasattr(messages, 'locate') else None
+        self.lock = threading.Lock()
+        if self.messages is not None:
+            messages = messages.read_so_far()
+        super().__init__(kind, keys_of, messages)
+
+    def get(self, key, default=None):
+        entity = dict.get(self, key)
+        if entity is None and self.messages is not None and isinstance(key, int):
+            message = self.messages.locate(key)
+            if message is not None:
+                with self.lock:
+                    self.add(message)
+            entity = dict.get(self, key)
+        return default if entity is None else entity
+
+class SentMessages(dict):
+
+    '''
+    Maps the u_id of each user to the messages they sent, by message_id.
+    While store['messages'] is still in the snapshot, it is built from the
+    messages read so far, and the messages a user sent are read when they are
+    first looked up.
+    '''
+
+    def __init__(self, messages):
+        super().__init__()
+        self.kind = 'messages'
+        self.messages = messages if hasattr(messages, 'sent_by') else None
+        self.lock = threading.Lock()
+
+        # Maps the message_id of each message to the u_id it was added under,
+        # and the u_ids whose messages have been read from the snapshot
+        self.entity_keys = {}
+        self.looked_up = set()
+
+        if self.messages is not None:
+            messages = messages.read_so_far()
+        for message in messages:
+            self.add(message)
+
+    def add(self, message):
+        self.remove(message)
+        self.setdefault(message['u_id'], {})[message['message_id']] = message
+        self.entity_keys[message['message_id']] = message['u_id']
+
+    def remove(self, message):
+        message_id = message['message_id']
+        if message_id in self.entity_keys:
+            u_id = self.entity_keys.pop(message_id)
+            del self[u_id][message_id]
+            if not self[u_id]:
+                del self[u_id]
+
+    def sent_by(self, u_id):
+        if self.messages is not None and u_id not in self.looked_up:
+            messages = self.messages.sent_by(u_id)
+            with self.lock:
+                for message in messages:
+                    self.add(message)
+                self.looked_up.add(u_id)
+        return sorted(self.get(u_id, {}).values(), key=lambda message: message['message_id'])
+
+class Counts(dict):
+
+    '''
+    Maps keys to the number of entities of one kind counted under them, where
+    keys_of(entity) gives every key an entity is counted under. The keys each
+    entity was counted under are kept, so marking it again only moves its
+    count to the keys it has now.
+    '''
+
+    def __init__(self, kind, keys_of, entities):
+        super().__init__()
+        self.kind = kind
+        self.keys_of = keys_of
+        self.entity_keys = {}
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity):
+        self.remove(entity)
+        entity_id = entity[ENTITY_KEYS[self.kind]]
+        keys = list(self.keys_of(entity))
+        for key in keys:
+            self[key] = self.get(key, 0) + 1
+        self.entity_keys[entity_id] = keys
+
+    def remove(self, entity):
+        entity_id = entity[ENTITY_KEYS[self.kind]]
+        for key in self.entity_keys.pop(entity_id, []):
+            self[key] -= 1
+            if self[key] == 0:
+                del self[key]
+
+# Gives the u_ids of the members and owners of a channel or dm
+MEMBER_LISTS = {'channels': lambda channel: (channel['all_members'], channel['owner_members']),
+                'dms': lambda dm: (dm['members'], [dm['creator']] if dm['creator'] is not None else [])}
+
+class Memberships(dict):
+
+    '''
+    Maps the id of each channel or dm to the channel or dm itself, the set of
+    u_ids of its members and the set of u_ids of its owners. Members join and
+    leave one at a time, so the sets are only built again when a channel or dm
+    is marked with a different number of members or owners than they hold,
+    and marking a channel for a new message costs nothing.
+
+    joined maps each u_id to the ids of the channels or dms they are a member
+    of, kept up to date from the members which were added or removed. Users
+    joining their first or leaving their last one are passed on to involved.
+    '''
+
+    def __init__(self, kind, entities):
+        super().__init__()
+        self.kind = kind
+        self.joined = {}
+        self.involved = None
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity):
+        entity_id = entity[ENTITY_KEYS[self.kind]]
+        members, owners = MEMBER_LISTS[self.kind](entity)
+        entry = self.get(entity_id)
+        if (entry is None or entry[0] is not entity or len(entry[1]) != len(members)
+                or len(entry[2]) != len(owners)):
+            member_ids = set(members)
+            old_ids = entry[1] if entry is not None else set()
+            self[entity_id] = (entity, member_ids, set(owners))
+            self.leave(entity_id, old_ids - member_ids)
+            for u_id in member_ids - old_ids:
+                if u_id not in self.joined:
+                    self.joined[u_id] = set()
+                    if self.involved is not None:
+                        self.involved.join(u_id)
+                self.joined[u_id].add(entity_id)
+
+    def remove(self, entity):
+        entity_id = entity[ENTITY_KEYS[self.kind]]
+        entry = self.pop(entity_id, None)
+        if entry is not None:
+            self.leave(entity_id, entry[1])
+
+    def leave(self, entity_id, u_ids):
+        for u_id in u_ids:
+            ids = self.joined.get(u_id)
+            if ids is not None:
+                ids.discard(entity_id)
+                if not ids:
+                    del self.joined[u_id]
+                    if self.involved is not None:
+                        self.involved.leave(u_id)
+
+class Involvement(dict):
+
+    '''
+    Maps the u_id of each user who is a member of any channel or dm to the
+    number of the given Memberships they have joined something in, so the
+    number of users who are in a channel or dm is its length. The Memberships
+    pass on each user joining their first or leaving their last channel or
+    dm.
+    '''
+
+    def __init__(self, memberships):
+        super().__init__()
+        self.kind = None
+        for table in memberships:
+            table.involved = self
+            for u_id in table.joined:
+                self.join(u_id)
+
+    def join(self, u_id):
+        self[u_id] = self.get(u_id, 0) + 1
+
+    def leave(self, u_id):
+        self[u_id] -= 1
+        if self[u_id] == 0:
+            del self[u_id]
+
+class Positions:
+
+    '''
+    Where each message of one channel or dm is in its message list, and the
+    positions of the removed messages still in the list, in order. Messages
+    are only appended to the list until the removed ones are compacted away,
+    which replaces the list, so the positions are extended as the list grows
+    and found again when it is replaced.
+
+    moved maps the message_id of each message compacted away to the newest
+    older message kept, or None if there is none, so a page can still be
+    read from before it. Only the config.moved_messages_kept most recently
+    compacted away are kept, oldest first.
+    '''
+
+    def __init__(self, messages, previous=None):
+        self.messages = messages
+        self.length = 0
+        self.positions = {}
+        self.removed = []
+        self.moved = {}
+        self.extend()
+        if previous is not None:
+            self.move_from(previous)
+
+    def extend(self):
+        for position in range(self.length, len(self.messages)):
+            message = self.messages[position]
+            self.positions[message['message_id']] = position
+            if message['time_created'] == 0:
+                self.removed.append(position)
+        self.length = len(self.messages)
+
+    def move_from(self, previous):
+        moved = {}
+        for position in previous.removed:
+            older = previous.walk(position - 1, 1)
+            moved[previous.messages[position]['message_id']] = (
+                older[0]['message_id'] if older else None)
+
+        # Messages compacted away before may have been moved to one which has
+        # now been compacted away too
+        for message_id, older in previous.moved.items():
+            if older is not None and older not in self.positions:
+                older = moved.get(older)
+            self.moved[message_id] = older
+        self.moved.update(moved)
+
+        dropped = max(0, len(self.moved) - config.moved_messages_kept)
+        for message_id in list(islice(self.moved, dropped)):
+            del self.moved[message_id]
+
+    def remove(self, message):
+        position = self.positions.get(message['message_id'])
+        if position is None or self.messages[position] is not message:
+            return
+        index = bisect_left(self.removed, position)
+        if index == len(self.removed) or self.removed[index] != position:
+            insort(self.removed, position)
+
+    # Takes back the removal of a message, when it was rolled back
+    def restore(self, message):
+        position = self.positions.get(message['message_id'])
+        if position is None or self.messages[position] is not message:
+            return
+        index = bisect_left(self.removed, position)
+        if index < len(self.removed) and self.removed[index] == position:
+            del self.removed[index]
+
+    def count(self):
+        return self.length - len(self.removed)
+
+    def newest(self, start, count):
+
+        '''
+        Returns up to count messages which have not been removed, newest
+        first, skipping the start newest ones
+        '''
+
+        # The position p of the message wanted has start + 1 messages which
+        # have not been removed from p to the end of the list. Starting from
+        # the end and moving back past the removed messages in between
+        # reaches the largest such p, which is never a removed message.
+        position = self.length - 1 - start
+        while True:
+            removed_after = len(self.removed) - bisect_left(self.removed, position)
+            candidate = self.length - 1 - start - removed_after
+            if candidate == position:
+                break
+            position = candidate
+        return self.walk(position, count)
+
+    def older(self, message_id, count):
+
+        '''
+        Returns up to count messages which have not been removed and are older
+        than the message with message_id, newest first, or None if the message
+        was never in the list
+        '''
+
+        position = self.positions.get(message_id)
+        if position is not None:
+            return self.walk(position - 1, count)
+
+        if message_id not in self.moved:
+            return None
+        older = self.moved[message_id]
+        if older is None:
+            return []
+        return self.walk(self.positions[older], count)
+
+    def walk(self, position, count):
+
+        '''
+        Returns up to count messages which have not been removed, from
+        position back to the oldest
+        '''
+
+        messages = []
+
+        # Index of the last removed position before or at position
+        index = bisect_right(self.removed, position) - 1
+        while position >= 0 and len(messages) < count:
+            if index >= 0 and self.removed[index] == position:
+                index -= 1
+            else:
+                messages.append(self.messages[position])
+            position -= 1
+        return messages
+
+class MessageOrder(dict):
+
+    '''
+    Maps the id of each channel or dm to the Positions of its messages, found
+    the first time they are read. Removed messages are marked as they are
+    removed, while messages appended since are found when the channel or dm
+    is next read.
+    '''
+
+    def __init__(self, container_kind):
+        super().__init__()
+        self.kind = 'messages'
+        self.container_kind = container_kind
+        self.lock = threading.Lock()
+
+    def positions(self, container):
+        messages = container['messages']
+        key = container[ENTITY_KEYS[self.container_kind]]
+
+        # Readers may find the positions of the same channel at once
+        with self.lock:
+            entry = self.get(key)
+            if entry is None or entry.messages is not messages or entry.length > len(messages):
+                entry = self[key] = Positions(messages, entry)
+            elif entry.length < len(messages):
+                entry.extend()
+        return entry
+
+    def add(self, message):
+        entry = self.get(message.get(ENTITY_KEYS[self.container_kind]))
+        if entry is not None:
+            with self.lock:
+                if message['time_created'] == 0:
+                    entry.remove(message)
+                else:
+                    entry.restore(message)
+
+    def remove(self, message):
+        pass
+
+# Helper which gives a factory for an index of one kind of entity, found by
+# every key keys_of(entity) gives
+def keyed(kind, keys_of):
+    return lambda store: Index(kind, keys_of, store[kind])
+
+# Helper which gives a factory for an index of messages, found by every key
+# keys_of(message) gives. Messages still in the snapshot are not read, apart
+# from those of keep_read(messages), which must be found by iterating it.
+def messages_keyed(keys_of, keep_read=lambda messages: []):
+    def build(store):
+        messages = store['messages']
+        index = MessageIndex('messages', keys_of, messages)
+        if index.messages is not None:
+            for message in keep_read(messages):
+                index.add(message)
+        return index
+    return build
+
+# Helper which gives a factory for counts of one kind of entity, under every
+# key keys_of(entity) gives
+def counted(kind, keys_of):
+    return lambda store: Counts(kind, keys_of, store[kind])
+
+# Maps the name of each index to the function building it from a store
+INDEXES = {'users': keyed('users', lambda user: [user['u_id']]),
+           'channels': keyed('channels', lambda channel: [channel['channel_id']]),
+           'dms': keyed('dms', lambda dm: [dm['dm_id']]),
+           'sessions': keyed('users', lambda user: user['session_list']),
+           'emails': keyed('users', lambda user: [user['email']] if user['email'] else []),
+           'handles': keyed('users', lambda user: [user['handle_str']] if user['handle_str'] else []),
+           'messages': messages_keyed(lambda message: [message['message_id']]),
+           'removed': messages_keyed(lambda message:
+                                     [message['message_id']] if message['time_created'] == 0 else [],
+                                     lambda messages: messages.removed_messages()),
+           'sent': lambda store: SentMessages(store['messages']),
+           'users_exist': counted('users', lambda user: [None] if user['permission_id'] != 0 else []),
+           'dms_exist': counted('dms', lambda dm: [None] if dm['name'] != "" else []),
+           'channel_order': lambda store: MessageOrder('channels'),
+           'dm_order': lambda store: MessageOrder('dms'),
+           'channel_members': lambda store: Memberships('channels', store['channels']),
+           'dm_members': lambda store: Memberships('dms', store['dms'])}
+
+# Maps each kind of container to the name of its membership index
+MEMBERSHIPS = {'channels': 'channel_members', 'dms': 'dm_members'}
+
+# Maps each kind of container to the name of the index of its message positions
+ORDERS = {'channels': 'channel_order', 'dms': 'dm_order'}
+
+class Indexes:
+
+    '''
+    The indexes of one store. Datastore.mark keeps every index which has been
+    built up to date, while replacing a whole collection drops the indexes
+    built from it so they are built again when next used. Entities are marked
+    before they are changed, so they are only added to the indexes again the
+    next time an index is used.
+    '''
+
+    def __init__(self, store):
+        self.store = store
+
+        # Maps the name of each index built so far to its table
+        self.tables = {}
+        self.lock = threading.Lock()
+
+        # Maps id(entity) to the kind and entity of every entity marked since
+        # the indexes were last used
+        self.pending = {}
+
+        # Maps each handle to the next number to try after it, which only grows
+        self.handle_suffixes = {}
+
+    def table(self, name):
+
+        '''
+        Returns the table of an index, building it if it has not been used
+        '''
+
+        self.sync()
+        table = self.tables.get(name)
+        if table is None:
+            # Readers may ask for the same index at once
+            with self.lock:
+                table = self.tables.get(name)
+                if table is None:
+                    table = INDEXES[name](self.store)
+                    self.tables[name] = table
+        return table
+
+    def find(self, name, key):
+        try:
+            return self.table(name).get(key)
+        except TypeError:
+            # Keys which cannot be hashed, such as lists, match nothing
+            return None
+
+    def count(self, name, key=None):
+
+        '''
+        Returns the number of entities counted under key by a Counts index,
+        where the totals of a collection are counted under None
+        '''
+
+        return self.table(name).get(key, 0)
+
+    def member_sets(self, kind, container):
+
+        '''
+        Returns the sets of member and owner u_ids of a channel or dm
+        '''
+
+        entry = self.table(MEMBERSHIPS[kind]).get(container[ENTITY_KEYS[kind]])
+        if entry is not None and entry[0] is container:
+            return entry[1], entry[2]
+
+        # A channel or dm which is no longer in the store is read as it is
+        members, owners = MEMBER_LISTS[kind](container)
+        return set(members), set(owners)
+
+    def is_member(self, kind, container, u_id):
+        return u_id in self.member_sets(kind, container)[0]
+
+    def is_owner(self, kind, container, u_id):
+        return u_id in self.member_sets(kind, container)[1]
+
+    def joined(self, kind, u_id):
+
+        '''
+        Returns the channels or dms a user is a member of, in the order they
+        were created
+        '''
+
+        table = self.table(MEMBERSHIPS[kind])
+        return [table[entity_id][0] for entity_id in sorted(table.joined.get(u_id, ()))]
+
+    def sent(self, u_id):
+
+        '''
+        Returns the messages a user sent, in the order they were sent
+        '''
+
+        return self.table('sent').sent_by(u_id)
+
+    def num_joined(self, kind, u_id):
+        return len(self.table(MEMBERSHIPS[kind]).joined.get(u_id, ()))
+
+    def num_involved(self):
+
+        '''
+        Returns the number of users who are a member of at least one channel
+        or dm
+        '''
+
+        self.sync()
+        table = self.tables.get('involved')
+        if table is None:
+            memberships = [self.table(name) for name in MEMBERSHIPS.values()]
+            with self.lock:
+                table = self.tables.get('involved')
+                if table is None:
+                    table = Involvement(memberships)
+                    self.tables['involved'] = table
+        return len(table)
+
+    def message_positions(self, kind, container):
+
+        '''
+        Returns the Positions of the messages of a channel or dm
+        '''
+
+        return self.table(ORDERS[kind]).positions(container)
+
+    def is_member_handle(self, kind, container, handle):
+
+        '''
+        Checks if the user with a handle is a member of a channel or dm
+        '''
+
+        user = self.find('handles', handle)
+        return user is not None and self.is_member(kind, container, user['u_id'])
+
+    def update(self, kind, entity):
+        self.pending[id(entity)] = (kind, entity)
+
+    def sync(self):
+
+        '''
+        Adds every entity marked since the indexes were last used to them
+        again, as they are now
+        '''
+
+        if not self.pending:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            for kind, entity in pending.values():
+                for table in list(self.tables.values()):
+                    if table.kind == kind:
+                        table.add(entity)
+
+    def remove(self, kind, entity):
+        self.sync()
+        for table in list(self.tables.values()):
+            if table.kind == kind:
+                table.remove(entity)
+
+    def reset(self, kind=None):
+
+        '''
+        Drops the indexes built from a kind of entity, or every index
+        '''
+
+        for name, table in list(self.tables.items()):
+            if kind is None or table.kind == kind:
+                del self.tables[name]
+
+        # Involvement is counted from the membership indexes, so it is built
+        # again with them
+        if kind in MEMBERSHIPS:
+            self.tables.pop('involved', None)
+        if kind in (None, 'users'):
+            self.handle_suffixes = {}
+
+    def unique_handle(self, handle):
+
+        '''
+        Returns handle if no user has it, otherwise handle followed by a
+        number which makes it unique. A counter is kept for each handle,
+        starting at 0 and moving past every number given out or found taken,
+        so registering many users with the same name does not check every
+        number each time. Numbers freed since are not given out again.
+        '''
+
+        handles = self.table('handles')
+        if handle not in handles:
+            return handle
+
+        counter = self.handle_suffixes.get(handle, 0)
+        while f'{handle}{counter}' in handles:
+            counter += 1
+        self.handle_suffixes[handle] = counter + 1
+        return f'{handle}{counter}'
@@ -0,0 +1,49 @@
+'''
+listeners.py implementation
+
+    Description:
+        Lets requests wait until a user is sent a notification, instead of
+        clients asking for their notifications over and over
+
+    Classes:
+        - Listeners
+'''
+
+import threading
+
+class Listeners:
+
+    '''
+    Maps each u_id to the Events of the threads waiting for the user to be
+    sent a notification. Notifying a user sets every Event waiting for them,
+    while threads waiting for other users are not woken.
+    '''
+
+    def __init__(self):
+        self.events = {}
+        self.lock = threading.Lock()
+
+    def listen(self, u_id):
+
+        '''
+        Returns an Event which is set when the user is next notified. It must
+        be passed to stop once the thread is done waiting.
+        '''
+
+        event = threading.Event()
+        with self.lock:
+            self.events.setdefault(u_id, set()).add(event)
+        return event
+
+    def stop(self, u_id, event):
+        with self.lock:
+            events = self.events.get(u_id)
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self.events[u_id]
+
+    def notify(self, u_id):
+        with self.lock:
+            for event in self.events.get(u_id, ()):
+                event.set()
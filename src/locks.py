@@ -0,0 +1,103 @@
+'''
+locks.py implementation
+
+    Description:
+        Locking used to share the data store between the Flask request threads
+        and the timer threads of standups and delayed messages
+
+    Classes:
+        - ReadWriteLock
+'''
+
+import threading
+from contextlib import contextmanager
+
+class ReadWriteLock:
+
+    '''
+    Lets any number of threads read at once, while a writer has the lock to
+    itself. Writers which are waiting are let in before new readers, so a
+    steady stream of reads cannot starve them.
+
+    A thread may take the lock again while it holds it, and the writer may
+    also read. A reader must not try to write, as it would wait for itself.
+    '''
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.readers = 0
+        self.waiting_writers = 0
+
+        # The thread writing, and how many times it has taken the lock
+        self.writer = None
+        self.writes = 0
+
+        # How many times the current thread has taken the lock for reading
+        self.local = threading.local()
+
+    def acquire_read(self):
+        with self.condition:
+            me = threading.get_ident()
+            if self.writer == me:
+                self.writes += 1
+                return
+
+            reads = getattr(self.local, 'reads', 0)
+            if reads == 0:
+                self.condition.wait_for(lambda: self.writer is None
+                                        and not self.waiting_writers)
+                self.readers += 1
+            self.local.reads = reads + 1
+
+    def release_read(self):
+        with self.condition:
+            if self.writer == threading.get_ident():
+                self.release_write_locked()
+                return
+
+            self.local.reads -= 1
+            if self.local.reads == 0:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    def acquire_write(self):
+        with self.condition:
+            me = threading.get_ident()
+            if self.writer == me:
+                self.writes += 1
+                return
+            if getattr(self.local, 'reads', 0):
+                raise RuntimeError('cannot write while holding the lock for reading')
+
+            self.waiting_writers += 1
+            self.condition.wait_for(lambda: self.writer is None and not self.readers)
+            self.waiting_writers -= 1
+            self.writer = me
+            self.writes = 1
+
+    def release_write(self):
+        with self.condition:
+            self.release_write_locked()
+
+    def release_write_locked(self):
+        self.writes -= 1
+        if self.writes == 0:
+            self.writer = None
+            self.condition.notify_all()
+
+    @contextmanager
+    def read(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def write(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
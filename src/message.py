@@ -33,11 +33,17 @@ message.py implementation
             - edit_dm_message(message_id, store, dm)
             - edit_channel_message(message_id, store, channel)
             - already_reacted(message_reacts, react_id, u_id)
-            - react_to_message(stored_message_dict, react_id, u_id)
+            - react_to_message(stored_message_dict, react_id, u_id, handle, name)
+            - unreact_to_message(stored_message, react_id, u_id)
+            - send_later_channel_message(message_dict, user, channel, store)
+            - send_later_dm_message(message_dict, user, dm, store)
+            - compact_removed_messages()
+            - start_message_compactor(interval)
 '''
 
 from .channel import is_channel_owner
 from .data_store import data_store
+from .storage import discard_messages
 from .error import InputError, AccessError
 from .helpers import *
 import datetime, time, threading, re
@@ -107,25 +113,15 @@ def get_tagged_users(message):
 
 # Checks if a tagged user is a valid member of a channel
 def is_tagged_user_valid_channel(handle, channel):
-
-    for user in channel['all_members']:
-        if user['handle_str'] == handle:
-            return True
-    return False
+    return data_store.get_indexes().is_member_handle('channels', channel, handle)
 
 # Checks if a tagged user is a valid member of a dm
 def is_tagged_user_valid_dm(handle, dm):
-
-    for user in dm['members']:
-        if user['handle_str'] == handle:
-            return True
-    return False
+    return data_store.get_indexes().is_member_handle('dms', dm, handle)
 
 # Given a user's handle, returns their user dict
 def get_user_given_handle(handle, store):
-    for user in store['users']:
-        if user['handle_str'] == handle:
-            return user
+    return data_store.find('handles', handle)
 
 # Returns a new unique message_id
 def get_new_message_id(store):
@@ -134,10 +130,12 @@ def get_new_message_id(store):
     new_message_id = store['message_ids']
 
     # Increase message_id counter for the next message
+    data_store.mark('message_ids')
     store['message_ids'] += 1
     
     return new_message_id
 
+@data_store.transaction()
 def message_send(token, channel_id, message):
     
     '''
@@ -196,34 +194,27 @@ def message_send(token, channel_id, message):
     # Get the current time
     t = datetime.datetime.now()
 
-    # Make react dict
-    react_dict = {  'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False}
-
     # Create a message dictionary where time created is a unix timestamp
     message_dict = {'message_id': message_id,
                     'u_id': user['u_id'],
                     'message': message,
                     'time_created': int(time.mktime(t.timetuple())),
-                    'reacts': [react_dict],
+                    'reacts': new_reacts(),
                     'is_pinned': False,
                     'channel_id': channel['channel_id']}
 
     # Append message dictionary to channel messages and also all messages
-    store['messages'].append(message_dict)
-    channel['messages'].append(message_dict)
+    add_message(message_dict, channel, store)
     
     # Update user and workspace message given user
     update_user_stat_message(user, store)
     update_workspace_message(user, store)
     
-    data_store.set(store)
-    
     return {
         'message_id': message_id
     }
 
+@data_store.transaction()
 def message_senddm(token, dm_id, message):
 
     '''
@@ -261,7 +252,7 @@ def message_senddm(token, dm_id, message):
         raise InputError(description='Invalid dm_id')
 
     # Check if user is a member of the dm
-    if is_a_member_dm(user['u_id'], dm['members']) is False:
+    if is_a_member_dm(user['u_id'], dm) is False:
         raise AccessError(description='You are not a member of this dm')
 
     message_length = len(message)
@@ -280,30 +271,22 @@ def message_senddm(token, dm_id, message):
     # Get the current time
     t = datetime.datetime.now()
 
-    # Make react dict
-    react_dict = {  'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False}
-
     # Create a message_dict where time created is a unix timestamp
     message_dict = {'message_id': message_id,
                     'u_id': user['u_id'],
                     'message': message,
                     'time_created': int(time.mktime(t.timetuple())),
-                    'reacts': [react_dict],
+                    'reacts': new_reacts(),
                     'is_pinned': False,
                     'dm_id': dm['dm_id']}
 
     # Append message dictionary to channel messages and also all messages
-    store['messages'].append(message_dict)
-    dm['messages'].append(message_dict)
+    add_message(message_dict, dm, store)
     
     # Update stat and workspace message given user
     update_user_stat_message(user, store)
     update_workspace_message(user, store)
     
-    data_store.set(store)
-
     return {
         'message_id': message_id
     }
@@ -312,16 +295,16 @@ def message_senddm(token, dm_id, message):
 # doesn't return None
 def get_message(message_id, all_messages):
     
-    for message in all_messages:
-        if message['message_id'] == message_id and message['time_created'] != 0:
-            return message
+    message = data_store.find('messages', message_id)
+    if message is not None and message['time_created'] != 0:
+        return message
     return None
 
 # Checks whether a given user has permission to edit a dm message
 def can_edit_dm_message(sender, user, dm):
     
     # If they were the sender or the dm creator, they can edit the dm message
-    if sender == user or dm['creator']['u_id'] == user:
+    if sender == user or dm['creator'] == user:
         return True
 
     # Else the user does not have permission to edit the dm message
@@ -330,10 +313,7 @@ def can_edit_dm_message(sender, user, dm):
 
 # Checks if a user is an owner of a given channel
 def is_a_channel_owner(u_id, channel):
-    for user in channel['owner_members']:
-        if user['u_id'] == u_id:
-            return True
-    return False
+    return data_store.get_indexes().is_owner('channels', channel, u_id)
 
 # Checks whether a given user has permission to edit a channel message
 def can_edit_channel_message(sender, user, channel):
@@ -355,37 +335,30 @@ def can_edit_channel_message(sender, user, channel):
     else:
         return False
 
-# Changes message in message_store and deletes message from dm['messages']
+# Removes a dm message by changing its time_created to 0. It stays in
+# dm['messages'], where it is skipped, until compact_removed_messages runs
 def delete_dm_message(message_id, store, dm):
     
-    # Change time_created of message in store['messages'] to 0 and remove other keys
-    index = 0
-    for message_dict in store['messages']:
-        if message_dict['message_id'] == message_id:
-            store['messages'][index]['time_created'] = 0
-        index += 1
-
-    # Find the message in dm['messages'] and delete it
-    for dm_message in dm['messages']:
-        if dm_message['time_created'] == 0:
-            dm['messages'].remove(dm_message)
-
-# Changes message in store['messages'] and deletes message from channel['messages']
+    message_dict = data_store.find('messages', message_id)
+    data_store.mark('messages', message_dict)
+    message_dict['time_created'] = 0
+
+    data_store.mark('stats')
+    store['stats']['num_messages_exist'] -= 1
+
+# Removes a channel message by changing its time_created to 0. It stays in
+# channel['messages'], where it is skipped, until compact_removed_messages runs
 def delete_channel_message(message_id, store, channel):
     
-    # Changes time_created in store['messages'] to 0 and remove other keys
-    index = 0
-    for message_dict in store['messages']:
-        if message_dict['message_id'] == message_id:
-            store['messages'][index]['time_created'] = 0
-        index += 1
-
-    # Deletes message from channel['messages']
-    for message in channel['messages']:
-        if message['time_created'] == 0:
-            channel['messages'].remove(message)
+    message_dict = data_store.find('messages', message_id)
+    data_store.mark('messages', message_dict)
+    message_dict['time_created'] = 0
+
+    data_store.mark('stats')
+    store['stats']['num_messages_exist'] -= 1
     
 # Removes a message from the channel or dm it was sent in
+@data_store.transaction()
 def message_remove(token, message_id):
 
     '''
@@ -430,7 +403,7 @@ def message_remove(token, message_id):
         dm = find_dm(message['dm_id'], store['dms'])
 
         # Check that the user is a member
-        if is_a_member_dm(user['u_id'], dm['members']) is False:
+        if is_a_member_dm(user['u_id'], dm) is False:
             raise InputError(description='You are not a member in the dm that this message was sent in')
 
         # If they were the user who sent the message or the dm creator
@@ -466,8 +439,6 @@ def message_remove(token, message_id):
     update_user_stat_message(user, store)
     update_workspace_message(user, store)
     
-    data_store.set(store)
-
     return {    
 
     }
@@ -475,15 +446,11 @@ def message_remove(token, message_id):
 # Helpers for message_edit
 def edit_dm_message(message_id, message, store, dm):
     
-    # Edit the message in store['messages']
-    for message_dict in store['messages']:
-        if message_dict['message_id'] == message_id:
-            message_dict['message'] = message
-
-    # Edit the message in dm['messages']
-    for dm_message in dm['messages']:
-        if dm_message['message_id'] == message_id:
-            dm_message['message'] = message
+    # Edit the message, which is the same dict in store['messages'] and
+    # dm['messages']
+    message_dict = data_store.find('messages', message_id)
+    data_store.mark('messages', message_dict)
+    message_dict['message'] = message
 
     sender = is_a_valid_uid(message_dict['u_id'], store)
 
@@ -493,15 +460,11 @@ def edit_dm_message(message_id, message, store, dm):
 
 def edit_channel_message(message_id, message, store, channel):
     
-    # Edit the message in store['messages']
-    for message_dict in store['messages']:
-        if message_dict['message_id'] == message_id:
-            message_dict['message'] = message
-
-    # Edit the message in channel['messages']
-    for channel_message in channel['messages']:
-        if channel_message['message_id'] == message_id:
-            channel_message['message'] == message
+    # Edit the message, which is the same dict in store['messages'] and
+    # channel['messages']
+    message_dict = data_store.find('messages', message_id)
+    data_store.mark('messages', message_dict)
+    message_dict['message'] = message
 
     # Get sender's dict
     sender = is_a_valid_uid(message_dict['u_id'], store)
@@ -510,6 +473,7 @@ def edit_channel_message(message_id, message, store, channel):
     # valid members
     tag_users_channel_msg(message, sender, channel, store)
 
+@data_store.transaction()
 def message_edit(token, message_id, message):
     
     '''
@@ -560,7 +524,7 @@ def message_edit(token, message_id, message):
         dm = find_dm(message_dict['dm_id'], store['dms'])
 
         # Check that the user is a member of the dm
-        if is_a_member_dm(user['u_id'], dm['members']) is False:
+        if is_a_member_dm(user['u_id'], dm) is False:
             raise InputError(description='You are not a member in the dm that this message was sent in')
 
         # If they have edit permissions (if they were the sender or they are 
@@ -612,8 +576,6 @@ def message_edit(token, message_id, message):
         else:
             raise AccessError(description='You do not have permission to edit this channel message')
     
-    data_store.set(store)
-
     return {
 
     }
@@ -621,20 +583,15 @@ def message_edit(token, message_id, message):
 # Checks if a given user has already reacted to a message with a certain react 
 # id
 def already_reacted(message_reacts, react_id, u_id):
-
-    if u_id in message_reacts[0]['u_ids']:
-        return True
-    return False
+    return u_id in message_reacts[react_id]
 
 
 # React to a message
-def react_to_message(stored_message_dict, u_id, handle, name):
+def react_to_message(stored_message_dict, react_id, u_id, handle, name):
 
-    # Append u_id to u_ids list in react dict
-    stored_message_dict['reacts'][0]['u_ids'].append(u_id)
-
-    # Change is_this_user_reacted to True
-    stored_message_dict['reacts'][0]['is_this_user_reacted'] = True
+    # Add u_id to the users who reacted with react_id
+    data_store.mark('messages', stored_message_dict)
+    stored_message_dict['reacts'][react_id][u_id] = True
 
     # Send a notification to message sender 
     notif_message = f"{handle} reacted to your message in {name}"
@@ -653,6 +610,7 @@ def react_to_message(stored_message_dict, u_id, handle, name):
 
 # Given a valid message id in a channel or dm the auth_user is a member of,
 # reacts to the message
+@data_store.transaction()
 def message_react(token, message_id, react_id):
 
     '''    
@@ -692,7 +650,7 @@ def message_react(token, message_id, react_id):
         raise InputError(description='This message_id does not exist')
 
     # If the react id is invalid:
-    if react_id != 1:
+    if react_id not in REACT_IDS:
         raise InputError(description='This react id is invalid')
 
     # Check if auth user has already reacted to this message with the same react
@@ -705,7 +663,7 @@ def message_react(token, message_id, react_id):
         dm = find_dm(message['dm_id'], store['dms'])
 
         # Check if the auth_user is a member of the dm
-        if is_a_member_dm(user['u_id'], dm['members']) is False:
+        if is_a_member_dm(user['u_id'], dm) is False:
             raise InputError(description='You are not a member in the dm that this message was sent in')
         
         name = dm['name'] 
@@ -721,38 +679,20 @@ def message_react(token, message_id, react_id):
 
         name = channel['name']
 
-    react_to_message(message, user['u_id'], user['handle_str'], name)
-
-    data_store.set(store)
+    react_to_message(message, react_id, user['u_id'], user['handle_str'], name)
 
     return {
 
     }
 
-# Allows a user to unreact to a dm message they have reacted to
-def unreact_to_dm_message(stored_message, u_id):
-    
-    # Removes authorised user's id from react u_ids list
-    for user_id in stored_message['reacts'][0]['u_ids']:
-        if user_id == u_id:
-            stored_message['reacts'][0]['u_ids'].remove(user_id)
-
-    # If the authorised user was the sender
-    if stored_message['u_id'] == u_id:
-        stored_message['reacts'][0]['is_this_user_reacted'] = False
-
-# Allows a user to unreact to a channel message they have reacted to
-def unreact_to_channel_message(stored_message, u_id):
+# Allows a user to unreact to a message they have reacted to
+def unreact_to_message(stored_message, react_id, u_id):
     
-    # Removes authorised user's id from react u_ids list
-    for user_id in stored_message['reacts'][0]['u_ids']:
-        if user_id == u_id:
-            stored_message['reacts'][0]['u_ids'].remove(user_id)
-
-    # If the authorised user was the sender
-    if stored_message['u_id'] == u_id:
-        stored_message['reacts'][0]['is_this_user_reacted'] = False
+    # Removes authorised user's id from the users who reacted with react_id
+    data_store.mark('messages', stored_message)
+    stored_message['reacts'][react_id].pop(u_id, None)
 
+@data_store.transaction()
 def message_unreact(token, message_id, react_id):
     '''    
     Given a message within a channel or DM the authorised user is part of, 
@@ -792,7 +732,7 @@ def message_unreact(token, message_id, react_id):
         raise InputError(description='This message_id does not exist')
 
     # If the react id is invalid:
-    if react_id != 1:
+    if react_id not in REACT_IDS:
         raise InputError(description='This react id is invalid')
 
     # If the user has not reacted to the message with the react yet
@@ -805,10 +745,10 @@ def message_unreact(token, message_id, react_id):
         dm = find_dm(message['dm_id'], store['dms'])
 
         # Check if the auth_user is a member of the dm
-        if is_a_member_dm(user['u_id'], dm['members']) is False:
+        if is_a_member_dm(user['u_id'], dm) is False:
             raise InputError(description='You are not a member in the dm that this message was sent in')
 
-        unreact_to_dm_message(message, user['u_id'])
+        unreact_to_message(message, react_id, user['u_id'])
 
     # Else the message is a channel message
     else:
@@ -819,13 +759,14 @@ def message_unreact(token, message_id, react_id):
         if is_a_member(user['u_id'], channel) is False:
             raise InputError(description='You are not a member in the channel that this message was sent in')
         
-        # React to channel message
-        unreact_to_channel_message(message, user['u_id'])
+        # Unreact to channel message
+        unreact_to_message(message, react_id, user['u_id'])
 
     return {
 
     }
     
+@data_store.transaction()
 def message_pin(token, message_id):
     '''
     Given a message within a channel or DM, mark it as "pinned"
@@ -868,11 +809,11 @@ def message_pin(token, message_id):
         dm = find_dm(message_dict['dm_id'], store['dms'])
 
         # Check if the user is a member of the dm the message came from
-        if is_a_member_dm(user['u_id'], dm['members']) is False:
+        if is_a_member_dm(user['u_id'], dm) is False:
             raise InputError(description='You are not a member in the dm that this message was sent in')
 
         # Check if the user is the creator of the dm
-        if dm['creator']['u_id'] != user['u_id']:
+        if dm['creator'] != user['u_id']:
             raise AccessError(description='You do not have owner permissions')
     
     # If message was sent in a channel
@@ -896,15 +837,14 @@ def message_pin(token, message_id):
         raise InputError(description='Message is already pinned')
 
     # Change the is_pinned status to be True
+    data_store.mark('messages', message_dict)
     message_dict['is_pinned'] = True
 
-    # Saving the change in data
-    data_store.set(store)
-
     return {
 
     }
 
+@data_store.transaction()
 def message_unpin(token, message_id):
     '''
     Given a message within a channel or DM, remove its mark as "pinned"
@@ -943,11 +883,11 @@ def message_unpin(token, message_id):
         dm = find_dm(message_dict['dm_id'], store['dms'])
 
         # Check if the user is a member of the dm the message came from
-        if is_a_member_dm(user['u_id'], dm['members']) is False:
+        if is_a_member_dm(user['u_id'], dm) is False:
             raise InputError(description='You are not a member in the dm that this message was sent in')
 
         # Check if the user is the creator of the dm
-        if dm['creator']['u_id'] != user['u_id']:
+        if dm['creator'] != user['u_id']:
             raise AccessError(description='You do not have owner permissions')
     
     # If message was sent in a channel
@@ -970,11 +910,9 @@ def message_unpin(token, message_id):
         raise InputError(description='Message is already unpinned')
 
     # Change the is_pinned status to be False
+    data_store.mark('messages', message_dict)
     message_dict['is_pinned'] = False
 
-    # Saving the change in data
-    data_store.set(store)
-
     return {
 
     }
@@ -991,25 +929,17 @@ def message_share_send_channel(user, channel, message, store):
     # Get the current time
     t = datetime.datetime.now()
 
-    # Make react dict
-    react_dict = {  'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False}
-
     # Create a message dictionary where time created is a unix timestamp
     message_dict = {'message_id': message_id,
                     'u_id': user['u_id'],
                     'message': message,
                     'time_created': int(time.mktime(t.timetuple())),
-                    'reacts': [react_dict],
+                    'reacts': new_reacts(),
                     'is_pinned': False,
                     'channel_id': channel['channel_id']}
 
     # Append message dictionary to channel messages and also all messages
-    store['messages'].append(message_dict)
-    channel['messages'].append(message_dict)
-    
-    data_store.set(store)
+    add_message(message_dict, channel, store)
     
     return {
         'message_id': message_id
@@ -1027,30 +957,23 @@ def message_share_send_dm (user, dm, message, store):
     # Get the current time
     t = datetime.datetime.now()
 
-    # Make react dict
-    react_dict = {  'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False}
-
     # Create a message_dict where time created is a unix timestamp
     message_dict = {'message_id': message_id,
                     'u_id': user['u_id'],
                     'message': message,
                     'time_created': int(time.mktime(t.timetuple())),
-                    'reacts': [react_dict],
+                    'reacts': new_reacts(),
                     'is_pinned': False,
                     'dm_id': dm['dm_id']}
 
     # Append message dictionary to channel messages and also all messages
-    store['messages'].append(message_dict)
-    dm['messages'].append(message_dict)
+    add_message(message_dict, dm, store)
     
-    data_store.set(store)
-
     return {
         'message_id': message_id
     }
 
+@data_store.transaction()
 def message_share(token, og_message_id, message, channel_id, dm_id):
     '''
     Share a message to another channel
@@ -1115,7 +1038,7 @@ def message_share(token, og_message_id, message, channel_id, dm_id):
             og_dm = find_dm(og_message['dm_id'], store['dms'])
 
             # Check if the user is a member of the dm the message came from
-            if is_a_member_dm(user['u_id'], og_dm['members']) is False:
+            if is_a_member_dm(user['u_id'], og_dm) is False:
                 raise InputError(description='You are not a member in the dm that this message was sent in')
 
         # Else the message came from a channel
@@ -1148,7 +1071,7 @@ def message_share(token, og_message_id, message, channel_id, dm_id):
         target_dm = find_dm(dm_id, store['dms'])
         
         # Checks if the user is a member of the target dm
-        if is_a_member_dm(user['u_id'], target_dm['members']) is False:
+        if is_a_member_dm(user['u_id'], target_dm) is False:
             raise AccessError(description='Not a member of the given dm')
         
         # Checks if the given message_id corresponds to a message
@@ -1160,7 +1083,7 @@ def message_share(token, og_message_id, message, channel_id, dm_id):
             og_dm = find_dm(og_message['dm_id'], store['dms'])
 
             # Check if the user is a member of the dm the message came from
-            if is_a_member_dm(user['u_id'], og_dm['members']) is False:
+            if is_a_member_dm(user['u_id'], og_dm) is False:
                 raise InputError(description='You are not a member in the dm that this message was sent in')
 
         # Checking if the og_message came from a channel
@@ -1190,6 +1113,41 @@ def message_share(token, og_message_id, message, channel_id, dm_id):
     # Returning the new message_id 
     return {'shared_message_id': shared_message_id['message_id']}    
 
+# Sends a message from message_sendlater into its channel
+@data_store.transaction()
+def send_later_channel_message(message_dict, user, channel, store):
+
+    # The channel is gone if the workspace was cleared before the message was due
+    if get_channel(channel['channel_id'], store) is not channel:
+        return
+
+    # Append message dictionary to channel messages and also all messages
+    add_message(message_dict, channel, store)
+
+    # Check if any users were tagged and send them a notification
+    tag_users_channel_msg(message_dict['message'], user, channel, store)
+
+    update_user_stat_message(user, store)
+    update_workspace_message(user, store)
+
+# Sends a message from message_sendlaterdm into its dm
+@data_store.transaction()
+def send_later_dm_message(message_dict, user, dm, store):
+
+    # The dm is gone if the workspace was cleared before the message was due
+    if find_dm(dm['dm_id'], store['dms']) is not dm:
+        return
+
+    # Append message dictionary to dm messages and also all messages
+    add_message(message_dict, dm, store)
+
+    # Check if any users were tagged and send them a notification
+    tag_users_dm_msg(message_dict['message'], user, dm, store)
+
+    update_user_stat_dm(user, store)
+    update_workspace_stat_dm(user, store)
+
+@data_store.transaction()
 def message_sendlater(token, channel_id, message, time_sent):
     """
     Function sends a message in the future specified by the user in the 
@@ -1238,9 +1196,6 @@ def message_sendlater(token, channel_id, message, time_sent):
     if len(message) < 1 or len(message) > 1000:
         raise InputError(description='Message length must be between 1 and 1000 characters')
 
-    # Get message_id
-    message_id = get_new_message_id(store)
-
     # Get the current time
     rn = datetime.datetime.now()
 
@@ -1249,43 +1204,32 @@ def message_sendlater(token, channel_id, message, time_sent):
     # Check that the user didn't give us a time in the past
     if unix_rn > time_sent:
         raise InputError(description="You cannot send a message to the past, even though that would be pretty cool")
+
+    # Get message_id, once every check has passed
+    message_id = get_new_message_id(store)
     
     # Get the unix time difference
     time_delta = time_sent - unix_rn
 
-    # Make react dict
-    react_dict = {  'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False}
-    
     # Create message dictionary
     message_dict = {'message_id': message_id,
                     'u_id': user['u_id'],
                     'message': message,
                     'time_created': unix_rn,
-                    'reacts': [react_dict],
+                    'reacts': new_reacts(),
                     'is_pinned': False,
                     'channel_id': channel['channel_id']}
 
-    # Threading for the appending the message into messages and dms
-    # Addtional threading for saving to data
-    messages_thread = threading.Timer(time_delta, add_to_list, args=(store['messages'], message_dict))
-    channel_thread = threading.Timer(time_delta, add_to_list, args=(channel["messages"], message_dict))
-    tagging_thread = threading.Timer(time_delta, tag_users_channel_msg, args=(message, user, channel, store))
-    stats_user_thread = threading.Timer(time_delta, update_user_stat_message, args=(user, store))
-    stats_workspace_thread = threading.Timer(time_delta, update_workspace_message, args=(user, store))
-    
-    # Start the threads
-    messages_thread.start()
-    channel_thread.start()
-    tagging_thread.start()
-    stats_user_thread.start()
-    stats_workspace_thread.start()
+    # Thread which sends the message once time_sent is reached
+    send_thread = threading.Timer(time_delta, send_later_channel_message,
+                                  args=(message_dict, user, channel, store))
+    send_thread.start()
     
     return {
         'message_id': message_id
     }
 
+@data_store.transaction()
 def message_sendlaterdm(token, dm_id, message, time_sent):
     """
     Function sends a message in the future specified by the user in the 
@@ -1325,16 +1269,13 @@ def message_sendlaterdm(token, dm_id, message, time_sent):
         raise InputError(description='Invalid dm_id')
 
     # Check if user is a member of the dm
-    if is_a_member_dm(user['u_id'], dm['members']) is False:
+    if is_a_member_dm(user['u_id'], dm) is False:
         raise AccessError(description='You are not a member of this dm')
 
     # Check if length of message is < 1 character or > 1000 characters
     if len(message) < 1 or len(message) > 1000:
         raise InputError(description='Message length must be between 1 and 1000 characters')
 
-    # Get message_id
-    message_id = get_new_message_id(store)
-
     # Get the current time
     rn = datetime.datetime.now()
 
@@ -1343,39 +1284,72 @@ def message_sendlaterdm(token, dm_id, message, time_sent):
     # Check that the user didn't give us a time in the past
     if unix_rn > time_sent:
         raise InputError(description="You cannot send a message to the past, even though that would be pretty cool")
+
+    # Get message_id, once every check has passed
+    message_id = get_new_message_id(store)
     
     # Get the unix time difference
     time_delta = time_sent - unix_rn
 
-    # Make react dict
-    react_dict = {  'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False}
-    
     # Create message dictionary
     message_dict = {'message_id': message_id,
                     'u_id': user['u_id'],
                     'message': message,
                     'time_created': int(time.mktime(rn.timetuple())),
-                    'reacts': [react_dict],
+                    'reacts': new_reacts(),
                     'is_pinned': False,
                     'dm_id': dm['dm_id']}
     
-    # Threading for the appending the message into messages and dms
-    # Addtional threading for saving to data
-    messages_thread = threading.Timer(time_delta, add_to_list, args=(store['messages'], message_dict))
-    dms_thread = threading.Timer(time_delta, add_to_list, args=(dm["messages"], message_dict))
-    tagging_thread = threading.Timer(time_delta, tag_users_dm_msg, args=(message, user, dm, store))
-    stats_user_thread = threading.Timer(time_delta, update_user_stat_dm, args=(user, store))
-    stats_workspace_thread = threading.Timer(time_delta, update_workspace_stat_dm, args=(user, store))
-    
-    # Start the threads
-    messages_thread.start()
-    dms_thread.start()
-    tagging_thread.start()
-    stats_user_thread.start()
-    stats_workspace_thread.start()
+    # Thread which sends the message once time_sent is reached
+    send_thread = threading.Timer(time_delta, send_later_dm_message,
+                                  args=(message_dict, user, dm, store))
+    send_thread.start()
   
     return {
         'message_id': message_id
-    }
\ No newline at end of file
+    }
+
+# Takes the removed messages out of the message lists of their channels and
+# dms and out of store['messages']. They are already counted in the message
+# statistics, and pages read from before them find the newest older message
+# kept through the positions of their channel or dm
+@data_store.transaction()
+def compact_removed_messages():
+
+    store = data_store.get()
+    removed = list(data_store.get_indexes().table('removed').values())
+
+    # Channels and dms which hold any of the removed messages
+    containers = {}
+    for message in removed:
+        if 'dm_id' in message:
+            kind, container = 'dms', find_dm(message['dm_id'], store['dms'])
+        else:
+            kind, container = 'channels', get_channel(message['channel_id'], store)
+        if container is not None:
+            containers[id(container)] = (kind, container)
+        data_store.mark_deleted('messages', message)
+
+    # Every removed message is taken out of store['messages'] in one pass
+    discard_messages(store['messages'], {message['message_id'] for message in removed})
+
+    for kind, container in containers.values():
+        data_store.mark(kind, container)
+        container['messages'] = [message for message in container['messages']
+                                 if message['time_created'] != 0]
+
+# Starts a thread which compacts the removed messages every interval seconds,
+# whenever there are any
+def start_message_compactor(interval):
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with data_store.read():
+                waiting = len(data_store.get_indexes().table('removed'))
+            if waiting > 0:
+                compact_removed_messages()
+
+    compactor = threading.Thread(target=run, daemon=True)
+    compactor.start()
+    return compactor
@@ -0,0 +1,149 @@
+'''
+migrations.py implementation
+
+    Description:
+        Converts a store saved by an older version into the current format,
+        once, when it is loaded. The store records the version it was saved
+        in under store['version'].
+
+    Functions:
+        - migrate(store)
+        - migrate_members(store)
+        - migrate_reacts(store)
+        - migrate_stats(store)
+        - migrate_notifications(store)
+        - drop_reclaimed_messages(store)
+'''
+
+from src import config
+from src.ring_buffer import RingBuffer
+from src.time_series import TimeSeries
+
+# Version of the format of the current store
+STORE_VERSION = 1
+
+# Fields kept by removed messages whose content was reclaimed, before they
+# were taken out of the store
+RECLAIMED_FIELDS = {'message_id', 'u_id', 'time_created', 'channel_id', 'dm_id'}
+
+def migrate(store):
+
+    '''
+    Function Description:
+        Converts a store saved before it was versioned to the current format,
+        updating it in place. Each step only changes the values still in
+        their old shape, so stores saved between the changes are converted
+        too.
+
+    Arguments:
+        store (dict)            - the loaded store
+
+    Return Value:
+        Returns True if the store was converted and must be saved again,
+        False if it is already in the current format
+    '''
+
+    if store.get('version', 0) >= STORE_VERSION:
+        return False
+
+    migrate_members(store)
+    migrate_reacts(store)
+    drop_reclaimed_messages(store)
+    migrate_stats(store)
+    migrate_notifications(store)
+    store['version'] = STORE_VERSION
+    return True
+
+# Helper which gives the u_id of a member saved as a copy of their details, or
+# None for a dm creator saved as {} once they left
+def member_id(member):
+    if isinstance(member, dict):
+        return member.get('u_id')
+    return member
+
+# Stores channel and dm members by their u_id, rather than copies of their
+# details
+def migrate_members(store):
+
+    for channel in store['channels']:
+        channel['owner_members'] = [member_id(member) for member in channel['owner_members']]
+        channel['all_members'] = [member_id(member) for member in channel['all_members']]
+
+    for dm in store['dms']:
+        dm['members'] = [member_id(member) for member in dm['members']]
+        dm['creator'] = member_id(dm['creator'])
+
+# Stores the reacts of each message as a map of react_id to the u_ids who
+# reacted, rather than a list of react dicts
+def migrate_reacts(store):
+
+    for message in store['messages']:
+        reacts = message.get('reacts')
+        if isinstance(reacts, list):
+            message['reacts'] = {react['react_id']: dict.fromkeys(react['u_ids'], True)
+                                 for react in reacts}
+
+# Takes removed messages whose content was already reclaimed out of
+# store['messages'] and their channels and dms
+def drop_reclaimed_messages(store):
+
+    def reclaimed(message):
+        return message['time_created'] == 0 and RECLAIMED_FIELDS.issuperset(message)
+
+    if not any(reclaimed(message) for message in store['messages']):
+        return
+
+    store['messages'] = [message for message in store['messages'] if not reclaimed(message)]
+    for kind in ('channels', 'dms'):
+        for container in store[kind]:
+            container['messages'] = [message for message in container['messages']
+                                     if not reclaimed(message)]
+
+# Helper which converts a statistic saved as a list of {name: value,
+# 'time_stamp'} dicts to a TimeSeries
+def time_series(points):
+
+    if isinstance(points, TimeSeries):
+        return points
+
+    name = next(key for key in points[0] if key != 'time_stamp')
+    series = TimeSeries(name, config.stats_raw_points)
+    for point in points:
+        series.add(point[name], point['time_stamp'])
+    return series
+
+# Helper which gives the newest value of a statistic
+def latest(series):
+    return series.points()[-1][series.name]
+
+# Helper which converts the statistics of a user or the workspace in place,
+# adding the running count of messages it was missing
+def migrate_stat_dict(stats, counter, series_key):
+
+    for key, value in stats.items():
+        if isinstance(value, (list, TimeSeries)):
+            stats[key] = time_series(value)
+    if counter not in stats:
+        stats[counter] = latest(stats[series_key])
+
+# Keeps each statistic as a TimeSeries, and the number of messages each user
+# has sent and which exist as running counts
+def migrate_stats(store):
+
+    for user in store['users']:
+        migrate_stat_dict(user['user_stats'], 'num_messages_sent', 'messages_sent')
+        migrate_stat_dict(user['workspace_stats'], 'num_messages_exist', 'messages_exist')
+
+    if isinstance(store['stats'], dict):
+        migrate_stat_dict(store['stats'], 'num_messages_exist', 'messages_exist')
+
+# Keeps the notifications of each user in a RingBuffer, rather than a list of
+# every notification
+def migrate_notifications(store):
+
+    for user in store['users']:
+        notifications = user['notifications']
+        if isinstance(notifications, list):
+            user['notifications'] = RingBuffer(config.notifications_kept)
+            for notification in notifications:
+                user['notifications'].append(notification)
@@ -1,21 +1,29 @@
+import time
+from src import config
 from src.data_store import data_store
-from src.helpers import search_user_token
-from src.error import AccessError
+from src.helpers import search_user_token, notification_listeners
+from src.error import AccessError, InputError
 
-def get_notifications(token):
+@data_store.read()
+def get_notifications(token, since=0):
     '''
     Function Description:
         Return the user's most recent 20 notifications, ordered from most recent
-        to least recent.
+        to least recent. Given the cursor returned by an earlier call as since,
+        only the notifications which arrived after that call are returned.
 
     Arguments:
         token (str)           - authorised user's hash
+        since (int)           - cursor returned by an earlier call, or 0 for
+                                the most recent notifications
 
     Exceptions:
         AccessError           - Occurs when token is invalid
+        InputError            - Occurs when since is not a cursor returned
+                                for this user
 
     Return Value:
-        {notifications} on valid token
+        {notifications, cursor} on valid token
     '''
 
     store = data_store.get()
@@ -25,14 +33,66 @@ def get_notifications(token):
     if user is None:
         raise AccessError(description='Token is invalid')
 
-    # Get a copy of the user's notifications
-    notifications = user['notifications'].copy()
+    # The cursor is the number of notifications the user has been sent
+    notifications = user['notifications']
+    if since < 0 or since > notifications.total:
+        raise InputError(description='Cursor is invalid')
 
-    # Reverse the notifications such that they are sorted by most recent
-    notifications.reverse()
+    # Get up to 20 of the notifications sent since, most recent first
+    return {'notifications': notifications.newest(20, since),
+            'cursor': notifications.total}
 
-    # If there are over 20 notifications, cut list down to first 20
-    if len(notifications) > 20:
-        notifications = notifications[0:20]
-   
-    return {'notifications': notifications}
+# Not a read, as it must not hold the store while it waits. Each
+# get_notifications reads the store on its own
+def wait_notifications(token, since=0, timeout=None):
+    '''
+    Function Description:
+        Waits until the user has been sent a notification since the cursor,
+        or until timeout seconds have passed, then returns the same as
+        get_notifications. Returns at once if there already are some.
+
+    Arguments:
+        token (str)           - authorised user's hash
+        since (int)           - cursor returned by an earlier call
+        timeout (int)         - most seconds to wait, up to
+                                config.notifications_wait_timeout, which is
+                                also used if it is not given
+
+    Exceptions:
+        AccessError           - Occurs when token is invalid
+        InputError            - Occurs when since is not a cursor returned
+                                for this user
+                              - Occurs when timeout is negative or too long
+
+    Return Value:
+        {notifications, cursor} on valid token
+    '''
+
+    if timeout is None:
+        timeout = config.notifications_wait_timeout
+    if timeout < 0 or timeout > config.notifications_wait_timeout:
+        raise InputError(description='Timeout is invalid')
+    deadline = time.monotonic() + timeout
+
+    u_id = token_u_id(token)
+    while True:
+        # Listen before reading, so a notification sent in between still
+        # wakes the wait
+        event = notification_listeners.listen(u_id)
+        try:
+            result = get_notifications(token, since)
+            remaining = deadline - time.monotonic()
+            if result['notifications'] or remaining <= 0:
+                return result
+            event.wait(remaining)
+        finally:
+            notification_listeners.stop(u_id, event)
+
+# Finds the u_id of the user with a token
+@data_store.read()
+def token_u_id(token):
+
+    user = search_user_token(token, data_store.get()['users'])
+    if user is None:
+        raise AccessError(description='Token is invalid')
+    return user['u_id']
@@ -1,6 +1,7 @@
 from .data_store import data_store
 
 # Function implementation if clear
+@data_store.transaction()
 def clear_v1():
 
     # Getting data from datastore
@@ -13,8 +14,8 @@ def clear_v1():
     store['dms'] = []
     store['standups'] = []
     store['stats'] = ""
-    # Set data to datastore
-    data_store.set(store)
+    for kind in store:
+        data_store.mark(kind)
 
     return {
     }
\ No newline at end of file
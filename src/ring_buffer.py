@@ -0,0 +1,46 @@
+'''
+ring_buffer.py implementation
+
+    Description:
+        Fixed number of the newest items added, such as a user's notifications,
+        each numbered in the order it was added so readers can ask for only
+        the items added since they last read
+
+    Classes:
+        - RingBuffer
+'''
+
+class RingBuffer:
+
+    '''
+    Keeps the newest capacity items added, overwriting the oldest. The nth
+    item added is numbered n, and total is the number of the newest item, or
+    0 if none have been added.
+    '''
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.slots = [None] * capacity
+        self.total = 0
+
+    def append(self, item):
+        self.slots[self.total % self.capacity] = item
+        self.total += 1
+
+    def newest(self, count, since=0):
+
+        '''
+        Returns up to count items numbered after since, newest first
+        '''
+
+        # Items are numbered from 1, and stored from slot 0
+        oldest = max(since, self.total - self.capacity, self.total - count)
+        return [self.slots[number % self.capacity]
+                for number in range(self.total - 1, oldest - 1, -1)]
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def __eq__(self, other):
+        return (isinstance(other, RingBuffer) and self.total == other.total
+                and self.newest(self.capacity) == other.newest(other.capacity))
@@ -15,8 +15,9 @@ search.py implementation
 
 from src.data_store import data_store
 from src.error import InputError, AccessError
-from src.helpers import search_user_token, is_a_member, is_a_member_dm
+from src.helpers import search_user_token, view_messages
 
+@data_store.read()
 def search(token, query_str):
     '''
     Function Description:
@@ -60,37 +61,33 @@ def search(token, query_str):
     return_list.extend(dm_messages_query(found_user, query_str))
 
     # Returning the list of messages that the query_str is a part of
-    return {'messages': return_list}
+    return {'messages': view_messages(return_list, found_user)}
 
 # Function to return a list of messages that query_str is a substring of in channels
 def channel_messages_query(user, query_str):
-    store = data_store.get()
     list = []
 
-    # Checking all the channels that have been created
-    for channel in store['channels']:
-        # Checking if the user is a member of the channel
-        if is_a_member(user['u_id'], channel) is True:
-            # Searching all the messages that have been sent in the channel
-            for message in channel['messages']:
-                # Checking if the query_str is a subtring of the message
-                if query_str in message['message']:
-                    list.append(message)
+    # Checking all the channels the user is a member of
+    for channel in data_store.get_indexes().joined('channels', user['u_id']):
+        # Searching all the messages that have been sent in the channel,
+        # skipping removed ones
+        for message in channel['messages']:
+            # Checking if the query_str is a subtring of the message
+            if message['time_created'] != 0 and query_str in message['message']:
+                list.append(message)
     return list
 
 # Function to return a list of messages that query_str is a substring of in dms
 def dm_messages_query(user, query_str):
-    store = data_store.get()
     list = []
 
-    # Checking all of the dms that have been created
-    for dm in store['dms']:
-        # Checking if the user is a member of the dm
-        if is_a_member_dm(user['u_id'], dm['members']):
-            # Searching all of the messages that have been sent in the dm
-            for message in dm['messages']:
-                # Checking if the query_str is a substring of the message
-                if query_str in message['message']:
-                    list.append(message)
+    # Checking all of the dms the user is a member of
+    for dm in data_store.get_indexes().joined('dms', user['u_id']):
+        # Searching all of the messages that have been sent in the dm,
+        # skipping removed ones
+        for message in dm['messages']:
+            # Checking if the query_str is a substring of the message
+            if message['time_created'] != 0 and query_str in message['message']:
+                list.append(message)
     return list
 
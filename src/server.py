@@ -11,6 +11,7 @@ from src.auth import auth_login_v1, \
                      auth_password_reset
 from src.channel import channel_details_v1, \
                         channel_messages_v1, \
+                        channel_messages_cursor, \
                         channel_join_v1, \
                         channel_invite_v1, \
                         channel_addowner_v1, \
@@ -29,10 +30,12 @@ from src.message import message_send, \
                         message_unpin, \
                         message_share, \
                         message_sendlater, \
-                        message_sendlaterdm                    
+                        message_sendlaterdm, \
+                        start_message_compactor
 from src.dm import dm_create, \
                    dm_list, \
                    dm_messages, \
+                   dm_messages_cursor, \
                    dm_remove, \
                    dm_details, \
                    dm_leave
@@ -49,7 +52,7 @@ from src.admin import admin_user_permission_change_v1, \
 from src.standup import standup_start, \
                         standup_active, \
                         standup_send
-from src.notifications import get_notifications
+from src.notifications import get_notifications, wait_notifications
 from src.search import search
 from src.other import clear_v1
 
@@ -76,6 +79,10 @@ APP.register_error_handler(Exception, defaultHandler)
 
 #### NO NEED TO MODIFY ABOVE THIS POINT, EXCEPT IMPORTS
 
+# GET routes only call functions decorated with data_store.read(), which run
+# together against the store in memory and are never persisted. Every other
+# route calls a function decorated with data_store.transaction().
+
 @APP.route("/auth/login/v2", methods=['POST'])
 def auth_login_v2():
 
@@ -147,6 +154,15 @@ def channel_messages_v2():
 
     return dumps(channel_messages_v1(token, int(channel_id), int(start)))
 
+@APP.route("/channel/messages/cursor/v1", methods=['GET'])
+def channel_messages_cursor_v1():
+
+    token = request.args.get('token')
+    channel_id = request.args.get('channel_id')
+    cursor = request.args.get('cursor', '')
+
+    return dumps(channel_messages_cursor(token, int(channel_id), str(cursor)))
+
 @APP.route('/channel/leave/v1', methods=['POST'])
 def channel_leave_v2():
 
@@ -323,6 +339,15 @@ def dm_messages_v1():
 
     return dumps(dm_messages(token, int(dm_id), int(start)))
 
+@APP.route("/dm/messages/cursor/v1", methods=['GET'])
+def dm_messages_cursor_v1():
+
+    token = request.args.get('token')
+    dm_id = request.args.get('dm_id')
+    cursor = request.args.get('cursor', '')
+
+    return dumps(dm_messages_cursor(token, int(dm_id), str(cursor)))
+
 @APP.route("/channel/join/v2", methods=['POST'])
 def channel_join_v2():
 
@@ -467,21 +492,40 @@ def auth_password_reset_v1():
 def user_stats_v1():
 
     token = request.args.get('token')
+    time_start = request.args.get('time_start', type=int)
+    time_end = request.args.get('time_end', type=int)
+    resolution = request.args.get('resolution')
 
-    return dumps(user_stats(token))
+    return dumps(user_stats(token, time_start, time_end, resolution))
 
 @APP.route('/notifications/get/v1', methods=['GET'])
 def get_notifications_v1():
 
     token = request.args.get('token')
+    since = request.args.get('since', 0, type=int)
+
+    return dumps(get_notifications(token, since))
+
+# Held open until a notification arrives or the timeout passes, while the
+# threaded server keeps answering other requests
+@APP.route('/notifications/wait/v1', methods=['GET'])
+def wait_notifications_v1():
+
+    token = request.args.get('token')
+    since = request.args.get('since', 0, type=int)
+    timeout = request.args.get('timeout', type=int)
+
+    return dumps(wait_notifications(token, since, timeout))
 
-    return dumps(get_notifications(token))
 @APP.route('/users/stats/v1', methods=['GET'])
 def users_stats_v1():
 
     token = request.args.get('token')
+    time_start = request.args.get('time_start', type=int)
+    time_end = request.args.get('time_end', type=int)
+    resolution = request.args.get('resolution')
 
-    return dumps(users_stats(token))
+    return dumps(users_stats(token, time_start, time_end, resolution))
 
 @APP.route("/search/v1", methods=['GET'])
 def search_v1():
@@ -533,6 +577,9 @@ def clear():
     
     return dumps({})
 
+# Take removed messages out of their channels and dms in the background
+start_message_compactor(config.message_compact_interval)
+
 #### NO NEED TO MODIFY BELOW THIS POINT
 
 if __name__ == "__main__":
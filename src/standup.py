@@ -20,7 +20,7 @@ from src.data_store import data_store
 from src.error import InputError, AccessError
 from src.helpers import search_user_token, is_channel_valid, get_channel, \
                         is_a_member, update_user_stat_message, \
-                        update_workspace_message
+                        update_workspace_message, new_reacts, add_message
 from .message import get_new_message_id
 from datetime import datetime, timedelta
 import time
@@ -50,6 +50,7 @@ def standup_found(channel_id, store):
 
     return None
 
+@data_store.transaction()
 def standup_start(token, channel_id, length):
     '''
     Function Description:
@@ -115,12 +116,12 @@ def standup_start(token, channel_id, length):
                      'messages': []}
 
     store['standups'].append(standup_dict)
-
-    data_store.set(store)
+    data_store.mark('standups', standup_dict)
 
     return {'time_finish': time_finish}
 
 
+@data_store.read()
 def standup_active(token, channel_id):
     '''
     Function Description:
@@ -174,6 +175,7 @@ def standup_active(token, channel_id):
             'time_finish': end_time}
     
     
+@data_store.transaction()
 def standup_send(token, channel_id, message):
     '''
     Function Description:
@@ -229,12 +231,13 @@ def standup_send(token, channel_id, message):
     new_message = {'user_handle': user['handle_str'],
                    'message': message}
 
+    data_store.mark('standups', standup_curr)
     standup_curr['messages'].append(new_message)
 
-    data_store.set(store)
     return {}
 
 
+@data_store.transaction()
 def end_message(user, channel_id, channel, store):
     '''
     Function Description:
@@ -256,8 +259,9 @@ def end_message(user, channel_id, channel, store):
     
     temp_standup = standup_found(channel_id, store)
 
-    # Should only return if pytest clears the dict
-    if temp_standup is None:
+    # Should only return if pytest clears the dict, in which case the channel
+    # may have been replaced by a new one with the same id
+    if temp_standup is None or get_channel(channel_id, store) is not channel:
         return
     
     # Create the new message, which would be added to the channel messages
@@ -266,28 +270,23 @@ def end_message(user, channel_id, channel, store):
         temp_message = (f"{message['user_handle']}: {message['message']}\n")
         new_message += temp_message
 
-    react_dict = {  'react_id': 1,
-                    'u_ids': [],
-                    'is_this_user_reacted': False}
-
     # Creates the new message for channel_messages
     message_dict = {'message_id': get_new_message_id(store),
                     'u_id': temp_standup['creator_id'],
                     'message': new_message,
                     'time_created': temp_standup['time_finish'],
-                    'reacts': [react_dict],
+                    'reacts': new_reacts(),
                     'is_pinned': False,
                     'channel_id': channel_id}
 
     # Append the message
-    store['messages'].append(message_dict)
-    channel['messages'].append(message_dict)
+    add_message(message_dict, channel, store)
     
     update_user_stat_message(user, store)
     update_workspace_message(user, store)
 
     # Delete temporary standup dict
+    data_store.mark_deleted('standups', temp_standup)
     store['standups'].remove(temp_standup)
 
-    data_store.set(store)
     return
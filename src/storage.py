@@ -0,0 +1,1433 @@
+'''
+storage.py implementation
+
+    Description:
+        Persistence engines used by the Datastore. Each change to the store is
+        described by a record (kind, key, data) where kind is a top level key
+        of the store, key is the id of the entity that changed (None when the
+        whole collection or global value changed) and data is the pickled
+        entity (None when the entity was deleted).
+
+    Functions:
+        - encode_records(store, changes)
+        - apply_records(store, records)
+        - write_atomic(path, data)
+        - encode_batch(records)
+        - read_batches(path)
+        - encode_snapshot(store)
+        - read_snapshot(path)
+        - make_engine(mode, compact_every)
+
+    Classes:
+        - LazyList
+        - Hydrator
+        - SqliteHydrator
+        - PickleEngine
+        - LogEngine
+        - SqliteEngine
+        - ShardEngine
+        - Flusher
+'''
+
+import copy
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_left
+
+# The key which identifies an entity in each collection of the store
+ENTITY_KEYS = {'users': 'u_id',
+               'channels': 'channel_id',
+               'dms': 'dm_id',
+               'messages': 'message_id',
+               'standups': 'channel_id'}
+
+# Collections whose entities hold a list of messages
+CONTAINERS = ('channels', 'dms')
+
+# Order records are written in within a batch. Channels and dms come before
+# their messages, which are added to them as they are replayed
+RECORD_ORDER = ('version', 'message_ids', 'stats', 'users', 'channels', 'dms', 'messages',
+                'standups')
+
+SNAPSHOT_PATH = 'data_store.p'
+LOG_PATH = 'data_store.log'
+DATABASE_PATH = 'data_store.db'
+SHARD_DIRECTORY = 'data_store.shards'
+
+# Each batch in the log is preceded by its length and crc32 checksum
+FRAME = struct.Struct('>II')
+
+# Snapshots start with the magic bytes, the format version and the length of
+# the header
+SNAPSHOT_MAGIC = b'DSNAP'
+SNAPSHOT_VERSION = 3
+SNAPSHOT_HEADER = struct.Struct('>5sHQ')
+
+# The blob holding the order of store['messages'], the blob holding the
+# sorted message_ids with the blob each message is saved in, and the blob
+# holding the message_ids each user sent
+ORDER_BLOB = 'order'
+LOCATIONS_BLOB = 'locations'
+SENDERS_BLOB = 'senders'
+
+class _Deleted:
+    '''Marker for an entity that has been removed from its collection'''
+
+    def __repr__(self):
+        return 'DELETED'
+
+DELETED = _Deleted()
+
+def encode_entity(kind, entity):
+
+    '''
+    Converts an entity into the value stored in a record. Channels and dms
+    are stored without their messages, as each message record holds the
+    channel_id or dm_id it was sent in, so a message is only ever stored once
+    and writing a channel costs the same however many messages it has.
+    '''
+
+    if kind in CONTAINERS:
+        return {field: value for field, value in entity.items() if field != 'messages'}
+    return entity
+
+def encode_records(store, changes):
+
+    '''
+    Function Description:
+        Builds the records describing a set of changes to the store
+
+    Arguments:
+        store (dict)            - the store the changes were made to
+        changes (dict)          - maps (kind, key) to the changed entity, the
+                                  entity is None when the whole collection
+                                  changed and DELETED when it was removed
+
+    Return Value:
+        Returns a list of (kind, key, data) records
+    '''
+
+    records = []
+    for (kind, key), entity in sorted(changes.items(),
+                                      key=lambda item: RECORD_ORDER.index(item[0][0])):
+        if entity is DELETED:
+            records.append((kind, key, None))
+            continue
+
+        if key is not None:
+            value = encode_entity(kind, entity)
+        elif kind in ENTITY_KEYS:
+            value = [encode_entity(kind, item) for item in store[kind]]
+        else:
+            value = store[kind]
+
+        records.append((kind, key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+    return records
+
+def message_container(message):
+
+    '''
+    Returns (kind, key) of the channel or dm a message was sent in, or None
+    '''
+
+    if 'channel_id' in message:
+        return 'channels', message['channel_id']
+    if 'dm_id' in message:
+        return 'dms', message['dm_id']
+    return None
+
+def apply_records(store, records, messages=None):
+
+    '''
+    Function Description:
+        Replays a list of records onto a store, updating it in place. Messages
+        are updated in place so that the channel and dm message lists keep
+        sharing them with store['messages']. A new message is appended to the
+        messages of the channel or dm it was sent in, which keep theirs when
+        they are replaced.
+
+    Arguments:
+        store (dict)            - the store to update
+        records (list)          - (kind, key, data) records
+        messages (dict)         - maps message_id to every message in
+                                  store['messages'] the records change, when
+                                  they are not to be found by reading them
+                                  all, and is updated as they are applied
+
+    Return Value:
+        None
+    '''
+
+    if not records:
+        return
+
+    # Positions of every entity, so each record is applied in constant time.
+    # They are only found for the collections the records change.
+    positions = {}
+
+    def position_map(kind):
+        if kind not in positions:
+            positions[kind] = {entity[ENTITY_KEYS[kind]]: index
+                               for index, entity in enumerate(store[kind])}
+        return positions[kind]
+
+    def message_map():
+        nonlocal messages
+        if messages is None:
+            messages = {msg['message_id']: msg for msg in store['messages']}
+        return messages
+
+    # The message list of the channel or dm a message was sent in, if it is
+    # in the store
+    def message_list(message):
+        location = message_container(message)
+        if location is None:
+            return None
+        index = position_map(location[0]).get(location[1])
+        return None if index is None else store[location[0]][index]['messages']
+
+    # message_ids of the messages removed by the records, and the message
+    # lists holding them. They are taken out of the lists together, rather
+    # than searching a list for each one.
+    removed = set()
+    stale = {}
+
+    def take_removed():
+        if removed:
+            discard_messages(store['messages'], removed)
+            for messages_list in stale.values():
+                discard_messages(messages_list, removed)
+            removed.clear()
+            stale.clear()
+
+    for kind, key, data in records:
+        value = None if data is None else pickle.loads(data)
+
+        # A global value or a whole collection was replaced
+        if key is None:
+            take_removed()
+            store[kind] = value
+            positions.pop(kind, None)
+            if kind == 'messages':
+                messages = {msg['message_id']: msg for msg in value}
+                for container_kind in CONTAINERS:
+                    attach_messages(store, container_kind)
+            elif kind in CONTAINERS:
+                attach_messages(store, kind, message_map())
+            continue
+
+        if kind == 'messages':
+            message = message_map().get(key)
+            if value is None:
+                # The message was removed from its collection
+                if message is not None:
+                    del messages[key]
+                    removed.add(key)
+                    messages_list = message_list(message)
+                    if messages_list is not None:
+                        stale[id(messages_list)] = messages_list
+            elif message is not None:
+                # Update the existing message so every list sharing it sees the change
+                message.clear()
+                message.update(value)
+            else:
+                messages[key] = value
+                store['messages'].append(value)
+                messages_list = message_list(value)
+                if messages_list is not None:
+                    messages_list.append(value)
+            continue
+
+        collection = store[kind]
+        index = position_map(kind).get(key)
+
+        # The entity was removed from its collection
+        if value is None:
+            if index is not None:
+                del collection[index]
+                positions.pop(kind)
+            continue
+
+        if kind in CONTAINERS:
+            if 'messages' in value:
+                # Written before channels and dms were stored without their
+                # messages, after every message they held
+                value['messages'] = [message_map()[message_id]
+                                     for message_id in value['messages']
+                                     if message_id in message_map()]
+            elif index is None:
+                value['messages'] = []
+            else:
+                value['messages'] = collection[index]['messages']
+
+        if index is None:
+            position_map(kind)[key] = len(collection)
+            collection.append(value)
+        else:
+            collection[index] = value
+
+    take_removed()
+
+def attach_messages(store, kind, messages=None):
+
+    '''
+    Gives each channel or dm of a whole collection its messages. When messages
+    maps message_id to message, those written with the message_ids of their
+    messages are given them. The rest are given every message in
+    store['messages'] which was sent in them.
+    '''
+
+    lists = {}
+    for container in store[kind]:
+        message_ids = container.get('messages')
+        if messages is not None and message_ids is not None:
+            container['messages'] = [messages[message_id] for message_id in message_ids
+                                     if message_id in messages]
+        else:
+            container['messages'] = lists[container[ENTITY_KEYS[kind]]] = []
+
+    if lists:
+        for message in store['messages']:
+            location = message_container(message)
+            if location is not None and location[0] == kind and location[1] in lists:
+                lists[location[1]].append(message)
+
+def discard_messages(messages, message_ids):
+
+    '''
+    Takes the messages with the given message_ids out of a list of messages
+    in one pass. Messages of store['messages'] which are still in the
+    snapshot are left out when it is read, rather than reading it now.
+    '''
+
+    if isinstance(messages, LazyList):
+        messages.discard(message_ids)
+    else:
+        messages[:] = [message for message in messages
+                       if message['message_id'] not in message_ids]
+
+def appended_since(entities, length):
+
+    '''
+    Returns the entities appended to a collection since it held length
+    entities, without reading the messages still in the snapshot
+    '''
+
+    if isinstance(entities, MessageList):
+        return entities.appended_since(length)
+    return entities[length:]
+
+def checkpoint_list(entities):
+
+    '''
+    Saves what a collection holds, returning a function which puts it back
+    given the entities taken out of it since. Messages still in the snapshot
+    are not read.
+    '''
+
+    if isinstance(entities, MessageList):
+        return entities.checkpoint()
+
+    saved = list(entities)
+
+    def restore(removed):
+        entities[:] = saved
+    return restore
+
+def write_atomic(path, data):
+
+    '''
+    Writes data into path without ever leaving a partially written file. The
+    data is written to a temporary file which then replaces path, so after a
+    crash path holds either the old or the new data.
+    '''
+
+    temp_path = f'{path}.tmp'
+    with open(temp_path, 'wb') as FILE:
+        FILE.write(data)
+        FILE.flush()
+        os.fsync(FILE.fileno())
+    os.replace(temp_path, path)
+
+def encode_batch(records):
+
+    '''
+    Frames a batch of records for the log as its length and checksum followed
+    by the pickled records
+    '''
+
+    data = pickle.dumps(records, pickle.HIGHEST_PROTOCOL)
+    return FRAME.pack(len(data), zlib.crc32(data)) + data
+
+def read_batches(path):
+
+    '''
+    Function Description:
+        Reads every batch of records in a log file, stopping at the first
+        batch which is incomplete or fails its checksum
+
+    Arguments:
+        path (str)              - the log file
+
+    Return Value:
+        Returns (batches, size) where size is the number of bytes holding
+        complete batches
+    '''
+
+    batches = []
+    size = 0
+    if not os.path.exists(path):
+        return batches, size
+
+    with open(path, 'rb') as FILE:
+        while True:
+            header = FILE.read(FRAME.size)
+            if len(header) < FRAME.size:
+                break
+            length, checksum = FRAME.unpack(header)
+            data = FILE.read(length)
+            if len(data) < length or zlib.crc32(data) != checksum:
+                break
+            batches.append(pickle.loads(data))
+            size += FRAME.size + length
+    return batches, size
+
+def message_blob(message):
+
+    '''
+    Returns the name of the snapshot blob a message is saved in, which is the
+    channel or dm it was sent in
+    '''
+
+    location = message_container(message)
+    if location is None:
+        return 'other'
+    return f'{location[0]}_{location[1]}'
+
+def encode_snapshot(store):
+
+    '''
+    Function Description:
+        Encodes the store in the versioned snapshot format. The header holds
+        the store without its messages and is followed by one blob of
+        messages for each channel and dm, in the order they were sent, so the
+        messages can be read from disk when they are first used. The
+        locations blob finds the blob a message is saved in from its
+        message_id, and the senders blob the message_ids each user sent.
+
+    Arguments:
+        store (dict)            - the store to encode
+
+    Return Value:
+        Returns the snapshot as bytes
+    '''
+
+    core = dict(store, messages=None)
+    for kind in CONTAINERS:
+        core[kind] = [encode_entity(kind, container) for container in store[kind]]
+
+    grouped = {}
+    for message in store['messages']:
+        grouped.setdefault(message_blob(message), []).append(message)
+
+    blobs = {name: pickle.dumps(messages, pickle.HIGHEST_PROTOCOL)
+             for name, messages in grouped.items()}
+    blobs[ORDER_BLOB] = pickle.dumps([message['message_id'] for message in store['messages']],
+                                     pickle.HIGHEST_PROTOCOL)
+
+    names = list(grouped)
+    locations = sorted((message['message_id'], number)
+                       for number, name in enumerate(names) for message in grouped[name])
+    blobs[LOCATIONS_BLOB] = pickle.dumps(
+        (names, array('q', [message_id for message_id, _ in locations]).tobytes(),
+         array('q', [number for _, number in locations]).tobytes()), pickle.HIGHEST_PROTOCOL)
+
+    senders = {}
+    for message in store['messages']:
+        senders.setdefault(message['u_id'], array('q')).append(message['message_id'])
+    blobs[SENDERS_BLOB] = pickle.dumps({u_id: message_ids.tobytes()
+                                        for u_id, message_ids in senders.items()},
+                                       pickle.HIGHEST_PROTOCOL)
+
+    # Where each blob starts, counted from the end of the header
+    index = {}
+    offset = 0
+    for name, blob in blobs.items():
+        index[name] = (offset, len(blob))
+        offset += len(blob)
+
+    # Removed messages are the only ones with time_created 0, and the only
+    # ones the index of removed messages needs before they are read
+    removed = [message['message_id'] for message in store['messages']
+               if message['time_created'] == 0]
+
+    header = pickle.dumps({'store': core, 'index': index, 'count': len(store['messages']),
+                           'removed': removed}, pickle.HIGHEST_PROTOCOL)
+    return (SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(header))
+            + header + b''.join(blobs.values()))
+
+def read_snapshot(path):
+
+    '''
+    Function Description:
+        Reads a snapshot, leaving the messages on disk until they are used.
+        Snapshots written before the format was versioned are plain pickles
+        of the store, and those written before channels and dms were stored
+        without their messages are read in full.
+
+    Arguments:
+        path (str)              - the snapshot file
+
+    Exceptions:
+        ValueError              - Occurs when the snapshot was written by a
+                                  newer version
+
+    Return Value:
+        Returns the store
+    '''
+
+    FILE = open(path, 'rb')
+    start = FILE.read(SNAPSHOT_HEADER.size)
+    if not start.startswith(SNAPSHOT_MAGIC):
+        FILE.seek(0)
+        with FILE:
+            return pickle.load(FILE)
+
+    _, version, length = SNAPSHOT_HEADER.unpack(start)
+    if version not in (2, SNAPSHOT_VERSION):
+        FILE.close()
+        raise ValueError(f'Unsupported snapshot version {version}')
+
+    header = pickle.loads(FILE.read(length))
+    hydrator = Hydrator(FILE, SNAPSHOT_HEADER.size + length, header)
+    if version == 2:
+        return hydrator.read_store(header['store'])
+    return hydrator.attach_store(header['store'])
+
+class LazyList(list):
+
+    '''
+    A list of messages which are only read from the snapshot the first time
+    the list is used. Messages appended before then are kept after those
+    read. Pickling or copying it gives a plain list.
+    '''
+
+    def __init__(self, hydrator, loader):
+        super().__init__()
+        self.hydrator = hydrator
+        self.loader = loader
+        self.loaded = False
+
+    def hydrate(self):
+        if not self.loaded:
+            with self.hydrator.lock:
+                if not self.loaded:
+                    self.loader()
+
+    def fill(self, items):
+        list.__setitem__(self, slice(0, 0), items)
+        self.loaded = True
+
+    def append(self, message):
+        list.append(self, message)
+
+    def extend(self, messages):
+        for message in messages:
+            self.append(message)
+
+    def discard(self, message_ids):
+        # Messages read later which were discarded from store['messages']
+        # are left out as they are read
+        list.__setitem__(self, slice(None), [message for message in list.__iter__(self)
+                                             if message['message_id'] not in message_ids])
+
+    def __reduce_ex__(self, protocol):
+        return (list, (), None, iter(self))
+
+# Wraps a list method so the list, and any list it is compared or combined
+# with, is loaded first
+def hydrating(name):
+    method = getattr(list, name)
+
+    def wrapper(self, *args, **kwargs):
+        self.hydrate()
+        for arg in args:
+            if isinstance(arg, LazyList):
+                arg.hydrate()
+        return method(self, *args, **kwargs)
+
+    wrapper.__name__ = name
+    return wrapper
+
+for _name in ('__add__', '__contains__', '__delitem__', '__eq__', '__ge__', '__getitem__',
+              '__gt__', '__iadd__', '__imul__', '__iter__', '__le__', '__len__', '__lt__',
+              '__mul__', '__ne__', '__repr__', '__reversed__', '__rmul__', '__setitem__',
+              'clear', 'copy', 'count', 'index', 'insert', 'pop',
+              'remove', 'reverse', 'sort'):
+    setattr(LazyList, _name, hydrating(_name))
+
+class MessageList(LazyList):
+
+    '''
+    store['messages'] while its messages are still in the snapshot. New
+    messages are appended after those in the snapshot and messages are
+    discarded without reading it, and a message can be found by its
+    message_id by only reading the blob it is saved in. Any other use reads
+    every message.
+    '''
+
+    def __init__(self, hydrator, count):
+        super().__init__(hydrator, hydrator.hydrate)
+
+        # Number of messages in the snapshot, and the message_ids of those
+        # discarded before it was read. The list holds the messages appended
+        # until then.
+        self.count = count
+        self.dropped = set()
+
+    def append(self, message):
+        self.hydrator.messages[message['message_id']] = message
+        list.append(self, message)
+
+    def discard(self, message_ids):
+        for message_id in message_ids:
+            self.hydrator.messages.pop(message_id, None)
+
+        appended = {message['message_id'] for message in list.__iter__(self)}
+        if not self.loaded:
+            self.dropped.update(message_id for message_id in message_ids
+                                if message_id not in appended)
+        list.__setitem__(self, slice(None), [message for message in list.__iter__(self)
+                                             if message['message_id'] not in message_ids])
+
+    def __len__(self):
+        if self.loaded:
+            return list.__len__(self)
+        return self.count - len(self.dropped) + list.__len__(self)
+
+    def appended_since(self, length):
+        appended = len(self) - length
+        held = list(list.__iter__(self))
+        return held[len(held) - appended:] if appended > 0 else []
+
+    def checkpoint(self):
+
+        '''
+        Saves the messages held, returning a function which puts them back
+        given the messages discarded since
+        '''
+
+        loaded = self.loaded
+        held = list(list.__iter__(self))
+        dropped = set(self.dropped)
+
+        def restore(removed):
+            for message in removed:
+                self.hydrator.messages[message['message_id']] = message
+
+            saved = held
+            if self.loaded and not loaded:
+                # The snapshot was read since, the messages read from it are
+                # put back in its order
+                saved = [self.hydrator.messages[message_id] for message_id in self.hydrator.order
+                         if message_id not in dropped] + held
+            list.__setitem__(self, slice(None), saved)
+            self.dropped = dropped
+        return restore
+
+    def locate(self, message_id):
+        return self.hydrator.locate(message_id)
+
+    def read_so_far(self):
+
+        '''
+        Returns the messages read from the snapshot or appended so far
+        '''
+
+        return list(self.hydrator.messages.values())
+
+    def removed_messages(self):
+
+        '''
+        Returns the messages which had been removed but not compacted away
+        when the snapshot was written, reading the blobs they are saved in
+        '''
+
+        located = (self.locate(message_id) for message_id in self.hydrator.removed)
+        return [message for message in located if message is not None]
+
+    def sent_by(self, u_id):
+
+        '''
+        Returns the messages a user sent which are saved in the snapshot,
+        reading the blobs they are saved in
+        '''
+
+        return self.hydrator.sent_by(u_id)
+
+class Hydrator:
+
+    '''
+    Reads the message blobs of a snapshot as they are needed. A channel or dm
+    only reads its own blob, as does finding a message by its message_id,
+    while iterating over store['messages'] reads them all. Message records
+    replayed from the log read the blobs of the messages they change first.
+    '''
+
+    def __init__(self, FILE, offset, header):
+        self.file = FILE
+        self.offset = offset
+        self.index = header['index']
+        self.count = header.get('count', 0)
+
+        # message_ids of the messages which had been removed but not
+        # compacted away when the snapshot was written
+        self.removed = header.get('removed', [])
+
+        # Maps message_id to every message read or appended so far, which
+        # have not been discarded, and the names of the blobs read
+        self.messages = {}
+        self.read = set()
+
+        # Maps the name of each blob to the message list of its channel or dm
+        self.containers = {}
+
+        # The blob names, sorted message_ids and the number of the blob each
+        # is saved in, read when a message is first looked up
+        self.locations = None
+
+        # Maps each u_id to the message_ids the user sent, read when the
+        # messages of a user are first looked up
+        self.senders = None
+
+        self.store = None
+        self.all_messages = None
+        self.order = None
+        self.done = False
+        self.lock = threading.RLock()
+
+    def read_blob(self, name):
+        offset, length = self.index[name]
+        self.file.seek(self.offset + offset)
+        return pickle.loads(self.file.read(length))
+
+    def load_messages(self, name):
+        return self.read_blob(name) if name in self.index else []
+
+    def read_messages(self, name):
+
+        '''
+        Reads the messages of a blob, giving them to the channel or dm they
+        were sent in
+        '''
+
+        with self.lock:
+            if name in self.read:
+                return
+            self.read.add(name)
+
+            messages = self.load_messages(name)
+            if self.all_messages is not None:
+                messages = [message for message in messages
+                            if message['message_id'] not in self.all_messages.dropped]
+            for message in messages:
+                self.messages[message['message_id']] = message
+
+            container = self.containers.get(name)
+            if container is not None and not container.loaded:
+                container.fill(messages)
+
+    def read_store(self, store):
+
+        '''
+        Reads every message of a snapshot whose channels and dms hold the
+        message_ids of their messages
+        '''
+
+        for name in self.index:
+            if name != ORDER_BLOB:
+                self.read_messages(name)
+        store['messages'] = [self.messages[message_id]
+                             for message_id in self.read_blob(ORDER_BLOB)]
+        for kind in CONTAINERS:
+            attach_messages(store, kind, self.messages)
+        self.file.close()
+        return store
+
+    def attach_store(self, store):
+        self.store = store
+        self.all_messages = MessageList(self, self.count)
+        store['messages'] = self.all_messages
+        for kind in CONTAINERS:
+            for container in store[kind]:
+                self.attach(kind, container)
+        return store
+
+    def attach(self, kind, container):
+
+        '''
+        Gives a channel or dm a list which reads its messages when first used
+        '''
+
+        name = f'{kind}_{container[ENTITY_KEYS[kind]]}'
+        messages = LazyList(self, lambda: self.read_messages(name))
+        container['messages'] = messages
+        self.containers[name] = messages
+
+    def locate(self, message_id):
+
+        '''
+        Returns the message with message_id, reading the blob it is saved in,
+        or None if there is no such message
+        '''
+
+        message = self.messages.get(message_id)
+        if message is not None:
+            return message
+
+        with self.lock:
+            if self.done:
+                return None
+            name = self.blob_of(message_id)
+            if name is not None:
+                self.read_messages(name)
+        return self.messages.get(message_id)
+
+    def blob_of(self, message_id):
+
+        '''
+        Returns the name of the blob a message is saved in, or None if it is
+        not in the snapshot
+        '''
+
+        if self.locations is None:
+            names, message_ids, numbers = self.read_blob(LOCATIONS_BLOB)
+            self.locations = (names, array('q', message_ids), array('q', numbers))
+
+        names, message_ids, numbers = self.locations
+        position = bisect_left(message_ids, message_id)
+        if position < len(message_ids) and message_ids[position] == message_id:
+            return names[numbers[position]]
+        return None
+
+    def sent_ids(self, u_id):
+
+        '''
+        Returns the message_ids of the messages with u_id saved in the
+        snapshot
+        '''
+
+        with self.lock:
+            if self.senders is None:
+                if SENDERS_BLOB not in self.index:
+                    # Snapshots written before the senders were saved are
+                    # read in full
+                    self.all_messages.hydrate()
+                    return [message_id for message_id, message in self.messages.items()
+                            if message['u_id'] == u_id]
+                self.senders = self.read_blob(SENDERS_BLOB)
+            return array('q', self.senders.get(u_id, b''))
+
+    def sent_by(self, u_id):
+
+        '''
+        Returns the messages with u_id which are saved in the snapshot and
+        have not been discarded, reading the blobs they are saved in
+        '''
+
+        located = (self.locate(message_id) for message_id in self.sent_ids(u_id))
+        return [message for message in located if message is not None]
+
+    def replay(self, records):
+
+        '''
+        Applies records from the log, first reading the blobs of the messages
+        they change
+        '''
+
+        # Replacing every message, as clear does, or a whole collection of
+        # channels or dms needs them all read first
+        if any(key is None and kind in ('messages',) + CONTAINERS for kind, key, _ in records):
+            self.all_messages.hydrate()
+            apply_records(self.store, records)
+            return
+
+        for kind, key, _ in records:
+            if kind == 'messages':
+                self.locate(key)
+        apply_records(self.store, records, self.messages)
+
+    def hydrate(self):
+
+        '''
+        Reads every message
+        '''
+
+        if self.done:
+            return
+
+        names, self.order = self.contents()
+        for name in names:
+            self.read_messages(name)
+        self.all_messages.fill([self.messages[message_id] for message_id in self.order
+                                if message_id not in self.all_messages.dropped])
+        self.done = True
+        self.close()
+
+    def contents(self):
+
+        '''
+        Returns the names of the blobs of messages and the message_ids of
+        store['messages'] in order
+        '''
+
+        names = [name for name in self.index
+                 if name not in (ORDER_BLOB, LOCATIONS_BLOB, SENDERS_BLOB)]
+        return names, self.read_blob(ORDER_BLOB)
+
+    def close(self):
+        self.file.close()
+
+class SqliteHydrator(Hydrator):
+
+    '''
+    Reads the messages table of an SqliteEngine database as the messages are
+    needed, as Hydrator reads the blobs of a snapshot. The messages of each
+    channel or dm are read together, and the rest as one blob. The database
+    is still written to once it is loaded, so only the rows which were there
+    when it was loaded are read: messages sent since are already in the
+    store, and those changed since were read before they were changed.
+    '''
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.last_seq, count = connection.execute(
+            'SELECT COALESCE(MAX(seq), 0), COUNT(*) FROM messages').fetchone()
+        removed = [message_id for message_id, in connection.execute(
+            'SELECT message_id FROM messages WHERE time_created = 0 ORDER BY seq')]
+        super().__init__(None, 0, {'index': {}, 'count': count, 'removed': removed})
+
+    # Helper which gives the name of the blob a row of the messages table is
+    # read in, from its channel_id and dm_id
+    @staticmethod
+    def blob_name(channel_id, dm_id):
+        location = {key: value for key, value in (('channel_id', channel_id), ('dm_id', dm_id))
+                    if value is not None}
+        return message_blob(location)
+
+    def select(self, columns, condition='1', arguments=()):
+        return self.connection.execute(f'SELECT {columns} FROM messages '
+                                       f'WHERE seq <= ? AND {condition} ORDER BY seq',
+                                       (self.last_seq,) + arguments).fetchall()
+
+    def load_messages(self, name):
+        if name == 'other':
+            rows = self.select('data', 'channel_id IS NULL AND dm_id IS NULL')
+        else:
+            kind, _, key = name.rpartition('_')
+            rows = self.select('data', f'{ENTITY_KEYS[kind]} = ?', (int(key),))
+        return [pickle.loads(data) for data, in rows]
+
+    def blob_of(self, message_id):
+        rows = self.select('channel_id, dm_id', 'message_id = ?', (message_id,))
+        return self.blob_name(*rows[0]) if rows else None
+
+    def sent_ids(self, u_id):
+        with self.lock:
+            return [message_id for message_id, in self.select('message_id', 'u_id = ?', (u_id,))]
+
+    def contents(self):
+        rows = self.select('message_id, channel_id, dm_id')
+        names = dict.fromkeys(self.blob_name(channel_id, dm_id) for _, channel_id, dm_id in rows)
+        return list(names), [message_id for message_id, _, _ in rows]
+
+    def close(self):
+        self.connection.close()
+
+class PickleEngine:
+
+    '''
+    Rewrites the whole store into a single pickle file on every write
+    '''
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+
+    def load(self, initial):
+        # If the file exists, open the data and read
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as FILE:
+                return pickle.load(FILE)
+        return initial
+
+    def write(self, store, records):
+        # Store the data
+        write_atomic(self.path, pickle.dumps(store, pickle.HIGHEST_PROTOCOL))
+
+class LogEngine:
+
+    '''
+    Appends each batch of records to a write-ahead log. Once the log holds
+    compact_every batches it is sealed and a background thread merges it into
+    the snapshot, so startup only replays a short log and request handlers
+    are never blocked by a full rewrite.
+
+    Files:
+        - snapshot_path         - the store as of the last compaction, in
+                                  the format of encode_snapshot
+        - sealed_path           - the log being merged into the snapshot
+        - log_path              - the log new batches are appended to
+    '''
+
+    def __init__(self, snapshot_path=SNAPSHOT_PATH, log_path=LOG_PATH,
+                 compact_every=None):
+        self.snapshot_path = snapshot_path
+        self.log_path = log_path
+        self.sealed_path = f'{log_path}.sealed'
+        self.compact_every = compact_every
+
+        # Number of batches in the log
+        self.logged = 0
+
+        # The empty store the snapshot is built from before the first compaction
+        self.initial = None
+        self.compactor = None
+
+    def load_snapshot(self):
+        if os.path.exists(self.snapshot_path):
+            return read_snapshot(self.snapshot_path)
+        return copy.deepcopy(self.initial)
+
+    def replay(self, store, records):
+        # Messages still in the snapshot are only read when they are needed
+        hydrator = getattr(store['messages'], 'hydrator', None)
+        if hydrator is None:
+            apply_records(store, records)
+        else:
+            hydrator.replay(records)
+
+    def load(self, initial):
+
+        '''
+        Function Description:
+            Recovers the store from the snapshot and the logs. A batch which
+            was only partially written when the server stopped is cut off the
+            end of the log, and a compaction which did not finish is restarted.
+
+        Arguments:
+            initial (dict)          - the store to use when nothing was saved
+
+        Return Value:
+            Returns the recovered store
+        '''
+
+        # A compaction still running could remove the sealed log before it
+        # is read
+        if self.compactor is not None:
+            self.compactor.join()
+
+        self.initial = copy.deepcopy(initial)
+        store = self.load_snapshot()
+
+        # The sealed log is older than the log, so it is replayed first
+        sealed, _ = read_batches(self.sealed_path)
+        batches, size = read_batches(self.log_path)
+        self.replay(store, [record for batch in sealed + batches for record in batch])
+
+        # Remove any partial batch so new batches are appended after the last
+        # complete one
+        if os.path.exists(self.log_path) and os.path.getsize(self.log_path) > size:
+            with open(self.log_path, 'r+b') as FILE:
+                FILE.truncate(size)
+        self.logged = len(batches)
+
+        if sealed:
+            self.compact()
+        return store
+
+    def write(self, store, records):
+        if not records:
+            return
+
+        # Append the whole batch with a single write, and make it durable
+        with open(self.log_path, 'ab') as FILE:
+            FILE.write(encode_batch(records))
+            FILE.flush()
+            os.fsync(FILE.fileno())
+        self.logged += 1
+
+        if self.compact_every is not None and self.logged >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+
+        '''
+        Seals the log and starts merging it into the snapshot in the
+        background. Must not be called while a batch is being written.
+        '''
+
+        # Only one compaction runs at a time, the log keeps growing until the
+        # next write after it finishes
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+
+        # The last compaction may have stopped before the sealed log was merged
+        if not os.path.exists(self.sealed_path):
+            if not os.path.exists(self.log_path):
+                return
+            os.replace(self.log_path, self.sealed_path)
+            self.logged = 0
+
+        self.compactor = threading.Thread(target=self.merge, daemon=True)
+        self.compactor.start()
+
+    def merge(self):
+
+        '''
+        Writes a new snapshot from the old snapshot and the sealed log, then
+        removes the sealed log. Replaying a record twice gives the same result,
+        so stopping anywhere in between only repeats work on the next startup.
+        '''
+
+        store = self.load_snapshot()
+        sealed, _ = read_batches(self.sealed_path)
+        self.replay(store, [record for batch in sealed for record in batch])
+
+        write_atomic(self.snapshot_path, encode_snapshot(store))
+        os.remove(self.sealed_path)
+
+class SqliteEngine:
+
+    '''
+    Keeps every entity as its own row in an SQLite database, so a batch of
+    records only inserts, updates or deletes the rows which changed. Global
+    values such as 'stats' are rows of the meta table.
+
+    Every row but those of the messages table is read when the server
+    starts. Messages are left in the database until they are used, and are
+    then read a channel or dm at a time by a SqliteHydrator.
+
+    Each entity table has a seq column which keeps the order entities were
+    added to their collection, and the columns other than the id and data are
+    indexed so the rows can be looked up without unpickling every one.
+    '''
+
+    # Indexed columns of each entity table, besides its id
+    COLUMNS = {'users': ('email',),
+               'channels': (),
+               'dms': (),
+               'messages': ('channel_id', 'dm_id', 'u_id', 'time_created'),
+               'standups': ()}
+
+    def __init__(self, path=DATABASE_PATH):
+        self.path = path
+
+        # Only used by the thread writing batches, one at a time
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            # Each batch is synced to disk as it is committed, as the log is
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=FULL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS meta '
+                                    '(key TEXT PRIMARY KEY, data BLOB NOT NULL)')
+            for kind, id_key in ENTITY_KEYS.items():
+                columns = ''.join(f', {column}' for column in self.COLUMNS[kind])
+                self.connection.execute(f'CREATE TABLE IF NOT EXISTS {kind} '
+                                        f'(seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                        f'{id_key} INTEGER UNIQUE NOT NULL{columns}, '
+                                        f'data BLOB NOT NULL)')
+                self.add_columns(kind)
+                for column in self.COLUMNS[kind]:
+                    self.connection.execute(f'CREATE INDEX IF NOT EXISTS {kind}_{column} '
+                                            f'ON {kind} ({column})')
+
+    def add_columns(self, kind):
+
+        '''
+        Adds the indexed columns a table written by an older version is
+        missing, filling them in from the data of each row
+        '''
+
+        existing = {row[1] for row in self.connection.execute(f'PRAGMA table_info({kind})')}
+        missing = [column for column in self.COLUMNS[kind] if column not in existing]
+        if not missing:
+            return
+
+        id_key = ENTITY_KEYS[kind]
+        for column in missing:
+            self.connection.execute(f'ALTER TABLE {kind} ADD COLUMN {column}')
+        updates = ', '.join(f'{column} = ?' for column in missing)
+        for key, data in self.connection.execute(f'SELECT {id_key}, data FROM {kind}').fetchall():
+            entity = pickle.loads(data)
+            self.connection.execute(f'UPDATE {kind} SET {updates} WHERE {id_key} = ?',
+                                    [entity.get(column) for column in missing] + [key])
+
+    def load(self, initial):
+
+        '''
+        Function Description:
+            Builds the store from the database by replaying every row but
+            those of the messages table as a record. The messages are read
+            when they are first used.
+
+        Arguments:
+            initial (dict)          - the store to use when nothing was saved
+
+        Return Value:
+            Returns the store
+        '''
+
+        records = [(key, None, data) for key, data
+                   in self.connection.execute('SELECT key, data FROM meta')]
+        for kind, id_key in ENTITY_KEYS.items():
+            if kind != 'messages':
+                records.extend((kind, key, data) for key, data in self.connection.execute(
+                    f'SELECT {id_key}, data FROM {kind} ORDER BY seq'))
+
+        apply_records(initial, sorted(records, key=lambda record: RECORD_ORDER.index(record[0])))
+
+        # Messages are read with a connection of their own, so reading them
+        # never sees a batch being written
+        hydrator = SqliteHydrator(sqlite3.connect(self.path, check_same_thread=False))
+        return hydrator.attach_store(initial)
+
+    def upsert(self, kind, entity, data):
+        id_key = ENTITY_KEYS[kind]
+        columns = (id_key,) + self.COLUMNS[kind] + ('data',)
+        values = [entity[id_key]] + [entity.get(column) for column in self.COLUMNS[kind]]
+        updates = ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+        self.connection.execute(f'INSERT INTO {kind} ({", ".join(columns)}) '
+                                f'VALUES ({", ".join("?" * len(columns))}) '
+                                f'ON CONFLICT ({id_key}) DO UPDATE SET {updates}',
+                                values + [data])
+
+    def write(self, store, records):
+        if not records:
+            return
+
+        # The whole batch is committed as one transaction
+        with self.connection:
+            for kind, key, data in records:
+                if kind not in ENTITY_KEYS:
+                    self.connection.execute('INSERT OR REPLACE INTO meta (key, data) '
+                                            'VALUES (?, ?)', (kind, data))
+                elif key is None:
+                    # The whole collection was replaced
+                    self.connection.execute(f'DELETE FROM {kind}')
+                    for entity in pickle.loads(data):
+                        self.upsert(kind, entity,
+                                    pickle.dumps(entity, pickle.HIGHEST_PROTOCOL))
+                elif data is None:
+                    self.connection.execute(f'DELETE FROM {kind} WHERE {ENTITY_KEYS[kind]} = ?',
+                                            (key,))
+                else:
+                    self.upsert(kind, pickle.loads(data), data)
+
+class ShardEngine:
+
+    '''
+    Splits the store into shards which are each saved in their own file: one
+    for the users, one for each channel (with its messages and standup), one
+    for each dm (with its messages) and one for the global values. A batch of
+    records only rewrites the shards it touches, so a change to one channel
+    never rewrites the rest of the workspace.
+    '''
+
+    def __init__(self, directory=SHARD_DIRECTORY):
+        self.directory = directory
+
+        # Maps each shard name to the {(kind, key): data} records it holds,
+        # and each (kind, key) to the shard holding it
+        self.shards = {}
+        self.locations = {}
+
+    def shard_path(self, name):
+        return os.path.join(self.directory, f'{name}.p')
+
+    def shard_name(self, kind, entity):
+
+        '''
+        Returns the name of the shard an entity belongs in
+        '''
+
+        if kind == 'users':
+            return 'users'
+        if kind in ('channels', 'standups'):
+            return f'channel_{entity["channel_id"]}'
+        if kind == 'dms':
+            return f'dm_{entity["dm_id"]}'
+        if kind == 'messages' and 'channel_id' in entity:
+            return f'channel_{entity["channel_id"]}'
+        if kind == 'messages' and 'dm_id' in entity:
+            return f'dm_{entity["dm_id"]}'
+        return 'globals'
+
+    def load(self, initial):
+
+        '''
+        Function Description:
+            Builds the store by replaying the records of every shard
+
+        Arguments:
+            initial (dict)          - the store to use when nothing was saved
+
+        Return Value:
+            Returns the store
+        '''
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        records = []
+        for filename in os.listdir(self.directory):
+            name, extension = os.path.splitext(filename)
+            if extension != '.p':
+                continue
+            with open(os.path.join(self.directory, filename), 'rb') as FILE:
+                self.shards[name] = pickle.load(FILE)
+            for (kind, key), data in self.shards[name].items():
+                self.locations[(kind, key)] = name
+                records.append((kind, key, data))
+
+        # Entities are put back in the order of their ids
+        records.sort(key=lambda record: (RECORD_ORDER.index(record[0]), record[1] or 0))
+        apply_records(initial, records)
+        return initial
+
+    def put(self, kind, key, data, dirty):
+
+        '''
+        Moves the record for (kind, key) into the shard it belongs in, or
+        removes it when data is None, adding the shards changed to dirty
+        '''
+
+        old = self.locations.pop((kind, key), None)
+        if old is not None:
+            del self.shards[old][(kind, key)]
+            dirty.add(old)
+        if data is None:
+            return
+
+        if key is None:
+            name = 'globals'
+        else:
+            name = self.shard_name(kind, pickle.loads(data))
+        self.shards.setdefault(name, {})[(kind, key)] = data
+        self.locations[(kind, key)] = name
+        dirty.add(name)
+
+    def write(self, store, records):
+        dirty = set()
+        for kind, key, data in records:
+            if key is None and kind in ENTITY_KEYS:
+                # The whole collection was replaced
+                for location in [location for location in self.locations
+                                 if location[0] == kind]:
+                    self.put(kind, location[1], None, dirty)
+                for entity in pickle.loads(data):
+                    self.put(kind, entity[ENTITY_KEYS[kind]],
+                             pickle.dumps(entity, pickle.HIGHEST_PROTOCOL), dirty)
+            else:
+                self.put(kind, key, data, dirty)
+
+        for name in dirty:
+            if self.shards[name]:
+                write_atomic(self.shard_path(name),
+                             pickle.dumps(self.shards[name], pickle.HIGHEST_PROTOCOL))
+            else:
+                del self.shards[name]
+                if os.path.exists(self.shard_path(name)):
+                    os.remove(self.shard_path(name))
+
+class Flusher:
+
+    '''
+    Group commit for every engine except the PickleEngine. Records from many
+    calls to Datastore.set are coalesced, so an entity changed several times
+    is only written once, and a background thread writes them as a single
+    batch at most interval seconds after they were added, or as soon as
+    batch_size records are waiting.
+    '''
+
+    def __init__(self, engine, interval, batch_size):
+        self.engine = engine
+        self.interval = interval
+        self.batch_size = batch_size
+
+        # Maps (kind, key) to the latest data waiting to be written
+        self.pending = {}
+        self.condition = threading.Condition()
+
+        # Held while writing to the engine, so batches are written in order
+        self.lock = threading.Lock()
+
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+
+    def add(self, records):
+
+        '''
+        Queues records to be written by the background thread
+        '''
+
+        with self.condition:
+            for kind, key, data in records:
+                # A whole collection supersedes the entities queued before it
+                if key is None and kind in ENTITY_KEYS:
+                    for queued in [queued for queued in self.pending
+                                   if queued[0] == kind and queued[1] is not None]:
+                        del self.pending[queued]
+
+                # Only the latest data for each entity is kept
+                self.pending[(kind, key)] = data
+
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify()
+
+    def take(self):
+        records = [(kind, key, data) for (kind, key), data in self.pending.items()]
+        self.pending = {}
+        return records
+
+    def flush(self):
+
+        '''
+        Writes every queued record before returning
+        '''
+
+        with self.lock:
+            with self.condition:
+                records = self.take()
+            self.engine.write(None, records)
+
+    def run(self):
+        while True:
+            with self.condition:
+                # Wait for the first record, then give others interval
+                # seconds to join the batch
+                self.condition.wait_for(lambda: self.pending)
+                self.condition.wait_for(lambda: len(self.pending) >= self.batch_size,
+                                        self.interval)
+            self.flush()
+
+def make_engine(mode, compact_every=None):
+
+    '''
+    Returns the storage engine for the given persistence mode, either 'log',
+    'sqlite', 'shards' or 'pickle'
+    '''
+
+    if mode == 'pickle':
+        return PickleEngine()
+    if mode == 'log':
+        return LogEngine(compact_every=compact_every)
+    if mode == 'sqlite':
+        return SqliteEngine()
+    if mode == 'shards':
+        return ShardEngine()
+    raise ValueError(f'Unknown persistence mode {mode}')
@@ -0,0 +1,112 @@
+'''
+time_series.py implementation
+
+    Description:
+        Bounded history of a statistic, keeping its most recent points as they
+        were recorded and rolling older ones up into per-minute, per-hour and
+        per-day buckets
+
+    Classes:
+        - TimeSeries
+
+    Functions:
+        - new_time_series(name, value, time_stamp)
+'''
+
+from src import config
+from src.error import InputError
+
+# Maps each resolution to the width of its buckets in seconds and the number of
+# buckets kept, from the finest to the coarsest. Buckets rolled out of one
+# resolution are merged into the next, and the oldest days are dropped.
+RESOLUTIONS = {'minute': (60, 1440),
+               'hour': (3600, 720),
+               'day': (86400, 1000)}
+
+class TimeSeries:
+
+    '''
+    The values of a statistic over time, listed as {name: value, 'time_stamp'}
+    dicts. Up to raw_points of the newest points are kept as they are. Older
+    points are rolled up into buckets, each holding the last value recorded
+    in it and when it was recorded, so a statistic which is a running count
+    reads the same at the end of every bucket.
+    '''
+
+    def __init__(self, name, raw_points):
+        self.name = name
+        self.raw_points = raw_points
+        self.raw = []
+
+        # Maps each resolution to its buckets as (time_stamp, value), oldest
+        # first. Every bucket of a coarser resolution is older than those of a
+        # finer one
+        self.buckets = {resolution: [] for resolution in RESOLUTIONS}
+
+    def add(self, value, time_stamp):
+        self.raw.append((time_stamp, value))
+        if len(self.raw) > self.raw_points:
+            point = self.raw.pop(0)
+            for resolution, (width, limit) in RESOLUTIONS.items():
+                point = merge(self.buckets[resolution], point, width, limit)
+                if point is None:
+                    break
+
+    def __len__(self):
+        return len(self.raw) + sum(len(buckets) for buckets in self.buckets.values())
+
+    def __eq__(self, other):
+        return (isinstance(other, TimeSeries) and self.name == other.name
+                and self.raw == other.raw and self.buckets == other.buckets)
+
+    def points(self, time_start=None, time_end=None, resolution=None):
+
+        '''
+        Returns the points recorded from time_start to time_end inclusive,
+        oldest first. Given a resolution, points are merged into buckets of
+        that width, while those already rolled up into coarser buckets are
+        kept as they are.
+        '''
+
+        if resolution is not None and resolution not in RESOLUTIONS:
+            raise InputError(description='Resolution must be one of ' +
+                             ', '.join(RESOLUTIONS))
+        if time_start is not None and time_end is not None and time_start > time_end:
+            raise InputError(description='time_start cannot be after time_end')
+
+        points = []
+        for bucket_resolution in reversed(list(RESOLUTIONS)):
+            points.extend(self.buckets[bucket_resolution])
+        points.extend(self.raw)
+
+        points = [(time_stamp, value) for time_stamp, value in points
+                  if (time_start is None or time_stamp >= time_start)
+                  and (time_end is None or time_stamp <= time_end)]
+
+        if resolution is not None:
+            merged = []
+            for point in points:
+                merge(merged, point, RESOLUTIONS[resolution][0], None)
+            points = merged
+
+        return [{self.name: value, 'time_stamp': time_stamp} for time_stamp, value in points]
+
+# Starts the history of a statistic from its first value
+def new_time_series(name, value, time_stamp):
+    series = TimeSeries(name, config.stats_raw_points)
+    series.add(value, time_stamp)
+    return series
+
+# Helper which merges a point into the last bucket if it falls within the same
+# width of time, otherwise appends it. Returns the oldest bucket dropped to
+# stay within limit, or None
+def merge(buckets, point, width, limit):
+
+    if buckets and buckets[-1][0] // width == point[0] // width:
+        buckets[-1] = point
+        return None
+
+    buckets.append(point)
+    if limit is not None and len(buckets) > limit:
+        return buckets.pop(0)
+    return None
@@ -0,0 +1,79 @@
+'''
+token_cache.py implementation
+
+    Description:
+        Cache of tokens which have already been verified, so a client sending
+        the same token again skips the signature check
+
+    Classes:
+        - TokenCache
+'''
+
+import threading
+from collections import OrderedDict
+
+class TokenCache:
+
+    '''
+    Maps verified tokens to their decoded body, keeping at most size tokens
+    and dropping the least recently used first. Every token of a session is
+    dropped when the session ends.
+    '''
+
+    def __init__(self, size):
+        self.size = size
+        self.tokens = OrderedDict()
+
+        # Maps each session_id to its cached tokens
+        self.sessions = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, token):
+
+        '''
+        Returns the decoded body of a cached token, or None if it is not cached
+        '''
+
+        with self.lock:
+            body = self.tokens.get(token)
+            if body is None:
+                self.misses += 1
+                return None
+            self.tokens.move_to_end(token)
+            self.hits += 1
+            return body
+
+    def add(self, token, body):
+        with self.lock:
+            self.tokens[token] = body
+            self.sessions.setdefault(body['session_id'], set()).add(token)
+
+            while len(self.tokens) > self.size:
+                oldest, oldest_body = self.tokens.popitem(last=False)
+                self.discard_session_token(oldest_body['session_id'], oldest)
+
+    def discard_session_token(self, session_id, token):
+        tokens = self.sessions.get(session_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self.sessions[session_id]
+
+    def invalidate(self, session_id):
+
+        '''
+        Drops every cached token of a session
+        '''
+
+        with self.lock:
+            for token in self.sessions.pop(session_id, set()):
+                self.tokens.pop(token, None)
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'size': len(self.tokens)}
@@ -12,15 +12,13 @@ users.py implementation
             - user_profile_setemail(token, email)
             - user_profile_sethandle(token, handle)
             -user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end)
-            - user_stats(token)
-            - users_stats(token)
+            - user_stats(token, time_start, time_end, resolution)
+            - users_stats(token, time_start, time_end, resolution)
         - Helper functions:
             - handle_in_use(handle, store)
             - search_user_token(token,users)
             - filter_user_info(user)
             - search_all_uids(u_id, store) 
-            - num_dm_removed(dms)
-            - num_msg_removed(msgs)
 '''
 
 import re, datetime, time
@@ -28,15 +26,14 @@ from src.error import InputError, AccessError
 from src.data_store import data_store
 from src.helpers import search_user_token, \
                         filter_user_info, \
-                        search_all_uids, \
-                        num_dm_removed, \
-                        num_msg_removed
+                        search_all_uids
 from src.auth import handle_in_use
 import requests
 from PIL import Image
 import urllib.request
 from src import config
 
+@data_store.read()
 def users_all(token):
 
     '''
@@ -76,6 +73,7 @@ def users_all(token):
 
     return {"users": res}
 
+@data_store.read()
 def user_profile(token, u_id):
 
     '''
@@ -117,6 +115,7 @@ def user_profile(token, u_id):
     # Filter the user's info
     return {'user': filtered_info}
 
+@data_store.transaction()
 def user_profile_setname(token, name_first, name_last): 
      
     '''
@@ -140,8 +139,6 @@ def user_profile_setname(token, name_first, name_last):
     
     store = data_store.get()
     users = store['users']
-    channels = store['channels']
-    dms = store['dms']
 
     # If token is invalid
     curr_user = search_user_token(token, users)
@@ -156,46 +153,14 @@ def user_profile_setname(token, name_first, name_last):
     if (len(name_last) > 50) or (name_last == ''):
         raise InputError("Please enter a valid last name")
     
-    # Find the current user u_id
-    curr_uid = curr_user['u_id']
-    
-    # Loop through to find the right user info to modify
-    for user in users:
-        if curr_uid == user["u_id"]:
-            user["name_first"] = name_first
-            user["name_last"] = name_last
-    
-    # Loop through channels to change the user's names 
-    for channel in channels:
-        for user in channel['owner_members']:
-            if user['u_id'] == curr_uid:
-
-                user["name_first"] = name_first
-                user["name_last"] = name_last
-
-        for user in channel['all_members']:
-            if user['u_id'] == curr_uid:
-
-                user["name_first"] = name_first
-                user["name_last"] = name_last
-                
-    # Loop through dms to change the user's names 
-    for dm in dms:
-        for user in dm['members']:
-            if user['u_id'] == curr_uid:
-
-                user["name_first"] = name_first
-                user["name_last"] = name_last
-
-        if curr_uid == dm['creator']['u_id']:
-
-            dm['creator']["name_first"] = name_first
-            dm['creator']["name_last"] = name_last
-
-    data_store.set(store)
+    # Modify the user info, members of channels and dms are shown from it
+    data_store.mark('users', curr_user)
+    curr_user["name_first"] = name_first
+    curr_user["name_last"] = name_last
 
     return {}
 
+@data_store.transaction()
 def user_profile_setemail(token, email): 
    
     '''
@@ -218,8 +183,6 @@ def user_profile_setemail(token, email):
     
     store = data_store.get()
     users = store['users']
-    channels = store['channels']
-    dms = store['dms']
 
     # If token is invalid
     curr_user = search_user_token(token, users)
@@ -236,47 +199,18 @@ def user_profile_setemail(token, email):
     if not re.fullmatch(regular_expression, email):
         raise InputError(description="Please enter a valid email address")
     
-    for user in users:
-        # If existing users email is identical to the entered email, its a
-        # duplicate, so raise inputerror
-        if user['email'] == email:
-            raise InputError(description="Duplicate email")
+    # If existing users email is identical to the entered email, its a
+    # duplicate, so raise inputerror
+    if data_store.find('emails', email) is not None:
+        raise InputError(description="Duplicate email")
 
-    # Find the current user u_id
-    curr_uid = curr_user['u_id']
-    
-    # Loop through to find the right user info to modify
-    for user in users:
-        if curr_uid == user["u_id"]:
-            user["email"] = email
-    
-    # Loop through channels to modify the user's email
-    for channel in channels:
-        for user in channel['owner_members']:
-            if user['u_id'] == curr_uid:
-
-                user["email"] = email
-
-        for user in channel['all_members']:
-            if user['u_id'] == curr_uid:
-
-                user["email"] = email
-                
-    # Loop through dms to modify the user's email
-    for dm in dms:
-        for user in dm['members']:
-            if user['u_id'] == curr_uid:
-
-                user["email"] = email
-
-        if curr_uid == dm['creator']['u_id']:
-
-            dm['creator']["email"] = email
-
-    data_store.set(store)
+    # Modify the user info, members of channels and dms are shown from it
+    data_store.mark('users', curr_user)
+    curr_user["email"] = email
 
     return {}
 
+@data_store.transaction()
 def user_profile_sethandle(token, handle): 
     
     '''
@@ -299,8 +233,6 @@ def user_profile_sethandle(token, handle):
 
     store = data_store.get()
     users = store['users']
-    channels = store['channels']
-    dms = store['dms']
 
     # If token is invalid
     curr_user = search_user_token(token, users)
@@ -319,41 +251,13 @@ def user_profile_sethandle(token, handle):
     if handle_in_use(handle, store) is True:
         raise InputError("This handle has alraedy been taken :(")
 
-    # Find the current user u_id
-    curr_uid = curr_user['u_id']
-    
-    # Loop through to find the right user info to modify
-    for user in users:
-        if curr_uid == user["u_id"]:
-            user["handle_str"] = handle
-    
-    # Loop through channels to modify the user's handle
-    for channel in channels:
-        for user in channel['owner_members']:
-            if user['u_id'] == curr_uid:
-
-                user["handle_str"] = handle
-
-        for user in channel['all_members']:
-            if user['u_id'] == curr_uid:
-
-                user["handle_str"] = handle
-                
-    # Loop through dms to modify the user's handle
-    for dm in dms:
-        for user in dm['members']:
-            if user['u_id'] == curr_uid:
-
-                user["handle_str"] = handle
-
-        if curr_uid == dm['creator']['u_id']:
-
-            dm['creator']["handle_str"] = handle
-
-    data_store.set(store)
+    # Modify the user info, members of channels and dms are shown from it
+    data_store.mark('users', curr_user)
+    curr_user["handle_str"] = handle
 
     return {}
 
+@data_store.transaction()
 def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end):
     """
     Function uploads an image using a http url cropped to the user's specification as the 
@@ -383,8 +287,6 @@ def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end):
 
     store = data_store.get()
     users = store['users']
-    channels = store['channels']
-    dms = store['dms']
     curr_user = search_user_token(token, users)
     ''
     # If token is invalid
@@ -434,47 +336,33 @@ def user_profile_uploadphoto(token, img_url, x_start, y_start, x_end, y_end):
 
     user_profile_img_url = config.url + "static/user" + str(curr_uid) + ".jpg"
 
-    # Store the profile image url inside the users data
-    for user in users:
-        if user["u_id"] == curr_uid:
-            user["profile_img_url"] = user_profile_img_url
-    
-    # Store the profile image_url inside the channel data
-    for channel in channels:
-        # Store the profile image_url inside the channel owner_members data
-        for user in channel["owner_members"]:
-            if user['u_id'] == curr_uid:
-                user["profile_img_url"] = user_profile_img_url
-        # Store the profile image_url inside the channel all_members data
-        for user in channel['all_members']:
-            if user['u_id'] == curr_uid:
-                user["profile_img_url"] = user_profile_img_url
-
-    # Store the profiel image url inside the dms data
-    for dm in dms:
-        # Store the profile image_url inside the dms all_members data
-        for user in dm['members']:
-            if user['u_id'] == curr_uid:
-                user["profile_img_url"] = user_profile_img_url
-
-        if dm['creator']['u_id'] == curr_uid:
-            dm['creator']["profile_img_url"] = user_profile_img_url
+    # Store the profile image url inside the users data, members of channels
+    # and dms are shown from it
+    data_store.mark('users', curr_user)
+    curr_user["profile_img_url"] = user_profile_img_url
     
-    data_store.set(store)
-
     return {}
     
-def user_stats(token):
+@data_store.read()
+def user_stats(token, time_start=None, time_end=None, resolution=None):
     
     '''
     Function Description:
         Fetches the required statistics about this user's use of UNSW Streams.
+        Older points of each statistic are rolled up into per-minute, per-hour
+        and per-day buckets.
 
     Arguments:
         token (string)      - token of the user
+        time_start (int)    - only points recorded at or after this time, if given
+        time_end (int)      - only points recorded at or before this time, if given
+        resolution (string) - 'minute', 'hour' or 'day' to merge the points
+                              into buckets of that width, if given
 
     Exceptions:
         AccessError         - When the token is invalid
+        InputError          - When the resolution is invalid
+                            - When time_start is after time_end
         
     Return Value:
         Returns {user_stats} given valid token
@@ -489,42 +377,19 @@ def user_stats(token):
     if registered_user is None:
         raise AccessError(description="Token entered is invalid")
     
-    # Initialise all values to be zero
-    num_channels_joined = 0
-    num_dms_joined = 0
-    num_messages_sent = 0
     involvement = 0.0
     
-    # Loop through all channels
-    for channels in store['channels']:
-        # In each channel, loop through the all_members list
-        for member in channels['all_members']:
-            # If the user is in the channel, iterate num_channels
-            if member['u_id'] == registered_user['u_id']:
-                num_channels_joined += 1
+    # Count the channels and dms the user is a member of and the messages
+    # they have sent
+    indexes = data_store.get_indexes()
+    num_channels_joined = indexes.num_joined('channels', registered_user['u_id'])
+    num_dms_joined = indexes.num_joined('dms', registered_user['u_id'])
+    num_messages_sent = registered_user['user_stats']['num_messages_sent']
     
-    # Loop through all dms
-    for dm in store['dms']:
-        # In each channel, loop through the members list
-        for member in dm['members']:
-            # If the user is in the dm, iterate num_dms
-            if member['u_id'] == registered_user['u_id']:
-                num_dms_joined += 1
-    
-    # Loop through all messages
-    for message in store['messages']:
-        # If the user sent the message, iterate num_msg
-        if message['u_id'] == registered_user['u_id']:
-            num_messages_sent += 1
-    
-    # Find the number of removed dms and messages
-    num_removed_dm = num_dm_removed(store['dms'])
-    num_removed_msg = num_msg_removed(store['messages'])
-    
-    # Find the number of channels, dms and messages
+    # Find the number of channels, dms and messages which have not been removed
     all_channels = len(store['channels'])
-    all_dms = len(store['dms']) - num_removed_dm
-    all_msgs = len(store['messages']) - num_removed_msg
+    all_dms = indexes.count('dms_exist')
+    all_msgs = store['stats']['num_messages_exist']
     
     # Calculate numerator and denominator following the pseudocode
     numerator = num_channels_joined + num_dms_joined + num_messages_sent
@@ -538,46 +403,34 @@ def user_stats(token):
     if involvement > 1:
         involvement = 1.0
     
-    # Save involvement
-    registered_user['user_stats']['involvement_rate'] = involvement
-    
-    data_store.set(store)
-    
-    return {'user_stats': registered_user['user_stats']}
+    # Return the points of the user's stats with their involvement, as reading
+    # the stats does not change the store
+    stats = registered_user['user_stats']
+    points = {name: stats[name].points(time_start, time_end, resolution)
+              for name in ('channels_joined', 'dms_joined', 'messages_sent')}
+    points['involvement_rate'] = involvement
+    return {'user_stats': points}
 
-def is_in_a_channel(user, store):
-    
-    # Loop through all channels
-    for channels in store:
-        # In each channel, loop through the all_members list
-        for member in channels['all_members']:
-            # If the user is in the channel, iterate num_channels
-            if member['u_id'] == user['u_id']:
-                return True
-    return False
-            
-def is_in_a_dm(user, store):
-    
-    # Loop through all dms
-    for dm in store:
-        # In each channel, loop through the members list
-        for member in dm['members']:
-            # If the user is in the dm, iterate num_dms
-            if member['u_id'] == user['u_id']:
-                return True
-    return False
-
-def users_stats(token):
+@data_store.read()
+def users_stats(token, time_start=None, time_end=None, resolution=None):
     
     '''
     Function Description:
         Fetches the required statistics about the use of UNSW Streams.
+        Older points of each statistic are rolled up into per-minute, per-hour
+        and per-day buckets.
 
     Arguments:
         token (string)      - token of the user
+        time_start (int)    - only points recorded at or after this time, if given
+        time_end (int)      - only points recorded at or before this time, if given
+        resolution (string) - 'minute', 'hour' or 'day' to merge the points
+                              into buckets of that width, if given
 
     Exceptions:
         AccessError         - When the token is invalid
+        InputError          - When the resolution is invalid
+                            - When time_start is after time_end
         
     Return Value:
         Returns {workspace_stats} given valid token
@@ -592,33 +445,20 @@ def users_stats(token):
     if registered_user is None:
         raise AccessError(description="Token entered is invalid")
     
-    # Initialise values to be 0
-    utilisation = 0.0
-    num_users_in_none = 0
-    removed_users = 0
-    
-    # Loop through to find the number of removed users and none users
-    for user in store['users']:
-        # If the user is not removed
-        if user['permission_id'] != 0:
-            # Check if they're a part of a channel or dm
-            if is_in_a_channel(user, store['channels']) == False\
-                and is_in_a_dm(user, store['dms']) == False:
-                num_users_in_none += 1
-        # Otherwise, user is removed
-        else:
-            removed_users += 1
-
-    # Calculate numerator and denominator and utilisation according to the pseudocode
-    numerator = len(store['users']) - removed_users - num_users_in_none
-    denominator = len(store['users']) - removed_users
+    # Count the users who are in at least one channel or dm, and the users
+    # who have not been removed. Removed users have left every channel and dm
+    indexes = data_store.get_indexes()
+    numerator = indexes.num_involved()
+    denominator = indexes.count('users_exist')
+
+    # Calculate utilisation according to the pseudocode
     utilisation = numerator / denominator
     
-    registered_user['workspace_stats'] = store['stats']
-    
-    registered_user['workspace_stats']['utilization_rate'] = utilisation
-    
-    data_store.set(store)
-    
-    return {'workspace_stats': registered_user['workspace_stats']}
+    # Return the points of the workspace stats with the utilization, as
+    # reading the stats does not change the store
+    workspace_stats = store['stats']
+    points = {name: workspace_stats[name].points(time_start, time_end, resolution)
+              for name in ('channels_exist', 'dms_exist', 'messages_exist')}
+    points['utilization_rate'] = utilisation
+    return {'workspace_stats': points}
 
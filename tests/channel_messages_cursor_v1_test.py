@@ -0,0 +1,120 @@
+import pytest
+import requests
+from src import config
+from tests.test_helpers import invalid_token3
+
+@pytest.fixture
+def clear_data():
+    requests.delete(config.url + "clear/v1")
+
+# Helper which registers a user and returns their token
+def register_user(email):
+    register_response = requests.post(config.url + 'auth/register/v2',
+                                      json={'email': email,
+                                            'password': 'validpassword123',
+                                            'name_first': 'Justin',
+                                            'name_last': 'Son'})
+    return register_response.json()['token']
+
+# Helper which creates a channel and returns its channel_id
+def create_channel(token):
+    channel_create_response = requests.post(config.url + 'channels/create/v2',
+                                            json={'token': token,
+                                                  'name': 'Channel_1',
+                                                  'is_public': True})
+    return channel_create_response.json()['channel_id']
+
+# Helper which sends a message to a channel and returns its message_id
+def send_message(token, channel_id, message):
+    send_response = requests.post(config.url + 'message/send/v1',
+                                  json={'token': token,
+                                        'channel_id': channel_id,
+                                        'message': message})
+    return send_response.json()['message_id']
+
+# Helper which gets a page of messages
+def get_page(token, channel_id, cursor):
+    return requests.get(config.url + 'channel/messages/cursor/v1',
+                        params={'token': token,
+                                'channel_id': channel_id,
+                                'cursor': cursor})
+
+# Test if accesserror is raised if token is invalid
+def test_messages_cursor_invalid_token(clear_data):
+
+    token = register_user('justin@gmail.com')
+    channel_id = create_channel(token)
+
+    assert get_page(invalid_token3(), channel_id, '').status_code == 403
+
+# Test if inputerror is raised if channel_id does not exist
+def test_messages_cursor_invalid_channel(clear_data):
+
+    token = register_user('justin@gmail.com')
+
+    assert get_page(token, 1, '').status_code == 400
+
+# Test if accesserror is raised if the user is not a member of the channel
+def test_messages_cursor_not_member(clear_data):
+
+    token = register_user('justin@gmail.com')
+    token2 = register_user('cynthia@gmail.com')
+    channel_id = create_channel(token)
+
+    assert get_page(token2, channel_id, '').status_code == 403
+
+# Test if inputerror is raised if the cursor is not a cursor of the channel
+def test_messages_cursor_invalid_cursor(clear_data):
+
+    token = register_user('justin@gmail.com')
+    channel_id = create_channel(token)
+    other_channel_id = create_channel(token)
+    send_message(token, channel_id, 'hello')
+
+    assert get_page(token, channel_id, 'not a cursor').status_code == 400
+
+    # A message of another channel
+    message_id = send_message(token, other_channel_id, 'hello')
+    for _ in range(51):
+        send_message(token, other_channel_id, 'hello')
+    cursor = get_page(token, other_channel_id, '').json()['next_cursor']
+    assert cursor != ''
+    assert get_page(token, channel_id, cursor).status_code == 400
+
+# Test that an empty channel gives no messages and no next page
+def test_messages_cursor_empty(clear_data):
+
+    token = register_user('justin@gmail.com')
+    channel_id = create_channel(token)
+
+    response = get_page(token, channel_id, '')
+    assert response.status_code == 200
+    assert response.json() == {'messages': [], 'next_cursor': ''}
+
+# Test that paging back through a channel gives every message once, newest
+# first, while new messages are sent and others are removed
+def test_messages_cursor_pages(clear_data):
+
+    token = register_user('justin@gmail.com')
+    channel_id = create_channel(token)
+    message_ids = [send_message(token, channel_id, f'message {num}') for num in range(120)]
+
+    first_page = get_page(token, channel_id, '').json()
+    assert [message['message_id'] for message in first_page['messages']] == \
+        message_ids[::-1][:50]
+
+    # Messages sent and removed after the first page do not move the next one
+    for num in range(10):
+        send_message(token, channel_id, f'new message {num}')
+    requests.delete(config.url + 'message/remove/v1',
+                    json={'token': token, 'message_id': message_ids[60]})
+
+    second_page = get_page(token, channel_id, first_page['next_cursor']).json()
+    third_page = get_page(token, channel_id, second_page['next_cursor']).json()
+    assert third_page['next_cursor'] == ''
+
+    returned = [message['message_id'] for page in (first_page, second_page, third_page)
+                for message in page['messages']]
+    expected = message_ids[::-1]
+    expected.remove(message_ids[60])
+    assert returned == expected
@@ -0,0 +1,60 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Importing the data store loads the store saved in the working directory, so
+# each script runs in its own process in a directory of its own
+def run(directory, script):
+    result = subprocess.run([sys.executable, '-c', script], cwd=directory,
+                            env=dict(os.environ, PYTHONPATH=ROOT),
+                            capture_output=True, text=True, timeout=60, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+# Prints the message_ids of store['messages'] and of the channel, the next
+# message_id and the number of messages which exist
+REPORT = '''
+store = data_store.get()
+print(json.dumps([[message['message_id'] for message in store['messages']],
+                  [message['message_id'] for message in store['channels'][0]['messages']],
+                  store['message_ids'], store['stats']['num_messages_exist']]))
+'''
+
+# Test that a message sent and then compacted away in a transaction which
+# raises is taken back out, leaving the store as it was saved
+def test_rollback_append_then_remove(tmp_path):
+
+    rolled_back = run(tmp_path, '''
+import json
+from src.auth import auth_register_v1
+from src.channels import channels_create_v1
+from src.data_store import data_store
+from src.error import InputError
+from src.message import message_send, message_remove, compact_removed_messages
+from src.other import clear_v1
+
+clear_v1()
+token = auth_register_v1('a@gmail.com', 'password', 'A', 'B')['token']
+channel_id = channels_create_v1(token, 'chan', True)['channel_id']
+message_send(token, channel_id, 'one')
+message_remove(token, message_send(token, channel_id, 'two')['message_id'])
+
+try:
+    with data_store.transaction():
+        message_send(token, channel_id, 'three')
+        compact_removed_messages()
+        raise InputError(description='rolled back')
+except InputError:
+    pass
+
+assert data_store.find('messages', 3) is None
+assert data_store.find('removed', 2) is not None
+data_store.flush()
+''' + REPORT)
+
+    assert rolled_back == [[1, 2], [1, 2], 3, 1]
+
+    loaded = run(tmp_path, 'import json\nfrom src.data_store import data_store\n' + REPORT)
+    assert loaded == rolled_back
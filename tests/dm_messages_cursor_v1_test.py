@@ -0,0 +1,95 @@
+import pytest
+import requests
+from src import config
+from tests.test_helpers import invalid_token2
+
+@pytest.fixture
+def clear_data():
+    requests.delete(config.url + "clear/v1")
+
+# Helper which registers a user and returns their register response
+def register_user(email):
+    register_response = requests.post(config.url + "auth/register/v2",
+                                      json={'email': email,
+                                            'password': 'passwordispassword',
+                                            'name_first': 'Justin',
+                                            'name_last': 'Son'})
+    return register_response.json()
+
+# Helper which creates a dm and returns its dm_id
+def create_dm(token, u_ids):
+    dm_create_response = requests.post(config.url + "dm/create/v1",
+                                       json={'token': token,
+                                             'u_ids': u_ids})
+    return dm_create_response.json()['dm_id']
+
+# Helper which sends a message to a dm and returns its message_id
+def send_dm(token, dm_id, message):
+    send_response = requests.post(config.url + "message/senddm/v1",
+                                  json={'token': token,
+                                        'dm_id': dm_id,
+                                        'message': message})
+    return send_response.json()['message_id']
+
+# Helper which gets a page of dm messages
+def get_page(token, dm_id, cursor):
+    return requests.get(config.url + "dm/messages/cursor/v1",
+                        params={'token': token,
+                                'dm_id': dm_id,
+                                'cursor': cursor})
+
+# Test if InputError status code is returned if dm is invalid
+def test_dm_messages_cursor_invalid_dm(clear_data):
+
+    token = register_user('hyunseo@gmail.com')['token']
+
+    assert get_page(token, 100, '').status_code == 400
+
+# Test if AccessError status code is returned if token is invalid
+def test_dm_messages_cursor_invalid_token(clear_data):
+
+    token = register_user('hyunseo@gmail.com')['token']
+    dm_id = create_dm(token, [])
+
+    assert get_page(invalid_token2(), dm_id, '').status_code == 403
+
+# Test if AccessError status code is returned if the user is not a member
+def test_dm_messages_cursor_not_member(clear_data):
+
+    token = register_user('hyunseo@gmail.com')['token']
+    token2 = register_user('cynthia@gmail.com')['token']
+    dm_id = create_dm(token, [])
+
+    assert get_page(token2, dm_id, '').status_code == 403
+
+# Test if InputError status code is returned if the cursor is invalid
+def test_dm_messages_cursor_invalid_cursor(clear_data):
+
+    token = register_user('hyunseo@gmail.com')['token']
+    dm_id = create_dm(token, [])
+    send_dm(token, dm_id, 'hello')
+
+    assert get_page(token, dm_id, '!!!').status_code == 400
+
+# Test that paging back through a dm gives every message once, newest first,
+# while both members keep sending messages
+def test_dm_messages_cursor_pages(clear_data):
+
+    user_1 = register_user('hyunseo@gmail.com')
+    user_2 = register_user('cynthia@gmail.com')
+    dm_id = create_dm(user_1['token'], [user_2['auth_user_id']])
+    message_ids = [send_dm(user_1['token'], dm_id, f'message {num}') for num in range(70)]
+
+    returned = []
+    cursor = ''
+    while True:
+        page = get_page(user_2['token'], dm_id, cursor).json()
+        returned.extend(message['message_id'] for message in page['messages'])
+        send_dm(user_2['token'], dm_id, 'still sending')
+        cursor = page['next_cursor']
+        if cursor == '':
+            break
+
+    assert returned == message_ids[::-1]
+    assert all(page_message['reacts'][0]['is_this_user_reacted'] is False
+               for page_message in page['messages'])
@@ -0,0 +1,389 @@
+import time
+from src import config
+from src.indexes import Indexes
+
+def make_store():
+    return {'users': [{'u_id': 1}, {'u_id': 2}],
+            'channels': [{'channel_id': 1, 'messages': []}],
+            'dms': []}
+
+# Test that an index is only built when first used, and finds entities by id
+def test_find():
+
+    store = make_store()
+    indexes = Indexes(store)
+    assert indexes.tables == {}
+
+    assert indexes.find('users', 2) is store['users'][1]
+    assert indexes.find('users', 3) is None
+    assert indexes.find('users', [1]) is None
+    assert list(indexes.tables) == ['users']
+
+# Test that messages are found by their message_id, including removed ones
+def test_find_message():
+
+    messages = [{'message_id': 1, 'time_created': 0},
+                {'message_id': 2, 'time_created': 100}]
+    indexes = Indexes({'messages': messages})
+    assert indexes.find('messages', 1) is messages[0]
+    assert indexes.find('messages', 2) is messages[1]
+
+    message = {'message_id': 3, 'time_created': 200}
+    messages.append(message)
+    indexes.update('messages', message)
+    assert indexes.find('messages', 3) is message
+
+# Test that marked entities keep the built indexes up to date
+def test_update_and_remove():
+
+    store = make_store()
+    indexes = Indexes(store)
+    assert indexes.find('channels', 2) is None
+
+    channel = {'channel_id': 2, 'messages': []}
+    store['channels'].append(channel)
+    indexes.update('channels', channel)
+    assert indexes.find('channels', 2) is channel
+
+    store['channels'].remove(channel)
+    indexes.remove('channels', channel)
+    assert indexes.find('channels', 2) is None
+
+# Test that replacing a collection rebuilds its index
+def test_reset():
+
+    store = make_store()
+    indexes = Indexes(store)
+    assert indexes.find('users', 1) is not None
+    assert indexes.find('channels', 1) is not None
+
+    store['users'] = []
+    indexes.reset('users')
+    assert list(indexes.tables) == ['channels']
+    assert indexes.find('users', 1) is None
+
+# Test that a user is found by any of their sessions, and that sessions which
+# were removed are no longer found
+def test_sessions():
+
+    store = make_store()
+    store['users'][0]['session_list'] = ['a', 'b']
+    store['users'][1]['session_list'] = ['c']
+    indexes = Indexes(store)
+    assert indexes.find('sessions', 'b') is store['users'][0]
+    assert indexes.find('sessions', 'c') is store['users'][1]
+
+    store['users'][0]['session_list'].remove('b')
+    indexes.update('users', store['users'][0])
+    assert indexes.find('sessions', 'a') is store['users'][0]
+    assert indexes.find('sessions', 'b') is None
+
+# Test that handles are made unique with the smallest number not given out
+# before, without trying the numbers given out again
+def test_unique_handle():
+
+    store = {'users': []}
+    indexes = Indexes(store)
+    for u_id in range(1, 5):
+        handle = indexes.unique_handle('johnsmith')
+        user = {'u_id': u_id, 'email': f'{u_id}@gmail.com', 'handle_str': handle}
+        store['users'].append(user)
+        indexes.update('users', user)
+
+    assert [user['handle_str'] for user in store['users']] == ['johnsmith', 'johnsmith0',
+                                                               'johnsmith1', 'johnsmith2']
+    assert indexes.handle_suffixes == {'johnsmith': 3}
+    assert indexes.find('handles', 'johnsmith1') is store['users'][2]
+    assert indexes.find('emails', '4@gmail.com') is store['users'][3]
+
+    # A handle which was taken by changing handles is skipped
+    store['users'][0]['handle_str'] = 'johnsmith3'
+    store['users'][1]['handle_str'] = 'johnsmith'
+    indexes.update('users', store['users'][0])
+    indexes.update('users', store['users'][1])
+    assert indexes.find('handles', 'johnsmith0') is None
+    assert indexes.unique_handle('johnsmith') == 'johnsmith4'
+
+# Test that channel and dm members and owners are found by u_id and handle,
+# and that membership changes are seen once the container is marked
+def test_memberships():
+
+    user = {'u_id': 1, 'email': 'a@gmail.com', 'handle_str': 'johnsmith',
+            'session_list': []}
+    channel = {'channel_id': 1, 'all_members': [1], 'owner_members': [1],
+               'messages': []}
+    dm = {'dm_id': 1, 'members': [1], 'creator': 1, 'messages': []}
+    store = {'users': [user], 'channels': [channel], 'dms': [dm]}
+    indexes = Indexes(store)
+
+    assert indexes.is_member('channels', channel, 1)
+    assert indexes.is_owner('channels', channel, 1)
+    assert not indexes.is_member('channels', channel, 2)
+    assert indexes.is_member_handle('dms', dm, 'johnsmith')
+    assert not indexes.is_member_handle('dms', dm, 'janesmith')
+
+    channel['all_members'].append(2)
+    channel['owner_members'].remove(1)
+    indexes.update('channels', channel)
+    assert indexes.is_member('channels', channel, 2)
+    assert not indexes.is_owner('channels', channel, 1)
+
+    dm['members'].remove(1)
+    dm['creator'] = None
+    indexes.update('dms', dm)
+    assert not indexes.is_member('dms', dm, 1)
+    assert not indexes.is_owner('dms', dm, 1)
+
+    # A channel which is no longer in the store is read as it is
+    store['channels'].remove(channel)
+    indexes.remove('channels', channel)
+    assert indexes.is_member('channels', channel, 2)
+
+# Test that each user's channels are kept in order of creation as they join
+# and leave
+def test_joined():
+
+    channels = [{'channel_id': channel_id, 'all_members': [1],
+                 'owner_members': [1], 'messages': []}
+                for channel_id in (1, 2, 3)]
+    store = {'users': [], 'channels': channels, 'dms': []}
+    indexes = Indexes(store)
+    assert indexes.joined('channels', 1) == channels
+    assert indexes.num_joined('dms', 1) == 0
+
+    channels[2]['all_members'].append(2)
+    channels[0]['all_members'].append(2)
+    indexes.update('channels', channels[2])
+    indexes.update('channels', channels[0])
+    assert indexes.joined('channels', 2) == [channels[0], channels[2]]
+
+    channels[0]['all_members'].remove(1)
+    channels[0]['owner_members'].remove(1)
+    indexes.update('channels', channels[0])
+    assert indexes.joined('channels', 1) == channels[1:]
+
+    removed = store['channels'].pop()
+    indexes.remove('channels', removed)
+    assert indexes.num_joined('channels', 2) == 1
+
+# Helper which makes a channel with messages 1 to count
+def make_channel(count):
+    return {'channel_id': 1, 'all_members': [], 'owner_members': [],
+            'messages': [{'message_id': message_id, 'channel_id': 1, 'time_created': 100}
+                         for message_id in range(1, count + 1)]}
+
+# Test that pages of messages skip removed messages, including those removed
+# after the positions were found and those sent since
+def test_message_positions():
+
+    channel = make_channel(10)
+    store = {'messages': list(channel['messages']), 'channels': [channel]}
+    indexes = Indexes(store)
+
+    positions = indexes.message_positions('channels', channel)
+    assert [message['message_id'] for message in positions.newest(0, 3)] == [10, 9, 8]
+
+    for message_id in (9, 3, 4):
+        message = indexes.find('messages', message_id)
+        message['time_created'] = 0
+        indexes.update('messages', message)
+
+    message = {'message_id': 11, 'channel_id': 1, 'time_created': 0}
+    channel['messages'].append(message)
+
+    positions = indexes.message_positions('channels', channel)
+    assert positions.count() == 7
+    pages = [[message['message_id'] for message in positions.newest(start, 3)]
+             for start in (0, 3, 6, 7)]
+    assert pages == [[10, 8, 7], [6, 5, 2], [1], []]
+
+    # Compacting the removed messages away replaces the list
+    channel['messages'] = [message for message in channel['messages']
+                           if message['time_created'] != 0]
+    positions = indexes.message_positions('channels', channel)
+    assert positions.removed == []
+    assert [message['message_id'] for message in positions.newest(1, 2)] == [8, 7]
+
+# Test that removed messages are found until they are compacted away
+def test_removed_messages():
+
+    message = {'message_id': 1, 'u_id': 1, 'channel_id': 1, 'time_created': 100,
+               'message': 'hello', 'reacts': [], 'is_pinned': False}
+    indexes = Indexes({'messages': [message]})
+    assert indexes.find('messages', 1) is message
+    assert indexes.find('removed', 1) is None
+
+    message['time_created'] = 0
+    indexes.update('messages', message)
+    assert indexes.find('removed', 1) is message
+
+    indexes.remove('messages', message)
+    assert indexes.find('removed', 1) is None
+    assert indexes.find('messages', 1) is None
+
+# Test that pages older than a message can still be read once it has been
+# compacted away
+def test_older_messages():
+
+    channel = make_channel(6)
+    indexes = Indexes({'messages': list(channel['messages']), 'channels': [channel]})
+
+    positions = indexes.message_positions('channels', channel)
+    assert [message['message_id'] for message in positions.older(4, 2)] == [3, 2]
+    assert positions.older(7, 2) is None
+
+    for message_id in (3, 4):
+        message = indexes.find('messages', message_id)
+        message['time_created'] = 0
+        indexes.update('messages', message)
+    positions = indexes.message_positions('channels', channel)
+    assert [message['message_id'] for message in positions.older(5, 2)] == [2, 1]
+
+    channel['messages'] = [message for message in channel['messages']
+                           if message['time_created'] != 0]
+    positions = indexes.message_positions('channels', channel)
+    assert positions.moved == {3: 2, 4: 2}
+    assert [message['message_id'] for message in positions.older(4, 5)] == [2, 1]
+
+    # Messages moved before follow the messages they were moved to
+    message = indexes.find('messages', 2)
+    message['time_created'] = 0
+    indexes.update('messages', message)
+    channel['messages'] = [message for message in channel['messages']
+                           if message['time_created'] != 0]
+    positions = indexes.message_positions('channels', channel)
+    assert positions.moved == {2: 1, 3: 1, 4: 1}
+    assert [message['message_id'] for message in positions.older(3, 5)] == [1]
+
+# Test that only the messages most recently compacted away can still be read
+# from before
+def test_moved_messages_kept(monkeypatch):
+
+    monkeypatch.setattr(config, 'moved_messages_kept', 2)
+    channel = make_channel(6)
+    indexes = Indexes({'messages': list(channel['messages']), 'channels': [channel]})
+    indexes.message_positions('channels', channel)
+
+    for message_ids in ((1, 2), (4,)):
+        for message_id in message_ids:
+            message = indexes.find('messages', message_id)
+            message['time_created'] = 0
+            indexes.update('messages', message)
+        channel['messages'] = [message for message in channel['messages']
+                               if message['time_created'] != 0]
+        positions = indexes.message_positions('channels', channel)
+
+    assert positions.moved == {2: None, 4: 3}
+    assert positions.older(1, 5) is None
+    assert [message['message_id'] for message in positions.older(4, 5)] == [3]
+
+# Test that counts follow users and dms as they are removed
+def test_counts():
+
+    users = [{'u_id': 1, 'permission_id': 1}, {'u_id': 2, 'permission_id': 2},
+             {'u_id': 3, 'permission_id': 0}]
+    dms = [{'dm_id': 1, 'name': 'a, b'}, {'dm_id': 2, 'name': ''}]
+    indexes = Indexes({'users': users, 'dms': dms})
+    assert indexes.count('users_exist') == 2
+    assert indexes.count('dms_exist') == 1
+
+    # Marking an entity again only moves its count
+    users[1]['permission_id'] = 0
+    indexes.update('users', users[1])
+    indexes.update('users', users[1])
+    assert indexes.count('users_exist') == 1
+
+    dms[0]['name'] = ''
+    indexes.update('dms', dms[0])
+    assert indexes.count('dms_exist') == 0
+    assert indexes.table('dms_exist') == {}
+
+# Test that the users in a channel or dm are counted as they join their first
+# and leave their last one
+def test_involved():
+
+    channel = {'channel_id': 1, 'all_members': [1, 2], 'owner_members': [1], 'messages': []}
+    dm = {'dm_id': 1, 'members': [2, 3], 'creator': 2, 'messages': []}
+    store = {'users': [], 'channels': [channel], 'dms': [dm]}
+    indexes = Indexes(store)
+    assert indexes.num_involved() == 3
+
+    channel['all_members'].remove(2)
+    indexes.update('channels', channel)
+    assert indexes.num_involved() == 3
+
+    dm['members'].remove(2)
+    dm['creator'] = None
+    indexes.update('dms', dm)
+    assert indexes.num_involved() == 2
+
+    # Replacing the channels counts the users again
+    store['channels'] = []
+    indexes.reset('channels')
+    assert indexes.num_involved() == 1
+
+    dm['members'].append(4)
+    indexes.update('dms', dm)
+    assert indexes.num_involved() == 2
+
+# Test that joining a channel and removing a user update the involved users
+# and the user count in place, rather than building them again
+def test_involved_updated_in_place():
+
+    users = [{'u_id': u_id, 'permission_id': 2} for u_id in range(1, 50001)]
+    channels = [{'channel_id': channel_id, 'all_members': list(range(channel_id, 50001, 100)),
+                 'owner_members': [], 'messages': []}
+                for channel_id in range(1, 51)]
+    indexes = Indexes({'users': users, 'channels': channels, 'dms': []})
+    assert indexes.num_involved() == 25000
+    assert indexes.count('users_exist') == 50000
+
+    involvement = indexes.tables['involved']
+    channels[0]['all_members'].append(100)
+    indexes.update('channels', channels[0])
+    users[0]['permission_id'] = 0
+    indexes.update('users', users[0])
+    assert indexes.tables['involved'] is involvement
+    assert indexes.num_involved() == 25001
+    assert indexes.count('users_exist') == 49999
+
+# Helper which gives the shortest time taken, over a few runs, to have a user
+# join and leave a channel of 10 members 100 times in a workspace of num_users
+# users, counting the involved users and users as users_stats does each time
+def time_join_and_leave(num_users):
+
+    users = [{'u_id': u_id, 'permission_id': 2} for u_id in range(1, num_users + 1)]
+    channels = [{'channel_id': channel_id,
+                 'all_members': list(range(channel_id * 10 - 9, channel_id * 10 + 1)),
+                 'owner_members': [], 'messages': []}
+                for channel_id in range(1, num_users // 20 + 1)]
+    indexes = Indexes({'users': users, 'channels': channels, 'dms': []})
+    indexes.num_involved()
+    indexes.count('users_exist')
+
+    channel = channels[0]
+    user = users[-1]
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(100):
+            channel['all_members'].append(user['u_id'])
+            indexes.update('channels', channel)
+            indexes.update('users', user)
+            assert indexes.num_involved() == num_users // 2 + 1
+            indexes.count('users_exist')
+
+            channel['all_members'].pop()
+            indexes.update('channels', channel)
+            assert indexes.num_involved() == num_users // 2
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+# Test that counting the involved users after a user joins or leaves a channel
+# takes about as long with 50000 users as with 500
+def test_involved_time_independent_of_users():
+
+    small = time_join_and_leave(500)
+    large = time_join_and_leave(50000)
+    assert large < small * 3
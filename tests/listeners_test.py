@@ -0,0 +1,19 @@
+from src.listeners import Listeners
+
+# Test that notifying a user only wakes the threads waiting for them
+def test_listeners_notify():
+
+    listeners = Listeners()
+    event1 = listeners.listen(1)
+    event2 = listeners.listen(2)
+
+    listeners.notify(1)
+    assert event1.is_set()
+    assert not event2.is_set()
+
+    # Threads which stopped waiting are not kept
+    listeners.stop(1, event1)
+    listeners.stop(2, event2)
+    assert listeners.events == {}
+    listeners.notify(2)
+    assert not event2.is_set()
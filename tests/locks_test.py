@@ -0,0 +1,86 @@
+import pytest
+import threading
+import time
+from src.locks import ReadWriteLock
+
+# Helper which runs target in a thread and waits until it has started
+def start(target):
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    time.sleep(0.05)
+    return thread
+
+# Test that many threads can read at once
+def test_concurrent_readers():
+
+    lock = ReadWriteLock()
+    reading = []
+    release = threading.Event()
+
+    def reader():
+        with lock.read():
+            reading.append(1)
+            release.wait()
+
+    threads = [start(reader) for _ in range(3)]
+    assert len(reading) == 3
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert lock.readers == 0
+
+# Test that a writer waits for the readers, and new readers wait for a writer
+# which is waiting
+def test_writer_excludes_readers():
+
+    lock = ReadWriteLock()
+    events = []
+    release = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            release.wait()
+            events.append('read')
+
+    def writer():
+        with lock.write():
+            events.append('write')
+
+    def second_reader():
+        with lock.read():
+            events.append('second read')
+
+    threads = [start(first_reader), start(writer), start(second_reader)]
+    assert events == []
+
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert events == ['read', 'write', 'second read']
+
+# Test that the writer can take the lock again, and read while writing
+def test_reentrant_writer():
+
+    lock = ReadWriteLock()
+    with lock.write():
+        with lock.write():
+            with lock.read():
+                assert lock.writes == 3
+    assert lock.writer is None
+
+    # Another thread can write once it has been released
+    thread = start(lambda: lock.acquire_write())
+    thread.join()
+    assert lock.writer == thread.ident
+
+# Test that a reader can read again, but cannot start writing
+def test_reader_cannot_write():
+
+    lock = ReadWriteLock()
+    with lock.read():
+        with lock.read():
+            assert lock.readers == 1
+        with pytest.raises(RuntimeError):
+            lock.acquire_write()
+    assert lock.readers == 0
@@ -0,0 +1,108 @@
+from src.migrations import STORE_VERSION, migrate
+from src.ring_buffer import RingBuffer
+from src.time_series import TimeSeries
+
+# Helper which gives a user and their stats in the shape saved before the
+# store was versioned
+def old_user(u_id, num_messages_sent):
+    return {'u_id': u_id, 'email': f'{u_id}@gmail.com',
+            'notifications': [{'channel_id': 1, 'dm_id': -1,
+                               'notification_message': str(number)} for number in range(3)],
+            'user_stats': {'channels_joined': [{'num_channels_joined': 0, 'time_stamp': 0},
+                                               {'num_channels_joined': 1, 'time_stamp': 10}],
+                           'dms_joined': [{'num_dms_joined': 0, 'time_stamp': 0}],
+                           'messages_sent': [{'num_messages_sent': 0, 'time_stamp': 0},
+                                             {'num_messages_sent': num_messages_sent,
+                                              'time_stamp': 20}],
+                           'involvement_rate': 0},
+            'workspace_stats': {'channels_exist': [{'num_channels_exist': 0, 'time_stamp': 0}],
+                                'dms_exist': [{'num_dms_exist': 0, 'time_stamp': 0}],
+                                'messages_exist': [{'num_messages_exist': 0, 'time_stamp': 0}],
+                                'utilization_rate': 0}}
+
+# Helper which builds a store in the shape saved before it was versioned
+def old_store():
+
+    member = {'u_id': 1, 'email': '1@gmail.com', 'name_first': 'A', 'name_last': 'B',
+              'handle_str': 'ab', 'profile_img_url': ''}
+    message = {'message_id': 1, 'u_id': 1, 'channel_id': 1, 'message': 'hello',
+               'time_created': 20, 'is_pinned': False,
+               'reacts': [{'react_id': 1, 'u_ids': [2, 1], 'is_this_user_reacted': False}]}
+    reclaimed = {'message_id': 2, 'u_id': 1, 'channel_id': 1, 'time_created': 0}
+
+    return {'users': [old_user(1, 2), old_user(2, 0)],
+            'channels': [{'channel_id': 1, 'name': 'chan', 'is_public': True,
+                          'owner_members': [member], 'all_members': [dict(member)],
+                          'messages': [message, reclaimed]}],
+            'messages': [message, reclaimed],
+            'dms': [{'dm_id': 1, 'name': '', 'creator': {}, 'members': [],
+                     'messages': []},
+                    {'dm_id': 2, 'name': 'ab, cd', 'creator': dict(member),
+                     'members': [dict(member), 2], 'messages': []}],
+            'standups': [],
+            'message_ids': 3,
+            'stats': {'channels_exist': [{'num_channels_exist': 1, 'time_stamp': 10}],
+                      'dms_exist': [{'num_dms_exist': 1, 'time_stamp': 10}],
+                      'messages_exist': [{'num_messages_exist': 1, 'time_stamp': 20}],
+                      'utilization_rate': 0}}
+
+# Test that members saved as copies of their details are stored by their u_id
+def test_migrate_members():
+
+    store = old_store()
+    assert migrate(store)
+
+    assert store['channels'][0]['owner_members'] == [1]
+    assert store['channels'][0]['all_members'] == [1]
+    assert store['dms'][0]['creator'] is None
+    assert store['dms'][1]['creator'] == 1
+    assert store['dms'][1]['members'] == [1, 2]
+
+# Test that reacts are stored per react_id and reclaimed messages are taken out
+def test_migrate_messages():
+
+    store = old_store()
+    migrate(store)
+
+    assert [message['message_id'] for message in store['messages']] == [1]
+    assert store['channels'][0]['messages'] == store['messages']
+    assert store['messages'][0]['reacts'] == {1: {2: True, 1: True}}
+    assert list(store['messages'][0]['reacts'][1]) == [2, 1]
+
+# Test that stats become time series with running message counts, and
+# notifications are kept in a ring buffer
+def test_migrate_stats_notifications():
+
+    store = old_store()
+    migrate(store)
+
+    user = store['users'][0]
+    assert isinstance(user['user_stats']['channels_joined'], TimeSeries)
+    assert user['user_stats']['channels_joined'].points() == [
+        {'num_channels_joined': 0, 'time_stamp': 0},
+        {'num_channels_joined': 1, 'time_stamp': 10}]
+    assert user['user_stats']['num_messages_sent'] == 2
+    assert store['users'][1]['user_stats']['num_messages_sent'] == 0
+    assert store['stats']['num_messages_exist'] == 1
+    assert user['workspace_stats']['num_messages_exist'] == 0
+
+    assert isinstance(user['notifications'], RingBuffer)
+    assert [notification['notification_message']
+            for notification in user['notifications'].newest(20)] == ['2', '1', '0']
+
+# Test that a store is only converted once
+def test_migrate_once():
+
+    store = old_store()
+    assert migrate(store)
+    assert store['version'] == STORE_VERSION
+
+    converted = old_store()
+    migrate(converted)
+    assert not migrate(store)
+    assert store == converted
+
+    empty = {'users': [], 'channels': [], 'messages': [], 'dms': [], 'standups': [],
+             'message_ids': 1, 'stats': ""}
+    assert migrate(empty)
+    assert empty['version'] == STORE_VERSION
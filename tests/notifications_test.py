@@ -1,10 +1,11 @@
 import pytest
 import requests
 from src import config
-from src.error import AccessError
+from src.error import AccessError, InputError
 import tests.test_helpers as th
 from datetime import datetime, timedelta
 import time
+import threading
 
 @pytest.fixture
 def clear_data():
@@ -963,3 +964,96 @@ def tests_notifications_order(clear_data):
            'notification_message': "brucewayne added you to CAMELS"
         }
     ] 
+
+# Test that only the notifications sent since the cursor of an earlier call are
+# returned, and that an invalid cursor raises an InputError
+def test_notifications_since(clear_data):
+
+    user1 = th.auth_register("brucewayne@gmail.com", "password", "bruce", "wayne")
+    user2 = th.auth_register("ironman@gmail.com", "1235678", "tony", "stark")
+
+    user1 = user1.json()
+    user2 = user2.json()
+
+    channel1 = th.channels_create(user1['token'], "CAMELS", True)
+    channel1 = channel1.json()
+    th.channel_invite(user1['token'], channel1['channel_id'], user2['auth_user_id'])
+
+    user2_notifications1 = th.notifications_get(user2['token']).json()
+    assert len(user2_notifications1['notifications']) == 1
+
+    # Nothing has been sent since
+    cursor = user2_notifications1['cursor']
+    user2_notifications2 = th.notifications_get(user2['token'], cursor).json()
+    assert user2_notifications2 == {'notifications': [], 'cursor': cursor}
+
+    th.message_send(user1['token'], channel1['channel_id'], "@tonystark")
+    user2_notifications3 = th.notifications_get(user2['token'], cursor).json()
+    assert user2_notifications3['notifications'] == [
+        {
+            'channel_id': channel1['channel_id'],
+            'dm_id': -1,
+            'notification_message': "brucewayne tagged you in CAMELS: @tonystark"
+        }
+    ]
+    assert user2_notifications3['cursor'] == cursor + 1
+
+    # Only 20 notifications are returned however many were sent since
+    for _ in range(25):
+        th.message_send(user1['token'], channel1['channel_id'], "@tonystark")
+    user2_notifications4 = th.notifications_get(user2['token'], cursor).json()
+    assert len(user2_notifications4['notifications']) == 20
+
+    response = th.notifications_get(user2['token'], cursor + 100)
+    assert response.status_code == InputError.code
+    response = th.notifications_get(user2['token'], -1)
+    assert response.status_code == InputError.code
+
+# Test that waiting for notifications returns once one is sent, or with none
+# once the timeout passes
+def test_notifications_wait(clear_data):
+
+    user1 = th.auth_register("brucewayne@gmail.com", "password", "bruce", "wayne")
+    user2 = th.auth_register("ironman@gmail.com", "1235678", "tony", "stark")
+
+    user1 = user1.json()
+    user2 = user2.json()
+
+    channel1 = th.channels_create(user1['token'], "CAMELS", True)
+    channel1 = channel1.json()
+    th.channel_invite(user1['token'], channel1['channel_id'], user2['auth_user_id'])
+    cursor = th.notifications_get(user2['token']).json()['cursor']
+
+    # Nothing is sent before the timeout
+    start = time.time()
+    user2_notifications1 = th.notifications_wait(user2['token'], cursor, 1).json()
+    assert user2_notifications1 == {'notifications': [], 'cursor': cursor}
+    assert time.time() - start >= 1
+
+    # User1 tags user2 while user2 is waiting
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(
+        th.notifications_wait(user2['token'], cursor, 10).json()))
+    start = time.time()
+    waiter.start()
+    time.sleep(0.5)
+    th.message_send(user1['token'], channel1['channel_id'], "@tonystark")
+    waiter.join()
+
+    assert time.time() - start < 5
+    assert results[0]['notifications'] == [
+        {
+            'channel_id': channel1['channel_id'],
+            'dm_id': -1,
+            'notification_message': "brucewayne tagged you in CAMELS: @tonystark"
+        }
+    ]
+
+    # Notifications already sent are returned at once
+    user2_notifications2 = th.notifications_wait(user2['token'], 0, 10).json()
+    assert len(user2_notifications2['notifications']) == 2
+
+    response = th.notifications_wait(user2['token'], cursor, -1)
+    assert response.status_code == InputError.code
+    response = th.notifications_wait(th.invalid_token4(), cursor, 1)
+    assert response.status_code == AccessError.code
@@ -0,0 +1,27 @@
+from src.ring_buffer import RingBuffer
+
+# Test that the newest items are kept, newest first, overwriting the oldest
+def test_ring_buffer_newest():
+
+    buffer = RingBuffer(3)
+    assert buffer.newest(10) == []
+
+    for item in 'abcde':
+        buffer.append(item)
+    assert buffer.total == 5
+    assert len(buffer) == 3
+    assert buffer.newest(10) == ['e', 'd', 'c']
+    assert buffer.newest(2) == ['e', 'd']
+
+# Test that only the items added since a number are returned
+def test_ring_buffer_since():
+
+    buffer = RingBuffer(3)
+    for item in 'abcd':
+        buffer.append(item)
+
+    assert buffer.newest(10, 4) == []
+    assert buffer.newest(10, 2) == ['d', 'c']
+
+    # Items overwritten since are skipped
+    assert buffer.newest(10, 0) == ['d', 'c', 'b']
@@ -0,0 +1,444 @@
+import os
+import pickle
+import pytest
+import sqlite3
+import time
+from src import storage
+from src.indexes import Indexes
+from src.storage import LogEngine, SqliteEngine, ShardEngine, Flusher, DELETED, \
+                        encode_records, encode_batch
+
+def empty_store():
+    return {'users': [], 'channels': [], 'messages': [], 'dms': [],
+            'standups': [], 'message_ids': 1, 'stats': ""}
+
+@pytest.fixture
+def engine(tmp_path):
+    return LogEngine(str(tmp_path / 'data_store.p'),
+                     str(tmp_path / 'data_store.log'))
+
+# Helper which sends a message into a channel and logs the change
+def send_message(engine, store, channel, text, u_id=1):
+    message = {'message_id': store['message_ids'], 'u_id': u_id,
+               'channel_id': channel['channel_id'], 'message': text, 'time_created': 1}
+    store['message_ids'] += 1
+    store['messages'].append(message)
+    channel['messages'].append(message)
+    engine.write(store, encode_records(store, {('messages', message['message_id']): message,
+                                               ('message_ids', None): None}))
+    return message
+
+# Test that replaying the log rebuilds the store, with channels sharing their
+# messages with store['messages']
+def test_log_replay(engine):
+
+    store = empty_store()
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    engine.write(store, encode_records(store, {('channels', 1): channel}))
+
+    message = send_message(engine, store, channel, 'hello')
+    message['message'] = 'edited'
+    engine.write(store, encode_records(store, {('messages', 1): message}))
+
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+
+    assert loaded == store
+    assert loaded['channels'][0]['messages'][0] is loaded['messages'][0]
+
+# Test that channels are logged without their messages, which are given back
+# to them from the message records
+def test_log_channel_without_messages(engine):
+
+    store = empty_store()
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    engine.write(store, encode_records(store, {('channels', 1): channel}))
+    send_message(engine, store, channel, 'hello')
+
+    channel['name'] = 'renamed'
+    records = encode_records(store, {('channels', 1): channel})
+    assert pickle.loads(records[0][2]) == {'channel_id': 1, 'name': 'renamed'}
+    engine.write(store, records)
+
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    assert loaded == store
+
+# Test that channels logged with the message_ids of their messages, before
+# they were logged without them, are still given their messages
+def test_log_message_ids(engine):
+
+    message = {'message_id': 1, 'channel_id': 1, 'message': 'hello'}
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': [1]}
+    engine.write(None, [('messages', 1, pickle.dumps(message)),
+                        ('channels', 1, pickle.dumps(channel))])
+
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    assert loaded['channels'] == [dict(channel, messages=[message])]
+    assert loaded['channels'][0]['messages'][0] is loaded['messages'][0]
+
+# Test that compaction merges the log into the snapshot and empties it
+def test_log_compaction(engine):
+
+    store = engine.load(empty_store())
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    engine.write(store, encode_records(store, {('channels', 1): channel}))
+
+    send_message(engine, store, channel, 'one')
+    send_message(engine, store, channel, 'two')
+    assert engine.logged == 3
+
+    engine.compact()
+    assert engine.logged == 0
+    engine.compactor.join()
+    assert not os.path.exists(engine.sealed_path)
+
+    send_message(engine, store, channel, 'three')
+    assert engine.logged == 1
+
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    assert loaded == store
+
+# Test that a compaction which stopped before removing the sealed log is
+# finished on the next startup
+def test_log_interrupted_compaction(engine):
+
+    store = engine.load(empty_store())
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    engine.write(store, encode_records(store, {('channels', 1): channel}))
+    send_message(engine, store, channel, 'one')
+
+    # Seal the log without merging it, as if the server stopped straight after
+    os.replace(engine.log_path, engine.sealed_path)
+    send_message(engine, store, channel, 'two')
+
+    recovered = LogEngine(engine.snapshot_path, engine.log_path)
+    loaded = recovered.load(empty_store())
+    assert loaded == store
+
+    recovered.compactor.join()
+    assert not os.path.exists(recovered.sealed_path)
+    assert LogEngine(engine.snapshot_path, engine.log_path).load(empty_store()) == store
+
+# Test that a batch which was only partially written is cut off the log, so
+# later batches can still be read
+def test_log_partial_batch(engine):
+
+    store = empty_store()
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    engine.write(store, encode_records(store, {('channels', 1): channel}))
+
+    with open(engine.log_path, 'ab') as log:
+        log.write(encode_batch([('users', 1, b'')])[:-1])
+
+    recovered = LogEngine(engine.snapshot_path, engine.log_path)
+    loaded = recovered.load(empty_store())
+    assert loaded['channels'] == [channel]
+
+    message = send_message(recovered, loaded, loaded['channels'][0], 'hello')
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    assert loaded['messages'] == [message]
+
+# Test that a batch which fails its checksum is not replayed
+def test_log_corrupt_batch(engine):
+
+    store = empty_store()
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    engine.write(store, encode_records(store, {('channels', 1): channel}))
+    send_message(engine, store, channel, 'hello')
+
+    # Flip the last byte of the log
+    with open(engine.log_path, 'r+b') as log:
+        log.seek(-1, os.SEEK_END)
+        last = log.read(1)
+        log.seek(-1, os.SEEK_END)
+        log.write(bytes([last[0] ^ 0xff]))
+
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    assert loaded['channels'] == [dict(channel, messages=[])]
+    assert loaded['messages'] == []
+
+# Test that the flusher writes many changes to the same entities as one batch
+def test_flusher_group_commit(engine):
+
+    flusher = Flusher(engine, interval=60, batch_size=1000)
+
+    store = empty_store()
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    flusher.add(encode_records(store, {('channels', 1): channel}))
+
+    for text in ['one', 'two', 'three']:
+        message = {'message_id': store['message_ids'], 'channel_id': 1, 'message': text}
+        store['message_ids'] += 1
+        store['messages'].append(message)
+        channel['messages'].append(message)
+        flusher.add(encode_records(store, {('messages', message['message_id']): message,
+                                           ('channels', 1): channel,
+                                           ('message_ids', None): None}))
+
+    # Nothing is written until the interval passes or flush is called
+    assert engine.logged == 0
+    assert len(flusher.pending) == 5
+
+    flusher.flush()
+    assert engine.logged == 1
+
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    assert loaded == store
+
+# Test that the flusher writes a batch once batch_size records are waiting
+def test_flusher_batch_size(engine):
+
+    flusher = Flusher(engine, interval=60, batch_size=2)
+
+    store = empty_store()
+    store['users'] = [{'u_id': 1}, {'u_id': 2}]
+    flusher.add(encode_records(store, {('users', 1): store['users'][0],
+                                       ('users', 2): store['users'][1]}))
+
+    for _ in range(100):
+        if engine.logged == 1:
+            break
+        time.sleep(0.01)
+    assert engine.logged == 1
+
+# Test that the sqlite engine only changes the rows in each batch, and rebuilds
+# the store with channels sharing their messages
+def test_sqlite_engine(tmp_path):
+
+    engine = SqliteEngine(str(tmp_path / 'data_store.db'))
+    store = engine.load(empty_store())
+    store['users'] = [{'u_id': 1, 'email': 'a@gmail.com'}, {'u_id': 2, 'email': 'b@gmail.com'}]
+    engine.write(store, encode_records(store, {('users', None): None}))
+
+    channel = {'channel_id': 1, 'name': 'chan', 'messages': []}
+    store['channels'].append(channel)
+    engine.write(store, encode_records(store, {('channels', 1): channel}))
+    first = send_message(engine, store, channel, 'one')
+    send_message(engine, store, channel, 'two')
+
+    # Removing a message deletes its row
+    store['messages'].remove(first)
+    channel['messages'].remove(first)
+    engine.write(store, encode_records(store, {('messages', first['message_id']): DELETED,
+                                               ('channels', 1): channel}))
+
+    store['users'][1]['email'] = 'c@gmail.com'
+    engine.write(store, encode_records(store, {('users', 2): store['users'][1]}))
+
+    assert engine.connection.execute('SELECT u_id FROM users WHERE email = ?',
+                                     ('c@gmail.com',)).fetchall() == [(2,)]
+
+    loaded = SqliteEngine(engine.path).load(empty_store())
+    assert loaded == store
+    assert loaded['channels'][0]['messages'][0] is loaded['messages'][0]
+
+# Test that the sqlite engine only reads the messages of a channel when they
+# are used, and leaves out rows written since it was loaded
+def test_sqlite_lazy_messages(tmp_path):
+
+    engine = SqliteEngine(str(tmp_path / 'data_store.db'))
+    store = engine.load(empty_store())
+    for channel_id in [1, 2]:
+        channel = {'channel_id': channel_id, 'messages': []}
+        store['channels'].append(channel)
+        engine.write(store, encode_records(store, {('channels', channel_id): channel}))
+        for text in ['one', 'two']:
+            send_message(engine, store, channel, text, channel_id)
+
+    engine = SqliteEngine(engine.path)
+    loaded = engine.load(empty_store())
+    hydrator = loaded['messages'].hydrator
+    indexes = Indexes(loaded)
+    assert len(loaded['messages']) == 4
+
+    channel = loaded['channels'][1]
+    send_message(engine, loaded, channel, 'three', 2)
+    assert [msg['message_id'] for msg in channel['messages']] == [3, 4, 5]
+    assert hydrator.read == {'channels_2'}
+
+    assert indexes.find('messages', 4)['message'] == 'two'
+    assert [msg['message_id'] for msg in indexes.sent(2)] == [3, 4, 5]
+    assert hydrator.read == {'channels_2'}
+    assert not loaded['messages'].loaded
+
+    assert [msg['message_id'] for msg in loaded['messages']] == [1, 2, 3, 4, 5]
+    assert loaded['channels'][1]['messages'][0] is loaded['messages'][2]
+
+# Test that a database written before the messages table had its u_id and
+# time_created columns gets them filled in
+def test_sqlite_add_columns(tmp_path):
+
+    path = str(tmp_path / 'data_store.db')
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute('CREATE TABLE messages (seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                           'message_id INTEGER UNIQUE NOT NULL, channel_id, dm_id, '
+                           'data BLOB NOT NULL)')
+        message = {'message_id': 1, 'u_id': 2, 'channel_id': 1, 'time_created': 0}
+        connection.execute('INSERT INTO messages (message_id, channel_id, data) '
+                           'VALUES (1, 1, ?)', (pickle.dumps(message),))
+    connection.close()
+
+    engine = SqliteEngine(path)
+    assert engine.connection.execute('SELECT u_id, time_created FROM messages '
+                                     'WHERE message_id = 1').fetchall() == [(2, 0)]
+
+# Test that the shard engine only rewrites the shards a batch touches
+def test_shard_engine(tmp_path, monkeypatch):
+
+    engine = ShardEngine(str(tmp_path / 'data_store.shards'))
+    store = engine.load(empty_store())
+    store['users'] = [{'u_id': 1}, {'u_id': 2}]
+    store['channels'] = [{'channel_id': 1, 'messages': []}, {'channel_id': 2, 'messages': []}]
+    store['dms'] = [{'dm_id': 1, 'messages': []}]
+    engine.write(store, encode_records(store, {(kind, None): None for kind in store}))
+    assert sorted(os.listdir(engine.directory)) == ['channel_1.p', 'channel_2.p', 'dm_1.p',
+                                                    'globals.p', 'users.p']
+
+    written = []
+    monkeypatch.setattr(storage, 'write_atomic', lambda path, value: written.append(path))
+
+    # Reacting to a message only rewrites the channel it was sent in
+    channel = store['channels'][1]
+    message = {'message_id': 1, 'channel_id': 2, 'reacts': []}
+    store['messages'].append(message)
+    channel['messages'].append(message)
+    engine.write(store, encode_records(store, {('messages', 1): message,
+                                               ('channels', 2): channel}))
+    message['reacts'].append(1)
+    written.clear()
+    engine.write(store, encode_records(store, {('messages', 1): message}))
+    assert written == [engine.shard_path('channel_2')]
+
+    monkeypatch.undo()
+    engine.write(store, encode_records(store, {('messages', 1): message,
+                                               ('channels', 2): channel}))
+    loaded = ShardEngine(engine.directory).load(empty_store())
+    assert loaded == store
+    assert loaded['channels'][1]['messages'][0] is loaded['messages'][0]
+
+# Helper which builds a store with two channels and a dm, compacts it into the
+# snapshot and returns it
+def compacted_store(engine):
+
+    store = engine.load(empty_store())
+    for channel_id in [1, 2]:
+        channel = {'channel_id': channel_id, 'messages': []}
+        store['channels'].append(channel)
+        engine.write(store, encode_records(store, {('channels', channel_id): channel}))
+        for text in ['one', 'two']:
+            message = send_message(engine, store, channel, text, channel_id)
+            message['channel_id'] = channel_id
+            engine.write(store, encode_records(store, {('messages', message['message_id']): message}))
+
+    dm = {'dm_id': 1, 'messages': []}
+    store['dms'].append(dm)
+    message = {'message_id': store['message_ids'], 'u_id': 1, 'dm_id': 1, 'message': 'hi',
+               'time_created': 1}
+    store['message_ids'] += 1
+    store['messages'].append(message)
+    dm['messages'].append(message)
+    engine.write(store, encode_records(store, {('messages', message['message_id']): message,
+                                               ('dms', 1): dm,
+                                               ('message_ids', None): None}))
+    engine.compact()
+    engine.compactor.join()
+    return store
+
+# Test that the snapshot only reads the messages of a channel when they are used
+def test_snapshot_lazy_messages(engine):
+
+    store = compacted_store(engine)
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    hydrator = loaded['messages'].hydrator
+    assert hydrator.read == set()
+
+    assert [msg['message'] for msg in loaded['channels'][1]['messages']] == ['one', 'two']
+    assert hydrator.read == {'channels_2'}
+    assert not loaded['messages'].loaded
+
+    assert loaded == store
+    assert loaded['channels'][1]['messages'][0] is loaded['messages'][2]
+    assert loaded['dms'][0]['messages'][0] is loaded['messages'][4]
+
+# Test that replaying the log only reads the messages the records change
+def test_snapshot_replay_reads_changed(engine):
+
+    store = compacted_store(engine)
+    channel = store['channels'][0]
+    channel['messages'][0]['message'] = 'edited'
+    engine.write(store, encode_records(store, {('messages', 1): channel['messages'][0]}))
+    send_message(engine, store, channel, 'three')
+
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    assert loaded['messages'].hydrator.read == {'channels_1'}
+    assert not loaded['messages'].loaded
+    assert len(loaded['messages']) == 6
+
+    assert loaded['channels'][0]['messages'] == channel['messages']
+    assert loaded == store
+    assert loaded['channels'][0]['messages'][-1] is loaded['messages'][-1]
+
+# Test that messages can be sent, found and removed without reading every
+# message in the snapshot
+def test_snapshot_append_without_reading(engine):
+
+    compacted_store(engine)
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    hydrator = loaded['messages'].hydrator
+    indexes = Indexes(loaded)
+
+    channel = loaded['channels'][1]
+    message = {'message_id': 6, 'u_id': 2, 'channel_id': 2, 'message': 'three',
+               'time_created': 1}
+    loaded['messages'].append(message)
+    channel['messages'].append(message)
+    assert len(loaded['messages']) == 6
+    assert indexes.find('messages', 6) is message
+    assert indexes.find('removed', 6) is None
+
+    assert indexes.find('messages', 3)['message'] == 'one'
+    assert hydrator.read == {'channels_2'}
+
+    storage.discard_messages(loaded['messages'], {1, 6})
+    assert len(loaded['messages']) == 4
+    assert hydrator.read == {'channels_2'}
+
+    assert [msg['message_id'] for msg in loaded['messages']] == [2, 3, 4, 5]
+    assert [msg['message_id'] for msg in channel['messages']] == [3, 4, 6]
+
+# Test that the messages a user sent are found by only reading the blobs they
+# are saved in
+def test_snapshot_sent_by(engine):
+
+    compacted_store(engine)
+    loaded = LogEngine(engine.snapshot_path, engine.log_path).load(empty_store())
+    hydrator = loaded['messages'].hydrator
+    indexes = Indexes(loaded)
+
+    message = {'message_id': 6, 'u_id': 2, 'channel_id': 2, 'message': 'three',
+               'time_created': 1}
+    loaded['messages'].append(message)
+    loaded['channels'][1]['messages'].append(message)
+
+    assert [msg['message_id'] for msg in indexes.sent(2)] == [3, 4, 6]
+    assert hydrator.read == {'channels_2'}
+    assert indexes.sent(3) == []
+    assert [msg['message_id'] for msg in indexes.sent(1)] == [1, 2, 5]
+    assert not loaded['messages'].loaded
+
+# Test that a snapshot written before the format was versioned is still read
+def test_snapshot_unversioned(engine):
+
+    store = empty_store()
+    store['users'] = [{'u_id': 1}]
+    with open(engine.snapshot_path, 'wb') as snapshot:
+        pickle.dump(store, snapshot)
+
+    assert LogEngine(engine.snapshot_path, engine.log_path).load(empty_store()) == store
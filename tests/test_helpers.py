@@ -137,11 +137,12 @@ def request_user_stats(token):
     return requests.get(config.url + "user/stats/v1",
                         params={'token': token})
 
-# Sends request for users/stats/v1 and returns response
-def request_users_stats(token):
+# Sends request for users/stats/v1, with any of time_start, time_end and
+# resolution, and returns response
+def request_users_stats(token, **query):
 
     return requests.get(config.url + "users/stats/v1",
-                        params={'token': token})
+                        params={'token': token, **query})
 
 def request_channel_join(token, channel_id):
 
@@ -505,9 +506,13 @@ def admin_change(token, u_id, permission_id):
 def clear():
     return requests.delete(config.url + "clear/v1")
 
-def notifications_get(token):
+def notifications_get(token, since=0):
     return requests.get(config.url + "notifications/get/v1",
-                        params={'token': token})
+                        params={'token': token, 'since': since})
+
+def notifications_wait(token, since, timeout):
+    return requests.get(config.url + "notifications/wait/v1",
+                        params={'token': token, 'since': since, 'timeout': timeout})
 
 def search(token, query_str):
     return requests.get(config.url + "search/v1",
@@ -0,0 +1,51 @@
+import pytest
+from src.error import InputError
+from src.time_series import TimeSeries, RESOLUTIONS
+
+# Test that the newest points are kept as they are, and older ones are rolled
+# up into per-minute buckets holding their last value
+def test_time_series_rollup():
+
+    series = TimeSeries('num_messages_sent', 3)
+    for value, time_stamp in enumerate((0, 10, 50, 70, 130, 131)):
+        series.add(value, time_stamp)
+
+    assert series.buckets['minute'] == [(50, 2)]
+    assert series.points() == [{'num_messages_sent': 2, 'time_stamp': 50},
+                               {'num_messages_sent': 3, 'time_stamp': 70},
+                               {'num_messages_sent': 4, 'time_stamp': 130},
+                               {'num_messages_sent': 5, 'time_stamp': 131}]
+
+# Test that points can be read from a range of time and merged into buckets
+def test_time_series_query():
+
+    series = TimeSeries('num_channels_joined', 100)
+    for value, time_stamp in enumerate((0, 30, 3600, 3700, 7300)):
+        series.add(value, time_stamp)
+
+    assert [point['time_stamp'] for point in series.points(30, 3700)] == [30, 3600, 3700]
+    assert series.points(resolution='hour') == [{'num_channels_joined': 1, 'time_stamp': 30},
+                                                {'num_channels_joined': 3, 'time_stamp': 3700},
+                                                {'num_channels_joined': 4, 'time_stamp': 7300}]
+
+    with pytest.raises(InputError):
+        series.points(resolution='week')
+    with pytest.raises(InputError):
+        series.points(100, 0)
+
+# Test that a statistic recorded every minute for a long time keeps a bounded
+# number of points
+def test_time_series_bounded():
+
+    series = TimeSeries('num_messages_exist', 10)
+    for time_stamp in range(0, 40 * 86400, 60):
+        series.add(time_stamp, time_stamp)
+
+    limit = 10 + sum(limit for _, limit in RESOLUTIONS.values())
+    assert len(series) <= limit
+
+    # Points are still oldest first, ending with the newest value
+    time_stamps = [point['time_stamp'] for point in series.points()]
+    assert time_stamps == sorted(time_stamps)
+    assert series.points()[-1]['num_messages_exist'] == time_stamps[-1]
+    assert len(series.buckets['day']) > 0
@@ -0,0 +1,32 @@
+from src.token_cache import TokenCache
+
+# Test that cached tokens are hits and are dropped least recently used first
+def test_token_cache_lru():
+
+    cache = TokenCache(2)
+    assert cache.get('a') is None
+
+    cache.add('a', {'session_id': 1})
+    cache.add('b', {'session_id': 2})
+    assert cache.get('a') == {'session_id': 1}
+
+    # 'b' is now the least recently used
+    cache.add('c', {'session_id': 3})
+    assert cache.get('b') is None
+    assert cache.get('c') == {'session_id': 3}
+    assert cache.sessions == {1: {'a'}, 3: {'c'}}
+
+    assert cache.stats() == {'hits': 2, 'misses': 2, 'size': 2}
+
+# Test that ending a session drops every cached token of it
+def test_token_cache_invalidate():
+
+    cache = TokenCache(10)
+    cache.add('a', {'session_id': 1})
+    cache.add('b', {'session_id': 1})
+    cache.add('c', {'session_id': 2})
+
+    cache.invalidate(1)
+    assert cache.get('a') is None
+    assert cache.get('b') is None
+    assert cache.get('c') == {'session_id': 2}
@@ -1,7 +1,7 @@
 import pytest
 import requests
 from src import config
-from src.error import AccessError
+from src.error import AccessError, InputError
 from datetime import datetime, timedelta
 import time
 import datetime
@@ -572,4 +572,34 @@ def test_users_stats_standup(clear_data):
     # Check that messages_exist is correct and that time_stamp is within a second of
     # the request being sent
     assert users_stats['workspace_stats']['messages_exist'][1]['num_messages_exist'] == 1
-    assert users_stats['workspace_stats']['messages_exist'][1]['time_stamp'] - curr_time < 2
\ No newline at end of file
+    assert users_stats['workspace_stats']['messages_exist'][1]['time_stamp'] - curr_time < 2
+
+
+# Test that stats can be read from a range of time and merged into buckets,
+# and that an invalid resolution or range raises an InputError
+def test_users_stats_time_range(clear_data):
+
+    user1 = request_register("hello@gmail.com", "password", "Harry", "Potter")
+    user1 = user1.json()
+    channel = request_channels_create(user1['token'], "Tomb", True)
+    channel = channel.json()
+    request_message_send(user1['token'], channel['channel_id'], "Hello")
+    request_message_send(user1['token'], channel['channel_id'], "World")
+
+    users_stats = request_users_stats(user1['token']).json()
+    messages_exist = users_stats['workspace_stats']['messages_exist']
+    assert [point['num_messages_exist'] for point in messages_exist] == [0, 1, 2]
+
+    # Every point was recorded within the same day
+    users_stats = request_users_stats(user1['token'], resolution='day').json()
+    assert users_stats['workspace_stats']['messages_exist'][-1]['num_messages_exist'] == 2
+    assert len(users_stats['workspace_stats']['messages_exist']) <= 2
+
+    time_stamp = messages_exist[-1]['time_stamp']
+    users_stats = request_users_stats(user1['token'], time_start=time_stamp + 1).json()
+    assert users_stats['workspace_stats']['channels_exist'] == []
+
+    response = request_users_stats(user1['token'], resolution='week')
+    assert response.status_code == InputError.code
+    response = request_users_stats(user1['token'], time_start=10, time_end=0)
+    assert response.status_code == InputError.code